@@ -1,38 +1,577 @@
-import ipaddress
+import gzip
+import hashlib
+import html
+import json
+from collections import OrderedDict, deque
+from collections.abc import Iterable, Sequence
+from dataclasses import dataclass, field
 from datetime import datetime, timezone
 
+from app.prefixes import PackedPrefixes
+from app.ranges import IntervalIndex, aggregate, format_prefix, parse_address, parse_prefix
+from app.tagindex import AttributeIndex, TagIndex
+
+try:
+    import brotli
+except ImportError:  # optional dependency
+    brotli = None
+
+# Below this size compression saves less than the header overhead
+MIN_COMPRESS_BYTES = 512
+
+
+# The parts of a ServiceTags entry's properties that FeedCache.load reads
+ENTRY_PROPERTIES = (
+    "addressPrefixes", "region", "regionId", "platform", "systemService", "networkFeatures",
+)
+
+
+def compact_entry(entry: dict) -> dict:
+    properties = entry.get("properties") or {}
+    return {
+        "name": entry["name"],
+        "properties": {key: properties[key] for key in ENTRY_PROPERTIES if key in properties},
+    }
+
+
+@dataclass(frozen=True, slots=True)
+class FeedBody:
+    # memoryview when mapped from another worker's rendered feeds file
+    body: bytes | memoryview
+    etag: str
+    entries: int = 0
+    encodings: dict[str, bytes | memoryview] = field(default_factory=dict)
+    # Byte offsets of shard boundaries in body, from 0 to len(body); empty if unsharded
+    shards: tuple[int, ...] = ()
+
+    @classmethod
+    def build(
+        cls, body: bytes, change_number: int, entries: int = 0, shards: tuple[int, ...] = ()
+    ) -> "FeedBody":
+        digest = hashlib.blake2b(body, digest_size=8).hexdigest()
+        return cls(
+            body=body,
+            etag=f'"{change_number}-{digest}"',
+            entries=entries,
+            encodings=_compress(body),
+            shards=shards,
+        )
+
+    @classmethod
+    def from_prefixes(
+        cls, prefixes: Sequence[str], change_number: int, shard_size: int = 0
+    ) -> "FeedBody":
+        shards = _shard_offsets(prefixes, shard_size) if shard_size > 0 else ()
+        return cls.build(_render(prefixes), change_number, entries=len(prefixes), shards=shards)
+
+    @property
+    def size(self) -> int:
+        # Bytes held: the body plus every precomputed encoding
+        return len(self.body) + sum(len(encoded) for encoded in self.encodings.values())
+
+    def encoded_etag(self, coding: str) -> str:
+        # Each content-coding is a distinct representation and needs its own strong ETag
+        return f'{self.etag[:-1]}-{coding}"'
+
+    @property
+    def shard_count(self) -> int:
+        return max(len(self.shards) - 1, 0)
+
+    def shard(self, number: int) -> bytes | memoryview | None:
+        """The 1-based shard's lines, sliced from the pre-rendered body."""
+        if not 1 <= number <= self.shard_count:
+            return None
+        return self.body[self.shards[number - 1]:self.shards[number]]
+
+    def shard_etag(self, number: int) -> str:
+        return f'{self.etag[:-1]}-part{number}"'
+
+
+@dataclass(frozen=True, slots=True)
+class TagFeed:
+    # Hash of the source prefix list, to spot unchanged tags without parsing them
+    digest: bytes
+    prefixes: PackedPrefixes
+    ipv4: FeedBody
+    all: FeedBody
+    aggregated_ipv4: FeedBody
+    aggregated_all: FeedBody
+
+    @classmethod
+    def build(cls, prefixes: Sequence[str], change_number: int, shard_size: int = 0) -> "TagFeed":
+        packed = PackedPrefixes.from_strings(prefixes)
+        texts = packed.texts()
+        aggregated = aggregate(packed.networks())
+        return cls(
+            digest=_digest(prefixes),
+            prefixes=packed,
+            ipv4=FeedBody.from_prefixes(texts[:packed.ipv4_count], change_number, shard_size),
+            all=FeedBody.from_prefixes(texts, change_number, shard_size),
+            aggregated_ipv4=FeedBody.from_prefixes(
+                [p for p in aggregated if ":" not in p], change_number, shard_size
+            ),
+            aggregated_all=FeedBody.from_prefixes(aggregated, change_number, shard_size),
+        )
+
+    def body(self, include_ipv6: bool = False, aggregated: bool = False) -> FeedBody:
+        if aggregated:
+            return self.aggregated_all if include_ipv6 else self.aggregated_ipv4
+        return self.all if include_ipv6 else self.ipv4
+
+
+@dataclass(frozen=True, slots=True)
+class TagMetadata:
+    region: str = ""
+    region_id: int = 0
+    platform: str = ""
+    system_service: str = ""
+    network_features: tuple[str, ...] = ()
+
+    @classmethod
+    def from_properties(cls, properties: dict) -> "TagMetadata":
+        return cls(
+            region=properties.get("region") or "",
+            region_id=properties.get("regionId") or 0,
+            platform=properties.get("platform") or "",
+            system_service=properties.get("systemService") or "",
+            network_features=tuple(properties.get("networkFeatures") or ()),
+        )
+
+    def attributes(self) -> Iterable[tuple[str, str]]:
+        """The (attribute, value) pairs a tag is indexed under; empty values are skipped."""
+        for attribute in ("region", "platform", "system_service"):
+            value = getattr(self, attribute)
+            if value:
+                yield attribute, value
+        for feature in self.network_features:
+            yield "network_feature", feature
+
+
+@dataclass(frozen=True, slots=True)
+class TagDiff:
+    added: tuple[str, ...]
+    removed: tuple[str, ...]
+
+
+@dataclass(frozen=True, slots=True)
+class HistoryEntry:
+    change_number: int
+    loaded_at: datetime
+    # Packed prefixes are shared with the previous entry when a tag is unchanged
+    tags: dict[str, PackedPrefixes]
+    # Changes relative to the previous entry, only for tags that changed
+    diffs: dict[str, TagDiff]
+
+
+@dataclass(frozen=True, slots=True)
+class Snapshot:
+    change_number: int
+    tags: dict[str, TagFeed]
+    lookup: IntervalIndex
+    index: TagIndex
+    metadata: dict[str, TagMetadata]
+    attributes: AttributeIndex
+    tags_json: FeedBody
+    tags_detail_json: FeedBody
+    index_html: FeedBody
+    # The tags the snapshot was built against, and the per-tag changes from them
+    base: dict[str, TagFeed]
+    diffs: dict[str, TagDiff]
+    # Entries per shard the bodies were cut at
+    shard_size: int = 0
+
+
+@dataclass(frozen=True, slots=True)
+class RenderedFeeds:
+    """Everything a snapshot serves, as saved by the worker that built it.
+
+    Loaded from a mapped file by app.snapshot; FeedCache.attach() turns it into
+    a Snapshot without parsing or rendering anything.
+    """
+    change_number: int
+    shard_size: int
+    tags: dict[str, TagFeed]
+    metadata: dict[str, TagMetadata]
+    lookup: IntervalIndex
+    tags_json: FeedBody
+    tags_detail_json: FeedBody
+    index_html: FeedBody
+
+
+# (changeNumber, included tags, excluded tags, include_ipv6)
+CompositeKey = tuple[int | None, tuple[str, ...], tuple[str, ...], bool]
+
 
 class FeedCache:
-    def __init__(self):
-        self._tags: dict[str, list[str]] = {}
+    def __init__(
+        self,
+        composite_cache_size: int = 256,
+        history_size: int = 8,
+        shard_size: int = 0,
+        composite_cache_bytes: int = 64 * 1024 * 1024,
+    ):
+        self._tags: dict[str, TagFeed] = {}
+        self._history: deque[HistoryEntry] = deque(maxlen=history_size)
+        self._lookup = IntervalIndex(())
+        self._index = TagIndex(())
+        self._metadata: dict[str, TagMetadata] = {}
+        self._attributes = AttributeIndex(())
+        self._composites: OrderedDict[CompositeKey, FeedBody] = OrderedDict()
+        self._composite_cache_size = composite_cache_size
+        # Bodies plus encodings of the cached composites; a union of the large
+        # tags is ~300 KB, so the entry count alone does not bound memory
+        self._composite_cache_bytes = composite_cache_bytes
+        self._composite_bytes = 0
+        # Entries per /feeds/{tag}/part/{n} shard; 0 disables sharding
+        self._shard_size = shard_size
+        self.tags_json: FeedBody | None = None
+        self.tags_detail_json: FeedBody | None = None
+        self.index_html = FeedBody.build(_render_index(()), 0)
         self.change_number: int | None = None
         self.last_refresh: datetime | None = None
 
-    def load(self, data: dict) -> None:
-        new_tags: dict[str, list[str]] = {}
+    @property
+    def shard_size(self) -> int:
+        return self._shard_size
+
+    def build(self, data: dict) -> "Snapshot":
+        """Render everything a request needs for a new snapshot, without installing it.
+
+        Pure with respect to the served state, so it can run in a worker thread
+        while the event loop keeps answering requests from the current snapshot.
+        """
+        change_number = data["changeNumber"]
+        previous = self._tags
+        new_tags: dict[str, TagFeed] = {}
+        metadata: dict[str, TagMetadata] = {}
         for entry in data.get("values", []):
             name = entry["name"]
-            prefixes = entry.get("properties", {}).get("addressPrefixes", [])
-            new_tags[name] = prefixes
+            properties = entry.get("properties", {})
+            metadata[name] = TagMetadata.from_properties(properties)
+            prefixes = properties.get("addressPrefixes", [])
+            old = previous.get(name)
+            if old is not None and old.digest == _digest(prefixes):
+                # Unchanged tags are shared with the previous snapshot, not rebuilt
+                new_tags[name] = old
+            else:
+                new_tags[name] = TagFeed.build(prefixes, change_number, self._shard_size)
+        index = TagIndex(new_tags)
+        return Snapshot(
+            change_number=change_number,
+            tags=new_tags,
+            lookup=IntervalIndex(
+                (name, network)
+                for name, feed in new_tags.items()
+                for network in feed.prefixes.networks()
+            ),
+            index=index,
+            metadata=metadata,
+            attributes=AttributeIndex(
+                (name, attribute, value)
+                for name, meta in metadata.items()
+                for attribute, value in meta.attributes()
+            ),
+            tags_json=FeedBody.build(
+                json.dumps(index.names, separators=(",", ":")).encode(),
+                change_number,
+                entries=len(index),
+            ),
+            tags_detail_json=FeedBody.build(
+                json.dumps(
+                    [_tag_detail(name, new_tags[name], metadata[name]) for name in index.names],
+                    separators=(",", ":"),
+                ).encode(),
+                change_number,
+                entries=len(index),
+            ),
+            index_html=FeedBody.build(_render_index(index.names), change_number, len(index)),
+            base=previous,
+            # Nothing to compare on a first load; install() keeps no diffs for it
+            diffs=_diffs(previous, new_tags) if previous else {},
+            shard_size=self._shard_size,
+        )
+
+    def attach(self, rendered: RenderedFeeds) -> "Snapshot":
+        """A snapshot serving feeds rendered elsewhere; only the small name and
+        attribute indexes are built here."""
+        if rendered.shard_size != self._shard_size:
+            raise ValueError(
+                f"Feeds were cut into shards of {rendered.shard_size}, not {self._shard_size}"
+            )
+        previous = self._tags
+        return Snapshot(
+            change_number=rendered.change_number,
+            tags=rendered.tags,
+            lookup=rendered.lookup,
+            index=TagIndex(rendered.tags),
+            metadata=rendered.metadata,
+            attributes=AttributeIndex(
+                (name, attribute, value)
+                for name, meta in rendered.metadata.items()
+                for attribute, value in meta.attributes()
+            ),
+            tags_json=rendered.tags_json,
+            tags_detail_json=rendered.tags_detail_json,
+            index_html=rendered.index_html,
+            base=previous,
+            diffs=_diffs(previous, rendered.tags) if previous else {},
+            shard_size=rendered.shard_size,
+        )
+
+    def install(self, snapshot: "Snapshot", refreshed_at: datetime | None = None) -> None:
+        previous = self._tags
+        diffs = snapshot.diffs
+        if snapshot.base is not previous:
+            # Another snapshot was installed while this one was being built
+            diffs = _diffs(previous, snapshot.tags)
         # Atomic swap — prevents torn reads during concurrent access
-        self._tags = new_tags
-        self.change_number = data["changeNumber"]
-        self.last_refresh = datetime.now(timezone.utc)
+        self._tags = snapshot.tags
+        self._lookup = snapshot.lookup
+        self._index = snapshot.index
+        self._metadata = snapshot.metadata
+        self._attributes = snapshot.attributes
+        self.tags_json = snapshot.tags_json
+        self.tags_detail_json = snapshot.tags_detail_json
+        self.index_html = snapshot.index_html
+        self.change_number = snapshot.change_number
+        self.last_refresh = refreshed_at or datetime.now(timezone.utc)
+        if not self._history or self._history[-1].change_number != snapshot.change_number:
+            self._history.append(HistoryEntry(
+                change_number=snapshot.change_number,
+                loaded_at=self.last_refresh,
+                tags={name: feed.prefixes for name, feed in snapshot.tags.items()},
+                diffs=diffs if previous else {},
+            ))
+
+    def load(self, data: dict, refreshed_at: datetime | None = None) -> None:
+        # Everything a request needs is rendered here, once per snapshot,
+        # so the request path is a dict lookup.
+        self.install(self.build(data), refreshed_at)
+
+    def history(self) -> list[int]:
+        return [entry.change_number for entry in self._history]
+
+    def history_span(
+        self, from_change: int | None = None, to_change: int | None = None
+    ) -> tuple[int, int] | None:
+        """Resolve a from/to pair against retained history, defaulting to the latest step."""
+        numbers = self.history()
+        if not numbers:
+            return None
+        if to_change is None:
+            to_change = numbers[-1]
+        if to_change not in numbers:
+            return None
+        if from_change is None:
+            from_change = numbers[max(numbers.index(to_change) - 1, 0)]
+        if from_change not in numbers or numbers.index(from_change) > numbers.index(to_change):
+            return None
+        return from_change, to_change
+
+    def get_diff(self, name: str, from_change: int, to_change: int) -> TagDiff | None:
+        """Net prefix changes for a tag between two retained changeNumbers.
+
+        Composes the per-load diffs. Returns None if either changeNumber is not
+        retained or the tag exists in neither snapshot.
+        """
+        numbers = self.history()
+        if from_change not in numbers or to_change not in numbers:
+            return None
+        from_index, to_index = numbers.index(from_change), numbers.index(to_change)
+        entries = list(self._history)
+        if name not in entries[from_index].tags and name not in entries[to_index].tags:
+            return None
+        added: set[str] = set()
+        removed: set[str] = set()
+        for entry in entries[from_index + 1:to_index + 1]:
+            step = entry.diffs.get(name)
+            if step is None:
+                continue
+            for prefix in step.removed:
+                if prefix in added:
+                    added.discard(prefix)
+                else:
+                    removed.add(prefix)
+            for prefix in step.added:
+                if prefix in removed:
+                    removed.discard(prefix)
+                else:
+                    added.add(prefix)
+        return TagDiff(added=_sorted_prefixes(added), removed=_sorted_prefixes(removed))
 
     def get_all_tags(self) -> list[str]:
-        return sorted(self._tags.keys())
+        return list(self._index.names)
+
+    def search_tags(self, query: str, substring: bool = False) -> list[str]:
+        """Sorted tag names starting with (or containing) query, case-insensitively."""
+        if substring:
+            return self._index.contains(query)
+        return self._index.prefix(query)
 
     def get_tag(self, name: str, include_ipv6: bool = False) -> list[str] | None:
-        prefixes = self._tags.get(name)
-        if prefixes is None:
+        feed = self._tags.get(name)
+        if feed is None:
+            return None
+        # Rendered on demand; only the feed bodies are kept as text
+        return feed.prefixes.texts(include_ipv6)
+
+    def get_metadata(self, name: str) -> TagMetadata | None:
+        return self._metadata.get(name)
+
+    def get_details(self, names: Iterable[str]) -> list[dict]:
+        """Metadata, entry and shard counts for each named tag, as listed by /tags?detail=true."""
+        tags, metadata = self._tags, self._metadata
+        return [_tag_detail(name, tags[name], metadata[name]) for name in names if name in tags]
+
+    def select_tags(self, **filters: str | None) -> list[str]:
+        """Sorted names of the tags matching every given attribute (region, platform,
+        system_service, network_feature), answered from the snapshot's inverted index."""
+        return self._attributes.select(
+            {attribute: value for attribute, value in filters.items() if value is not None}
+        )
+
+    def attribute_values(self, attribute: str) -> list[str]:
+        return self._attributes.values(attribute)
+
+    def get_feed(
+        self, name: str, include_ipv6: bool = False, aggregated: bool = False
+    ) -> FeedBody | None:
+        feed = self._tags.get(name)
+        if feed is None:
+            return None
+        return feed.body(include_ipv6, aggregated)
+
+    def get_body(self, name: str, include_ipv6: bool = False) -> bytes | memoryview | None:
+        feed = self.get_feed(name, include_ipv6)
+        return None if feed is None else feed.body
+
+    def get_composite(
+        self, include: Iterable[str], exclude: Iterable[str] = (), include_ipv6: bool = False
+    ) -> FeedBody | None:
+        """Union of the included tags minus the excluded ones, as a minimal CIDR feed.
+
+        Returns None if any tag is unknown. Results are kept in an LRU bounded by
+        both entry count and total bytes; a result over the byte budget on its own
+        is returned but not kept.
+        """
+        key = (
+            self.change_number,
+            tuple(sorted(set(include))),
+            tuple(sorted(set(exclude))),
+            include_ipv6,
+        )
+        cached = self._composites.get(key)
+        if cached is not None:
+            self._composites.move_to_end(key)
+            return cached
+        tags = self._tags
+        if any(name not in tags for name in key[1] + key[2]):
             return None
-        if include_ipv6:
-            return prefixes
-        return [p for p in prefixes if _is_ipv4(p)]
+        prefixes = aggregate(
+            (net for name in key[1] for net in tags[name].prefixes.networks(include_ipv6)),
+            (net for name in key[2] for net in tags[name].prefixes.networks()),
+        )
+        result = FeedBody.from_prefixes(prefixes, key[0] or 0)
+        self._composites[key] = result
+        self._composite_bytes += result.size
+        while self._composites and (
+            len(self._composites) > self._composite_cache_size
+            or self._composite_bytes > self._composite_cache_bytes
+        ):
+            self._composite_bytes -= self._composites.popitem(last=False)[1].size
+        return result
+
+    def lookup(self, address: str) -> list[str] | None:
+        parsed = parse_address(address)
+        if parsed is None:
+            return None
+        return list(self._lookup.lookup(*parsed))
+
+
+def _tag_detail(name: str, feed: TagFeed, meta: TagMetadata) -> dict:
+    return {
+        "name": name,
+        "region": meta.region,
+        "region_id": meta.region_id,
+        "platform": meta.platform,
+        "system_service": meta.system_service,
+        "network_features": list(meta.network_features),
+        "entries": feed.ipv4.entries,
+        "entries_all": feed.all.entries,
+        "shards": feed.ipv4.shard_count,
+        "shards_all": feed.all.shard_count,
+    }
+
+
+_EMPTY = PackedPrefixes()
+
+
+def _diffs(previous: dict[str, TagFeed], current: dict[str, TagFeed]) -> dict[str, TagDiff]:
+    diffs = {}
+    for name, feed in current.items():
+        old = previous.get(name)
+        if old is None:
+            diffs[name] = _diff(_EMPTY, feed.prefixes)
+        elif old is not feed and old.digest != feed.digest:
+            diffs[name] = _diff(old.prefixes, feed.prefixes)
+    for name in previous.keys() - current.keys():
+        diffs[name] = _diff(previous[name].prefixes, _EMPTY)
+    return diffs
+
+
+def _diff(old: PackedPrefixes, new: PackedPrefixes) -> TagDiff:
+    old_set, new_set = set(old.cidrs()), set(new.cidrs())
+    return TagDiff(
+        added=tuple(format_prefix(*c) for c in new.cidrs() if c not in old_set),
+        removed=tuple(format_prefix(*c) for c in old.cidrs() if c not in new_set),
+    )
+
+
+def _digest(prefixes: Sequence[str]) -> bytes:
+    return hashlib.blake2b("\n".join(prefixes).encode(), digest_size=16).digest()
+
+
+def _sorted_prefixes(prefixes: set[str]) -> tuple[str, ...]:
+    return tuple(sorted(prefixes, key=lambda p: parse_prefix(p) or (99, 0, 0)))
+
+
+def _compress(body: bytes) -> dict[str, bytes]:
+    if len(body) < MIN_COMPRESS_BYTES:
+        return {}
+    encodings = {"gzip": gzip.compress(body, compresslevel=9, mtime=0)}
+    if brotli is not None:
+        encodings["br"] = brotli.compress(body, mode=brotli.MODE_TEXT, quality=9)
+    return encodings
+
+
+def _shard_offsets(prefixes: Sequence[str], shard_size: int) -> tuple[int, ...]:
+    # Prefixes are ASCII, so each line is len(prefix) + 1 bytes of the rendered body
+    offsets = [0]
+    position = 0
+    for count, prefix in enumerate(prefixes, 1):
+        position += len(prefix) + 1
+        if count % shard_size == 0 and count < len(prefixes):
+            offsets.append(position)
+    # An empty feed renders as a single newline
+    offsets.append(position or 1)
+    return tuple(offsets)
+
+
+def _render(prefixes: Sequence[str]) -> bytes:
+    return ("\n".join(prefixes) + "\n").encode()
 
 
-def _is_ipv4(prefix: str) -> bool:
-    try:
-        return isinstance(ipaddress.ip_network(prefix, strict=False), ipaddress.IPv4Network)
-    except ValueError:
-        return False
+def _render_index(names: Sequence[str]) -> bytes:
+    links = "\n".join(
+        f'<li><a href="/feeds/{html.escape(name)}">{html.escape(name)}</a></li>'
+        for name in names
+    )
+    return f"""<!DOCTYPE html>
+<html>
+<head><title>Fortinet External Feeds</title></head>
+<body>
+<h1>Available Service Tags</h1>
+<p>{len(names)} service tags available. Each link returns a plain-text list of IP/CIDR prefixes.</p>
+<ul>{links}</ul>
+</body>
+</html>""".encode()
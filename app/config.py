@@ -1,14 +1,31 @@
-from typing import Literal
+from typing import Annotated, Literal
 
+from pydantic import Field
 from pydantic_settings import BaseSettings
 
 
 class Settings(BaseSettings):
     refresh_interval_hours: int = 24
+    check_interval_minutes: float = 30
+    retry_base_seconds: float = 30
     listen_host: str = "0.0.0.0"
     listen_port: int = 8080
     log_level: Literal["debug", "info", "warning", "error", "critical"] = "info"
     api_token: str | None = None
+    # Per-client tokens, accepted like api_token, each with its own requests/minute limit
+    api_tokens: dict[str, Annotated[int, Field(ge=1)]] = {}
+    rate_limit_max_keys: int = 100_000
+    admin_token: str | None = None
+    feed_cache_control: str = "no-cache"
+    composite_cache_size: int = 256
+    composite_cache_bytes: int = 64 * 1024 * 1024
+    history_size: int = 8
+    feed_shard_size: int = 5000
+    data_dir: str | None = None
+    shared_snapshot: bool = False
+    shared_poll_seconds: float = 5.0
+    # Extra feed namespaces, served with ?source=<name>; see app.sources.build_source
+    sources: dict[str, dict] = {}
 
 
 settings = Settings()
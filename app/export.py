@@ -0,0 +1,190 @@
+"""Render every feed to a directory for nginx/CDN serving.
+
+Run with: python -m app.export OUTPUT_DIR [--input SERVICE_TAGS.json] [--force]
+
+OUTPUT_DIR/current is a symlink to the latest generation directory:
+
+    feeds/<tag>         IPv4 feed (same body as /feeds/<tag>)
+    feeds-all/<tag>     IPv4 and IPv6 (same body as /feeds/<tag>?ipv6=true)
+    tags.json           all tag names (same body as /tags)
+    index.html          browseable index (same body as /)
+    *.gz, *.br          precompressed siblings, for gzip_static / brotli_static
+    manifest.json       changeNumber, upstream validators and each file's ETag
+
+Files whose content is unchanged since the previous generation are hardlinked
+rather than rewritten, and the symlink is swapped with a single rename.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import re
+import shutil
+import sys
+import time
+from dataclasses import asdict
+from pathlib import Path
+
+from app.cache import FeedBody, FeedCache
+from app.fetcher import ServiceTagsFetcher, Validators
+
+logger = logging.getLogger(__name__)
+
+CURRENT_LINK = "current"
+MANIFEST_FILENAME = "manifest.json"
+GENERATION_PREFIX = "gen-"
+EXPORTABLE_NAME = re.compile(r"^[A-Za-z0-9._-]{1,128}$")
+
+
+def read_manifest(output_dir: Path) -> dict | None:
+    try:
+        return json.loads((output_dir / CURRENT_LINK / MANIFEST_FILENAME).read_bytes())
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError):
+        logger.exception("Ignoring unreadable export manifest in %s", output_dir)
+        return None
+
+
+def _exportable(name: str) -> bool:
+    return EXPORTABLE_NAME.match(name) is not None and name.strip(".") != ""
+
+
+def _files(cache: FeedCache) -> dict[str, FeedBody]:
+    files = {"index.html": cache.index_html}
+    if cache.tags_json is not None:
+        files["tags.json"] = cache.tags_json
+    for name in cache.get_all_tags():
+        if not _exportable(name):
+            logger.warning("Skipping tag with a name unsafe for a file path: %r", name)
+            continue
+        files[f"feeds/{name}"] = cache.get_feed(name)
+        files[f"feeds-all/{name}"] = cache.get_feed(name, include_ipv6=True)
+    return files
+
+
+def _content_digest(etag: str) -> str:
+    # ETags are "<changeNumber>-<content hash>"; only the hash says whether bytes changed
+    return etag.strip('"').partition("-")[2]
+
+
+def _place(path: Path, body: bytes | memoryview, previous: Path | None) -> bool:
+    """Hardlink path from the previous generation if possible; return True if written."""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    if previous is not None:
+        try:
+            os.link(previous, path)
+            return False
+        except OSError:
+            pass
+    path.write_bytes(body)
+    return True
+
+
+def export(cache: FeedCache, output_dir: Path, source: dict | None = None) -> Path:
+    """Write a new generation for the cache's snapshot and make it current."""
+    output_dir.mkdir(parents=True, exist_ok=True)
+    manifest = read_manifest(output_dir) or {}
+    previous_etags = manifest.get("files", {})
+    previous_dir = (output_dir / CURRENT_LINK).resolve() if previous_etags else None
+    generation = output_dir / f"{GENERATION_PREFIX}{cache.change_number}-{time.time_ns()}"
+    generation.mkdir()
+
+    etags = {}
+    written = linked = 0
+    for relative, feed_body in _files(cache).items():
+        etags[relative] = feed_body.etag
+        unchanged = (
+            relative in previous_etags
+            and _content_digest(previous_etags[relative]) == _content_digest(feed_body.etag)
+        )
+        variants = {relative: feed_body.body}
+        for coding, body in feed_body.encodings.items():
+            variants[f"{relative}.{'gz' if coding == 'gzip' else coding}"] = body
+        for name, body in variants.items():
+            old = previous_dir / name if unchanged else None
+            if old is not None and not old.exists():
+                old = None
+            if _place(generation / name, body, old):
+                written += 1
+            else:
+                linked += 1
+
+    manifest = {
+        "changeNumber": cache.change_number,
+        "refreshedAt": cache.last_refresh.isoformat() if cache.last_refresh else None,
+        "source": source or {},
+        "files": etags,
+    }
+    (generation / MANIFEST_FILENAME).write_text(json.dumps(manifest, indent=1, sort_keys=True))
+
+    # Atomic swap: readers see either the old or the new tree, never a mix
+    link = output_dir / CURRENT_LINK
+    tmp_link = output_dir / f".{CURRENT_LINK}.{os.getpid()}.tmp"
+    tmp_link.unlink(missing_ok=True)
+    tmp_link.symlink_to(generation.name)
+    os.replace(tmp_link, link)
+    logger.info(
+        "Exported changeNumber=%s to %s: %d files written, %d unchanged (hardlinked)",
+        cache.change_number, generation, written, linked,
+    )
+    # The previous generation is kept so reads that started before the swap can finish
+    _prune(output_dir, keep={generation.name, previous_dir.name if previous_dir else None})
+    return generation
+
+
+def _prune(output_dir: Path, keep: set[str | None]) -> None:
+    for path in output_dir.iterdir():
+        if path.name.startswith(GENERATION_PREFIX) and path.is_dir() and path.name not in keep:
+            shutil.rmtree(path, ignore_errors=True)
+
+
+async def run(output_dir: Path, input_path: Path | None = None, force: bool = False) -> bool:
+    """Fetch (or read) ServiceTags and export them; return False if nothing changed."""
+    manifest = read_manifest(output_dir) or {}
+    source: dict = {}
+    if input_path is not None:
+        data = json.loads(input_path.read_bytes())
+    else:
+        fetcher = ServiceTagsFetcher()
+        if not force:
+            fetcher.validators = Validators.from_dict(manifest.get("source", {}))
+        try:
+            data, validators = await fetcher.fetch()
+        finally:
+            await fetcher.aclose()
+        if data is None:
+            logger.info("Upstream unchanged, keeping export changeNumber=%s",
+                        manifest.get("changeNumber"))
+            return False
+        # Recorded by export() together with the data they describe
+        source = asdict(validators)
+    if manifest.get("changeNumber") == data["changeNumber"] and not force:
+        logger.info("Export already at changeNumber=%s", data["changeNumber"])
+        return False
+    cache = FeedCache()
+    cache.load(data)
+    export(cache, output_dir, source)
+    return True
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(
+        prog="python -m app.export", description="Render every feed to a directory."
+    )
+    parser.add_argument("output_dir", type=Path)
+    parser.add_argument("--input", type=Path, help="ServiceTags JSON file instead of downloading")
+    parser.add_argument("--force", action="store_true", help="Export even if nothing changed")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(levelname)s %(name)s: %(message)s")
+    try:
+        asyncio.run(run(args.output_dir, args.input, args.force))
+    except Exception:
+        logger.exception("Export failed")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
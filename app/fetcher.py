@@ -1,17 +1,29 @@
 import re
 import logging
+import time
+from dataclasses import asdict, dataclass, fields, replace
 from urllib.parse import urlparse
 
 import httpx
 
+from app.metrics import REFRESH_SECONDS, UPSTREAM_BYTES
+from app.parser import ServiceTagsParser
+
 logger = logging.getLogger(__name__)
 
-DOWNLOAD_PAGE_URL = "https://www.microsoft.com/en-us/download/details.aspx?id=56519"
+# Download page id per Microsoft cloud; the file is named ServiceTags_<cloud>_<date>.json
+AZURE_CLOUDS = {"Public": "56519", "AzureGovernment": "57063", "China": "57062"}
+DOWNLOAD_PAGE = "https://www.microsoft.com/en-us/download/details.aspx?id={}"
+DOWNLOAD_PAGE_URL = DOWNLOAD_PAGE.format(AZURE_CLOUDS["Public"])
 DOWNLOAD_URL_PATTERN = re.compile(
     r'https://download\.microsoft\.com/download/[^"]+ServiceTags_Public_\d+\.json'
 )
 ALLOWED_DOWNLOAD_HOST = "download.microsoft.com"
 TIMEOUT = httpx.Timeout(connect=10.0, read=60.0, write=10.0, pool=5.0)
+# Checks are minutes apart and the page and the file live on different hosts, so
+# connections are not reused between checks; idle ones are closed quickly (httpx
+# default). The shared client still saves building an SSL context per refresh.
+LIMITS = httpx.Limits(max_connections=4, max_keepalive_connections=2)
 MAX_RESPONSE_BYTES = 20 * 1024 * 1024  # 20 MB safety ceiling
 
 
@@ -24,35 +36,164 @@ def _validate_download_url(url: str) -> str:
     return url
 
 
-async def discover_download_url() -> str:
-    async with httpx.AsyncClient(
+def create_client() -> httpx.AsyncClient:
+    return httpx.AsyncClient(
         follow_redirects=True,
         timeout=TIMEOUT,
         max_redirects=3,
-    ) as client:
-        response = await client.get(DOWNLOAD_PAGE_URL)
-        response.raise_for_status()
-        if len(response.content) > MAX_RESPONSE_BYTES:
-            raise RuntimeError("Response too large from Microsoft download page")
-        match = DOWNLOAD_URL_PATTERN.search(response.text)
-        if not match:
-            raise RuntimeError("Could not find ServiceTags download URL on Microsoft page")
-        url = _validate_download_url(match.group(0))
-        logger.info("Discovered download URL: %s", url)
-        return url
-
-
-async def fetch_service_tags(url: str) -> dict:
-    async with httpx.AsyncClient(
-        follow_redirects=True,
-        timeout=TIMEOUT,
-        max_redirects=3,
-    ) as client:
-        response = await client.get(url)
+        limits=LIMITS,
+    )
+
+
+def _download_url_pattern(cloud: str) -> re.Pattern:
+    if cloud == "Public":
+        return DOWNLOAD_URL_PATTERN
+    return re.compile(
+        rf'https://download\.microsoft\.com/download/[^"]+ServiceTags_{cloud}_\d+\.json'
+    )
+
+
+async def discover_download_url(client: httpx.AsyncClient, cloud: str = "Public") -> str:
+    response = await client.get(DOWNLOAD_PAGE.format(AZURE_CLOUDS[cloud]))
+    response.raise_for_status()
+    if len(response.content) > MAX_RESPONSE_BYTES:
+        raise RuntimeError("Response too large from Microsoft download page")
+    match = _download_url_pattern(cloud).search(response.text)
+    if not match:
+        raise RuntimeError("Could not find ServiceTags download URL on Microsoft page")
+    url = _validate_download_url(match.group(0))
+    logger.info("Discovered download URL: %s", url)
+    return url
+
+
+@dataclass
+class Validators:
+    url: str | None = None
+    etag: str | None = None
+    last_modified: str | None = None
+
+    @classmethod
+    def from_dict(cls, mapping: dict) -> "Validators":
+        # Persisted by another version of the app; unknown keys must not break a restore
+        return cls(**{f.name: mapping.get(f.name) for f in fields(cls)})
+
+    def headers(self) -> dict[str, str]:
+        headers = {}
+        if self.etag:
+            headers["If-None-Match"] = self.etag
+        if self.last_modified:
+            headers["If-Modified-Since"] = self.last_modified
+        return headers
+
+
+async def fetch_service_tags(
+    client: httpx.AsyncClient,
+    url: str,
+    validators: Validators | None = None,
+    record_metrics: bool = True,
+) -> tuple[dict | None, Validators]:
+    """Stream and parse the ServiceTags JSON, conditionally if validators are given.
+
+    The size ceiling is enforced while streaming, and entries are parsed as
+    they arrive. Returns (None, validators) when upstream answers 304.
+    Download and parse times and the body size go to the primary feed's
+    metrics unless record_metrics is false.
+    """
+    headers = validators.headers() if validators else {}
+    started = time.perf_counter()
+    parsing = 0.0
+    async with client.stream("GET", url, headers=headers) as response:
+        if response.status_code == 304:
+            logger.info("ServiceTags not modified at %s", url)
+            return None, validators
         response.raise_for_status()
-        if len(response.content) > MAX_RESPONSE_BYTES:
+        declared = response.headers.get("content-length")
+        if declared is not None and declared.isdigit() and int(declared) > MAX_RESPONSE_BYTES:
             raise RuntimeError("ServiceTags response too large")
-        data = response.json()
-        logger.info("Fetched ServiceTags: changeNumber=%s, %d tags",
-                     data.get("changeNumber"), len(data.get("values", [])))
-        return data
+        parser = ServiceTagsParser()
+        received = 0
+        async for chunk in response.aiter_bytes():
+            received += len(chunk)
+            if received > MAX_RESPONSE_BYTES:
+                raise RuntimeError("ServiceTags response too large")
+            parse_started = time.perf_counter()
+            parser.feed(chunk)
+            parsing += time.perf_counter() - parse_started
+        parse_started = time.perf_counter()
+        data = parser.close()
+        parsing += time.perf_counter() - parse_started
+    if record_metrics:
+        # Parsing is interleaved with the download; the split attributes each its own share
+        REFRESH_SECONDS.observe(time.perf_counter() - started - parsing, "download")
+        REFRESH_SECONDS.observe(parsing, "parse")
+        UPSTREAM_BYTES.observe(received)
+    logger.info("Fetched ServiceTags: changeNumber=%s, %d tags, %d bytes",
+                data.get("changeNumber"), len(data.get("values", [])), received)
+    return data, Validators(
+        url=url,
+        etag=response.headers.get("etag"),
+        last_modified=response.headers.get("last-modified"),
+    )
+
+
+@dataclass
+class FetchStats:
+    full: int = 0
+    unchanged_url: int = 0
+    not_modified: int = 0
+
+
+class ServiceTagsFetcher:
+    """Refreshes ServiceTags over one long-lived client, downloading only on change.
+
+    Only the primary feed's fetcher records refresh metrics; one serving an
+    extra source (see app.sources) is created with record_metrics=False.
+    """
+
+    def __init__(self, cloud: str = "Public", record_metrics: bool = True):
+        if cloud not in AZURE_CLOUDS:
+            raise ValueError(f"Unknown Azure cloud {cloud!r}, expected one of {list(AZURE_CLOUDS)}")
+        self.cloud = cloud
+        self.record_metrics = record_metrics
+        self._client: httpx.AsyncClient | None = None
+        self.validators = Validators()
+        self.stats = FetchStats()
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        if self._client is None:
+            self._client = create_client()
+        return self._client
+
+    async def aclose(self) -> None:
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    async def fetch(self, force: bool = False) -> tuple[dict | None, Validators]:
+        """Return fresh ServiceTags data, or None if upstream has not changed.
+
+        The returned validators describe that data. They are not kept here: the
+        caller sets self.validators once the data is installed, so a snapshot
+        that fails to build is downloaded again rather than taken as unchanged.
+        """
+        started = time.perf_counter()
+        url = await discover_download_url(self.client, self.cloud)
+        if self.record_metrics:
+            REFRESH_SECONDS.observe(time.perf_counter() - started, "discover")
+        if url == self.validators.url and not force:
+            # The published file name is dated, so the same URL means the same data
+            self.stats.unchanged_url += 1
+            logger.info("Download URL unchanged, skipping ServiceTags download")
+            return None, self.validators
+        data, validators = await fetch_service_tags(
+            self.client, url, self.validators, self.record_metrics
+        )
+        if data is None:
+            self.stats.not_modified += 1
+            return None, replace(self.validators, url=url)
+        self.stats.full += 1
+        return data, validators
+
+    def stats_dict(self) -> dict[str, int]:
+        return asdict(self.stats)
@@ -1,29 +1,111 @@
 import asyncio
-import html
 import logging
 import re
+import secrets
+import time
 from contextlib import asynccontextmanager
+from dataclasses import asdict
+from pathlib import Path
+from typing import Literal
+from urllib.parse import parse_qsl
 
 from fastapi import FastAPI, HTTPException, Query, Request, Depends, Security
-from fastapi.responses import PlainTextResponse, HTMLResponse, Response
+from fastapi.responses import HTMLResponse, JSONResponse, Response
+from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer
 from fastapi.security.api_key import APIKeyQuery
-from slowapi import Limiter, _rate_limit_exceeded_handler
-from slowapi.errors import RateLimitExceeded
-from slowapi.util import get_remote_address
-from starlette.middleware.base import BaseHTTPMiddleware
+from pydantic import BaseModel, Field
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
 
-from app.cache import FeedCache
 from app.config import settings
-from app.fetcher import discover_download_url, fetch_service_tags
+from app.fetcher import ServiceTagsFetcher, Validators
+from app.cache import FeedBody, FeedCache, Snapshot
+from app import metrics
+from app.metrics import (
+    FEED_TRAFFIC,
+    NOT_MODIFIED,
+    REFRESH_SECONDS,
+    REFRESHES,
+    REQUEST_SECONDS,
+)
+from app.monitor import LoopLagMonitor
+from app.ratelimit import Rate, RateLimiter
+from app.scheduler import RefreshScheduler, SingleFlight
+from app.negotiation import (
+    RangeNotSatisfiable,
+    byte_range,
+    choose_encoding,
+    http_date,
+    is_not_modified,
+)
+from app.shared import LOCK_FILENAME, LeaderLock, SnapshotWatcher
+from app.snapshot import (
+    SNAPSHOT_FILENAME, PersistedSnapshot, keep_rendered, load_snapshot, save_snapshot,
+)
+from app.sources import PRIMARY_SOURCE, SourceRefresher, build_source, snapshot_filename
+from app.watch import ChangeWatcher
 
 logger = logging.getLogger(__name__)
 
-cache = FeedCache()
-limiter = Limiter(key_func=get_remote_address)
+cache = FeedCache(
+    composite_cache_size=settings.composite_cache_size,
+    composite_cache_bytes=settings.composite_cache_bytes,
+    history_size=settings.history_size,
+    shard_size=settings.feed_shard_size,
+)
+limiter = RateLimiter(max_keys=settings.rate_limit_max_keys, quotas=settings.api_tokens)
+upstream = ServiceTagsFetcher()
+loop_lag = LoopLagMonitor()
+watcher = ChangeWatcher()
+scheduler = RefreshScheduler(
+    check_interval=settings.check_interval_minutes * 60,
+    revalidate_interval=settings.refresh_interval_hours * 3600,
+    retry_base=settings.retry_base_seconds,
+)
+# Manual and scheduled refreshes share one in-flight upstream fetch
+refresh_flight = SingleFlight()
+
+
+def build_refreshers(specs: dict[str, dict]) -> dict[str, SourceRefresher]:
+    refreshers = {}
+    for name, spec in specs.items():
+        minutes = spec.get("check_interval_minutes", settings.check_interval_minutes)
+        refreshers[name] = SourceRefresher(
+            name,
+            build_source(spec),
+            FeedCache(
+                composite_cache_size=settings.composite_cache_size,
+                composite_cache_bytes=settings.composite_cache_bytes,
+                history_size=settings.history_size,
+                shard_size=settings.feed_shard_size,
+            ),
+            RefreshScheduler(
+                check_interval=minutes * 60,
+                revalidate_interval=settings.refresh_interval_hours * 3600,
+                retry_base=settings.retry_base_seconds,
+            ),
+            None if settings.data_dir is None
+            else Path(settings.data_dir) / snapshot_filename(name),
+        )
+    return refreshers
+
+
+# Sources other than the primary feed, each with its own cache and schedule
+sources = build_refreshers(settings.sources)
 
 SERVICE_TAG_PATTERN = re.compile(r"^[A-Za-z0-9._-]{1,128}$")
+MAX_LOOKUP_BATCH = 10_000
+MAX_COMPOSITE_TAGS = 64
+MAX_TAGS_PAGE = 1000
+MAX_WATCH_SECONDS = 60
 MAX_STARTUP_RETRIES = 5
-STARTUP_RETRY_DELAY_SECONDS = 30
+FEED_RATE = Rate.parse("60/minute")
+SHARD_RATE = Rate.parse("60/minute")
+# Limiter key shared by every feed or shard path that does not name a known tag
+UNKNOWN_FEED_KEY = "/feeds/{service_tag}"
+# Sum of the largest backoff delays the leader can wait between its startup attempts
+STARTUP_FOLLOW_TIMEOUT_SECONDS = settings.retry_base_seconds * (
+    2 ** (MAX_STARTUP_RETRIES - 1) - 1
+)
 
 
 # --- Authentication ---
@@ -32,71 +114,387 @@ api_key_query = APIKeyQuery(name="token", auto_error=False)
 
 
 async def verify_token(token: str | None = Security(api_key_query)) -> str | None:
-    if settings.api_token is None:
+    if settings.api_token is None and not settings.api_tokens:
         return None
-    if token != settings.api_token:
+    if token is None or (token != settings.api_token and token not in settings.api_tokens):
         raise HTTPException(status_code=403, detail="Forbidden")
     return token
 
 
+admin_bearer = HTTPBearer(auto_error=False)
+
+
+async def verify_admin(
+    credentials: HTTPAuthorizationCredentials | None = Security(admin_bearer),
+) -> None:
+    if settings.admin_token is None:
+        # Admin endpoints do not exist unless a token is configured
+        raise HTTPException(status_code=404, detail="Not found")
+    if credentials is None or not secrets.compare_digest(
+        credentials.credentials.encode(), settings.admin_token.encode()
+    ):
+        raise HTTPException(status_code=403, detail="Forbidden")
+
+
+def source_cache(source: str | None = Query(None, max_length=32)) -> FeedCache:
+    """The FeedCache behind ?source=; the primary feed when absent."""
+    if source is None or source == PRIMARY_SOURCE:
+        return cache
+    refresher = sources.get(source)
+    if refresher is None:
+        raise HTTPException(status_code=404, detail="Unknown source")
+    return refresher.cache
+
+
 # --- Security Headers Middleware ---
 
 
-class SecurityHeadersMiddleware(BaseHTTPMiddleware):
-    async def dispatch(self, request: Request, call_next) -> Response:
-        response = await call_next(request)
-        response.headers["X-Content-Type-Options"] = "nosniff"
-        response.headers["X-Frame-Options"] = "DENY"
-        response.headers["Referrer-Policy"] = "no-referrer"
-        response.headers["Content-Security-Policy"] = "default-src 'none'"
-        response.headers["Strict-Transport-Security"] = (
-            "max-age=31536000; includeSubDomains"
+SECURITY_HEADERS = [
+    (b"x-content-type-options", b"nosniff"),
+    (b"x-frame-options", b"DENY"),
+    (b"referrer-policy", b"no-referrer"),
+    (b"content-security-policy", b"default-src 'none'"),
+    (b"strict-transport-security", b"max-age=31536000; includeSubDomains"),
+]
+NO_STORE = (b"cache-control", b"no-store")
+
+
+class SecurityHeadersMiddleware:
+    """Adds the security headers to every response.
+
+    Pure ASGI: it only rewrites the response start message, so unlike
+    BaseHTTPMiddleware it costs no extra task or body streaming per request.
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        async def send_with_headers(message: Message) -> None:
+            if message["type"] == "http.response.start":
+                headers = message.get("headers", [])
+                # Routes with validators set their own cache policy
+                if any(name == b"cache-control" for name, _ in headers):
+                    message["headers"] = [*headers, *SECURITY_HEADERS]
+                else:
+                    message["headers"] = [*headers, *SECURITY_HEADERS, NO_STORE]
+            await send(message)
+
+        await self.app(scope, receive, send_with_headers)
+
+
+# --- Feed Fast Path ---
+
+
+# Query values FastAPI accepts for a bool parameter
+BOOLEAN_VALUES = {
+    **dict.fromkeys(("1", "true", "t", "yes", "y", "on"), True),
+    **dict.fromkeys(("0", "false", "f", "no", "n", "off"), False),
+}
+
+
+class FeedFastPath:
+    """Serves GET /feeds/{service_tag} without FastAPI routing and dependency injection.
+
+    Feeds are the bulk of the traffic and each one is a pre-rendered blob, so
+    routing, parameter validation and dependency resolution would dominate the
+    request. This answers them directly with the same checks in the same
+    order: token (403), rate limit (429, charged once the tag is looked up;
+    see feed_response), then unknown tag (404). Anything it
+    does not recognise (shard paths, query values FastAPI would reject with a
+    422) passes through to the regular routes.
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if (
+            scope["type"] != "http"
+            or scope["method"] != "GET"
+            or not scope["path"].startswith("/feeds/")
+        ):
+            await self.app(scope, receive, send)
+            return
+        service_tag = scope["path"][len("/feeds/"):]
+        params = dict(parse_qsl(scope["query_string"].decode("latin-1"), keep_blank_values=True))
+        ipv6 = BOOLEAN_VALUES.get(params.get("ipv6", "false").lower())
+        aggregate = BOOLEAN_VALUES.get(params.get("aggregate", "false").lower())
+        if "/" in service_tag or ipv6 is None or aggregate is None:
+            await self.app(scope, receive, send)
+            return
+        request = Request(scope, receive)
+        try:
+            await verify_token(params.get("token") or None)
+            feeds = source_cache(params.get("source"))
+            response = feed_response(
+                request, feeds, params.get("source"), service_tag, ipv6, aggregate
+            )
+        except HTTPException as exc:
+            response = JSONResponse(
+                {"detail": exc.detail}, status_code=exc.status_code, headers=exc.headers
+            )
+        await response(scope, receive, send)
+
+
+# --- Conditional Responses ---
+
+
+def cached_response(
+    request: Request,
+    etag: str,
+    body: bytes | memoryview | None,
+    media_type: str,
+    vary: bool = False,
+    content_encoding: str | None = None,
+    extra_headers: dict[str, str] | None = None,
+    ranges: bool = False,
+    feeds: FeedCache | None = None,
+) -> Response:
+    last_refresh = (cache if feeds is None else feeds).last_refresh
+    headers = {"ETag": etag, "Cache-Control": settings.feed_cache_control}
+    if extra_headers:
+        headers.update(extra_headers)
+    if vary:
+        headers["Vary"] = "Accept-Encoding"
+    if ranges:
+        headers["Accept-Ranges"] = "bytes"
+    if last_refresh is not None:
+        headers["Last-Modified"] = http_date(last_refresh)
+    if is_not_modified(request.headers, etag, last_refresh):
+        return Response(status_code=304, headers=headers)
+    span = None
+    if ranges and body is not None:
+        try:
+            span = byte_range(request.headers, etag, len(body))
+        except RangeNotSatisfiable:
+            headers["Content-Range"] = f"bytes */{len(body)}"
+            return Response(status_code=416, headers=headers)
+    if content_encoding is not None:
+        headers["Content-Encoding"] = content_encoding
+    if span is not None:
+        # Ranges apply to the selected representation, so a slice of the stored bytes
+        start, stop = span
+        headers["Content-Range"] = f"bytes {start}-{stop - 1}/{len(body)}"
+        return Response(body[start:stop], status_code=206, media_type=media_type, headers=headers)
+    return Response(body, media_type=media_type, headers=headers)
+
+
+def body_response(
+    request: Request,
+    feed_body: FeedBody,
+    media_type: str,
+    extra_headers: dict[str, str] | None = None,
+    ranges: bool = False,
+    feeds: FeedCache | None = None,
+) -> Response:
+    # Pick a precompressed variant; nothing is compressed per request
+    vary = bool(feed_body.encodings)
+    coding = choose_encoding(request.headers.get("accept-encoding"), feed_body.encodings)
+    if coding is None:
+        return cached_response(
+            request, feed_body.etag, feed_body.body, media_type, vary,
+            extra_headers=extra_headers, ranges=ranges, feeds=feeds,
         )
-        response.headers["Cache-Control"] = "no-store"
-        return response
+    return cached_response(
+        request,
+        feed_body.encoded_etag(coding),
+        feed_body.encodings[coding],
+        media_type,
+        vary,
+        content_encoding=coding,
+        extra_headers=extra_headers,
+        ranges=ranges,
+        feeds=feeds,
+    )
+
+
+ROUTE_SECONDS = {
+    route: REQUEST_SECONDS.labels(route)
+    for route in ("feed", "feed_shard", "tags", "tags_search", "index")
+}
+
+
+def observed(route: str, started: float, response: Response) -> Response:
+    ROUTE_SECONDS[route].observe(time.perf_counter() - started)
+    if response.status_code == 304:
+        NOT_MODIFIED.inc(route)
+    return response
 
 
 # --- Cache Refresh ---
 
 
-async def refresh_cache() -> None:
-    url = await discover_download_url()
-    data = await fetch_service_tags(url)
-    cache.load(data)
+def snapshot_path() -> Path | None:
+    if settings.data_dir is None:
+        return None
+    return Path(settings.data_dir) / SNAPSHOT_FILENAME
+
+
+async def refresh_cache(force: bool = False) -> None:
+    try:
+        data, validators = await upstream.fetch(force=force)
+    except Exception:
+        REFRESHES.inc("error")
+        raise
+    if data is None:
+        upstream.validators = validators
+        REFRESHES.inc("unchanged")
+        logger.info("Upstream unchanged: changeNumber=%s", cache.change_number)
+        return
+    # Parse results are rendered and indexed off the event loop, then swapped in
+    started = time.perf_counter()
+    try:
+        snapshot = await asyncio.to_thread(cache.build, data)
+    except Exception:
+        REFRESHES.inc("error")
+        raise
+    built = time.perf_counter()
+    cache.install(snapshot)
+    # Only now: validators kept for data that never got served would read as "unchanged"
+    upstream.validators = validators
+    REFRESH_SECONDS.observe(built - started, "build")
+    REFRESH_SECONDS.observe(time.perf_counter() - built, "install")
+    REFRESHES.inc("updated")
+    watcher.notify(cache.change_number)
     logger.info("Cache refreshed: changeNumber=%s", cache.change_number)
+    path = snapshot_path()
+    if path is not None:
+        try:
+            await asyncio.to_thread(
+                save_snapshot, path, data, cache.last_refresh, asdict(upstream.validators),
+                snapshot,
+            )
+        except OSError:
+            logger.exception("Failed to persist snapshot to %s", path)
+
+
+async def scheduled_refresh(force: bool) -> None:
+    # Joins a refresh that is already in flight (e.g. from POST /refresh) instead of starting one
+    await refresh_flight.run(lambda: refresh_cache(force=force))
 
 
 async def periodic_refresh() -> None:
-    interval = settings.refresh_interval_hours * 3600
-    while True:
-        await asyncio.sleep(interval)
-        try:
-            await refresh_cache()
-        except Exception:
-            logger.exception("Failed to refresh cache")
+    await scheduler.run(scheduled_refresh)
 
 
 # --- Lifespan ---
 
 
+async def initial_refresh() -> None:
+    for attempt in range(1, MAX_STARTUP_RETRIES + 1):
+        if await scheduler.run_once(scheduled_refresh):
+            return
+        logger.warning("Startup cache refresh attempt %d/%d failed", attempt, MAX_STARTUP_RETRIES)
+        if attempt < MAX_STARTUP_RETRIES:
+            await scheduler.sleep(scheduler.retry_delay())
+
+
+async def apply_snapshot(restored: PersistedSnapshot) -> Snapshot:
+    # Feeds rendered by the worker that saved it are mapped, not rendered again
+    snapshot = await asyncio.to_thread(restored.build, cache)
+    cache.install(snapshot, refreshed_at=restored.refreshed_at)
+    watcher.notify(cache.change_number)
+    upstream.validators = Validators.from_dict(restored.source)
+    return snapshot
+
+
+async def restore_snapshot() -> bool:
+    path = snapshot_path()
+    restored = (
+        await asyncio.to_thread(load_snapshot, path, cache.shard_size)
+        if path is not None else None
+    )
+    if restored is None:
+        return False
+    snapshot = await apply_snapshot(restored)
+    await asyncio.to_thread(keep_rendered, path, restored, snapshot)
+    logger.info("Restored snapshot changeNumber=%s from %s", cache.change_number, path)
+    return True
+
+
+async def lead(revalidate: bool) -> None:
+    if revalidate:
+        await initial_refresh()
+    await periodic_refresh()
+
+
+async def follow_leader(lock: LeaderLock, ready: asyncio.Event) -> None:
+    """Load snapshots another worker publishes; take over fetching if it goes away."""
+    published = SnapshotWatcher(snapshot_path(), cache.shard_size)
+    while True:
+        restored = await asyncio.to_thread(published.poll)
+        if restored is not None:
+            await apply_snapshot(restored)
+            logger.info(
+                "Attached to published snapshot changeNumber=%s generation=%s",
+                cache.change_number,
+                restored.generation,
+            )
+            ready.set()
+        if lock.try_acquire():
+            if cache.change_number is not None:
+                ready.set()
+            await initial_refresh()
+            ready.set()
+            await periodic_refresh()
+        await asyncio.sleep(settings.shared_poll_seconds)
+
+
+async def run_source(refresher: SourceRefresher, follow: LeaderLock | None) -> None:
+    if follow is not None:
+        await refresher.follow(follow, settings.shared_poll_seconds)
+        return
+    # Serve the persisted snapshot right away and revalidate behind it
+    await refresher.restore()
+    await refresher.run()
+
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     logging.getLogger().setLevel(settings.log_level.upper())
-    for attempt in range(1, MAX_STARTUP_RETRIES + 1):
+    monitor_task = asyncio.create_task(loop_lag.run())
+    lock = None
+    if settings.shared_snapshot and settings.data_dir is not None:
+        lock = LeaderLock(Path(settings.data_dir) / LOCK_FILENAME)
+    app.state.leader_lock = lock
+    following = lock is not None and not lock.try_acquire()
+    # Started first: extra sources never wait on the primary feed's startup, or on each other
+    source_tasks = [
+        asyncio.create_task(run_source(refresher, lock if following else None))
+        for refresher in sources.values()
+    ]
+    if following:
+        # Another worker fetches upstream; this one only follows its snapshots
+        ready = asyncio.Event()
+        task = asyncio.create_task(follow_leader(lock, ready))
         try:
-            await refresh_cache()
-            break
-        except Exception:
-            logger.exception(
-                "Startup cache refresh attempt %d/%d failed",
-                attempt,
-                MAX_STARTUP_RETRIES,
-            )
-            if attempt < MAX_STARTUP_RETRIES:
-                await asyncio.sleep(STARTUP_RETRY_DELAY_SECONDS)
-    task = asyncio.create_task(periodic_refresh())
-    yield
-    task.cancel()
+            await asyncio.wait_for(ready.wait(), STARTUP_FOLLOW_TIMEOUT_SECONDS)
+        except TimeoutError:
+            logger.error("No snapshot published by the refresh leader yet")
+    elif await restore_snapshot():
+        # Serve the persisted snapshot right away and revalidate upstream behind it
+        task = asyncio.create_task(lead(revalidate=True))
+    else:
+        await initial_refresh()
+        task = asyncio.create_task(lead(revalidate=False))
+    try:
+        yield
+    finally:
+        task.cancel()
+        monitor_task.cancel()
+        for source_task in source_tasks:
+            source_task.cancel()
+        await upstream.aclose()
+        for refresher in sources.values():
+            await refresher.source.aclose()
+        if lock is not None:
+            lock.release()
+        app.state.leader_lock = None
 
 
 # --- App ---
@@ -108,8 +506,7 @@ app = FastAPI(
     redoc_url=None,
     openapi_url=None,
 )
-app.state.limiter = limiter
-app.add_exception_handler(RateLimitExceeded, _rate_limit_exceeded_handler)
+app.add_middleware(FeedFastPath)
 app.add_middleware(SecurityHeadersMiddleware)
 
 
@@ -119,45 +516,321 @@ async def health() -> dict:
         "status": "ok",
         "change_number": cache.change_number,
         "last_refresh": cache.last_refresh.isoformat() if cache.last_refresh else None,
+        "upstream": upstream.stats_dict(),
+        "refresh": scheduler.stats(cache.last_refresh),
+        "event_loop_lag_ms": loop_lag.stats(),
+        "watchers": watcher.waiting,
+        "rate_limiter": limiter.stats(),
+        "sources": {name: refresher.stats() for name, refresher in sources.items()},
     }
 
 
+def tag_filters(
+    region: str | None = Query(None, max_length=64),
+    system_service: str | None = Query(None, max_length=64),
+    platform: str | None = Query(None, max_length=64),
+    network_feature: str | None = Query(None, max_length=64),
+) -> dict[str, str]:
+    filters = {
+        "region": region,
+        "system_service": system_service,
+        "platform": platform,
+        "network_feature": network_feature,
+    }
+    return {attribute: value for attribute, value in filters.items() if value is not None}
+
+
 @app.get("/tags")
 @limiter.limit("30/minute")
-async def tags(request: Request, _: str | None = Depends(verify_token)) -> list[str]:
-    return cache.get_all_tags()
+async def tags(
+    request: Request,
+    q: str | None = Query(None, max_length=128, pattern=r"^[A-Za-z0-9._-]*$"),
+    match: Literal["prefix", "substring"] = Query("prefix"),
+    offset: int = Query(0, ge=0),
+    limit: int | None = Query(None, ge=1, le=MAX_TAGS_PAGE),
+    detail: bool = Query(False),
+    filters: dict[str, str] = Depends(tag_filters),
+    feeds: FeedCache = Depends(source_cache),
+    _: str | None = Depends(verify_token),
+) -> Response:
+    started = time.perf_counter()
+    if q is None and not filters and offset == 0 and limit is None:
+        # The full list is pre-rendered once per snapshot
+        listing = feeds.tags_detail_json if detail else feeds.tags_json
+        if listing is None:
+            return Response(b"[]", media_type="application/json")
+        return observed(
+            "tags", started, body_response(request, listing, "application/json", feeds=feeds)
+        )
+    if q is None:
+        names = feeds.select_tags(**filters) if filters else feeds.get_all_tags()
+    else:
+        names = feeds.search_tags(q, match == "substring")
+        if filters:
+            selected = set(feeds.select_tags(**filters))
+            names = [name for name in names if name in selected]
+    end = None if limit is None else offset + limit
+    page = feeds.get_details(names[offset:end]) if detail else names[offset:end]
+    return observed(
+        "tags_search", started, JSONResponse(page, headers={"X-Total-Count": str(len(names))})
+    )
+
+
+# Declared before the catch-all feed route, which would otherwise match ".../part/N"
+@app.get("/feeds/{service_tag}/part/{number}")
+async def feed_shard(
+    request: Request,
+    service_tag: str,
+    number: int,
+    ipv6: bool = Query(False),
+    aggregate: bool = Query(False),
+    feeds: FeedCache = Depends(source_cache),
+    _: str | None = Depends(verify_token),
+) -> Response:
+    started = time.perf_counter()
+    feed_body = _known_feed(feeds, service_tag, ipv6, aggregate)
+    shard = None if feed_body is None else feed_body.shard(number)
+    # Limited per shard, but every missing shard shares one key
+    limiter.check(
+        request, SHARD_RATE,
+        UNKNOWN_FEED_KEY if shard is None else f"/feeds/{service_tag}/part/{number}",
+    )
+    if shard is None:
+        raise HTTPException(status_code=404, detail="Not found")
+    response = cached_response(
+        request,
+        feed_body.shard_etag(number),
+        shard,
+        "text/plain",
+        extra_headers={"X-Shard-Count": str(feed_body.shard_count)},
+        ranges=True,
+        feeds=feeds,
+    )
+    FEED_TRAFFIC.record(
+        (request.query_params.get("source") or PRIMARY_SOURCE, service_tag),
+        len(response.body), ROUTE_SECONDS["feed_shard"], time.perf_counter() - started,
+    )
+    if response.status_code == 304:
+        NOT_MODIFIED.inc("feed_shard")
+    return response
 
 
 @app.get("/feeds/{service_tag:path}")
-@limiter.limit("60/minute")
 async def feed(
     request: Request,
     service_tag: str,
     ipv6: bool = Query(False),
+    aggregate: bool = Query(False),
+    feeds: FeedCache = Depends(source_cache),
     _: str | None = Depends(verify_token),
-) -> PlainTextResponse:
+) -> Response:
+    # Normally answered by FeedFastPath; reached for requests it passes through
+    return feed_response(
+        request, feeds, request.query_params.get("source"), service_tag, ipv6, aggregate
+    )
+
+
+def _known_feed(
+    feeds: FeedCache, service_tag: str, ipv6: bool, aggregate: bool
+) -> FeedBody | None:
     if not SERVICE_TAG_PATTERN.match(service_tag):
+        return None
+    return feeds.get_feed(service_tag, include_ipv6=ipv6, aggregated=aggregate)
+
+
+def feed_response(
+    request: Request,
+    feeds: FeedCache,
+    source: str | None,
+    service_tag: str,
+    ipv6: bool,
+    aggregate: bool,
+) -> Response:
+    """The feed for a tag of feeds, the cache source_cache() resolved ?source= to."""
+    started = time.perf_counter()
+    feed_body = _known_feed(feeds, service_tag, ipv6, aggregate)
+    # Limited per tag, but every unknown path shares one key, so a client
+    # requesting junk paths cannot grow the limiter
+    limiter.check(
+        request, FEED_RATE, UNKNOWN_FEED_KEY if feed_body is None else f"/feeds/{service_tag}"
+    )
+    if feed_body is None:
         raise HTTPException(status_code=404, detail="Not found")
-    prefixes = cache.get_tag(service_tag, include_ipv6=ipv6)
-    if prefixes is None:
+    extra_headers = {"X-Entry-Count": str(feed_body.entries)}
+    if feed_body.shards:
+        extra_headers["X-Shard-Count"] = str(feed_body.shard_count)
+    if aggregate:
+        original = feeds.get_feed(service_tag, include_ipv6=ipv6)
+        extra_headers["X-Original-Entry-Count"] = str(original.entries)
+    response = body_response(
+        request, feed_body, "text/plain", extra_headers, ranges=True, feeds=feeds
+    )
+    # Counted only for known sources and tags, which keeps the label set bounded.
+    # observed(), inlined: this runs on every feed request
+    FEED_TRAFFIC.record(
+        (source or PRIMARY_SOURCE, service_tag), len(response.body), ROUTE_SECONDS["feed"],
+        time.perf_counter() - started,
+    )
+    if response.status_code == 304:
+        NOT_MODIFIED.inc("feed")
+    return response
+
+
+@app.get("/composite")
+@limiter.limit("60/minute")
+async def composite(
+    request: Request,
+    include: list[str] = Query(..., max_length=MAX_COMPOSITE_TAGS),
+    exclude: list[str] = Query([], max_length=MAX_COMPOSITE_TAGS),
+    ipv6: bool = Query(False),
+    feeds: FeedCache = Depends(source_cache),
+    _: str | None = Depends(verify_token),
+) -> Response:
+    if not all(SERVICE_TAG_PATTERN.match(name) for name in include + exclude):
+        raise HTTPException(status_code=404, detail="Not found")
+    feed_body = feeds.get_composite(include, exclude, include_ipv6=ipv6)
+    if feed_body is None:
         raise HTTPException(status_code=404, detail="Not found")
-    return PlainTextResponse("\n".join(prefixes) + "\n")
+    return body_response(
+        request, feed_body, "text/plain", {"X-Entry-Count": str(feed_body.entries)}, feeds=feeds
+    )
+
+
+@app.get("/select")
+@limiter.limit("60/minute")
+async def select(
+    request: Request,
+    filters: dict[str, str] = Depends(tag_filters),
+    ipv6: bool = Query(False),
+    feeds: FeedCache = Depends(source_cache),
+    _: str | None = Depends(verify_token),
+) -> Response:
+    if not filters:
+        raise HTTPException(status_code=400, detail="At least one filter is required")
+    names = feeds.select_tags(**filters)
+    if not names:
+        raise HTTPException(status_code=404, detail="Not found")
+    # The matching tags are merged like an include-only composite, and share its LRU
+    feed_body = feeds.get_composite(names, include_ipv6=ipv6)
+    return body_response(
+        request,
+        feed_body,
+        "text/plain",
+        {"X-Entry-Count": str(feed_body.entries), "X-Tag-Count": str(len(names))},
+        feeds=feeds,
+    )
+
+
+@app.get("/diff/{service_tag}")
+@limiter.limit("30/minute")
+async def diff(
+    request: Request,
+    service_tag: str,
+    from_change: int | None = Query(None, alias="from"),
+    to_change: int | None = Query(None, alias="to"),
+    feeds: FeedCache = Depends(source_cache),
+    _: str | None = Depends(verify_token),
+) -> dict:
+    if not SERVICE_TAG_PATTERN.match(service_tag):
+        raise HTTPException(status_code=404, detail="Not found")
+    span = feeds.history_span(from_change, to_change)
+    tag_diff = None if span is None else feeds.get_diff(service_tag, *span)
+    if tag_diff is None:
+        raise HTTPException(status_code=404, detail="Not found")
+    from_change, to_change = span
+    return {
+        "service_tag": service_tag,
+        "from": from_change,
+        "to": to_change,
+        "added": tag_diff.added,
+        "removed": tag_diff.removed,
+        "history": feeds.history(),
+    }
+
+
+@app.post("/refresh")
+@limiter.limit("6/minute")
+async def refresh(request: Request, _: None = Depends(verify_admin)) -> dict:
+    lock = getattr(request.app.state, "leader_lock", None)
+    if lock is not None and not lock.held:
+        raise HTTPException(status_code=409, detail="Refresh is handled by the leader worker")
+    coalesced = refresh_flight.in_flight
+    before = cache.change_number
+    try:
+        # A forced refresh is a conditional GET, so it is cheap when nothing changed
+        await refresh_flight.run(lambda: refresh_cache(force=True))
+    except Exception:
+        logger.exception("Manual refresh failed")
+        raise HTTPException(status_code=502, detail="Upstream refresh failed") from None
+    return {
+        "change_number": cache.change_number,
+        "changed": cache.change_number != before,
+        "coalesced": coalesced,
+    }
+
+
+@app.get("/watch")
+@limiter.limit("60/minute")
+async def watch(
+    request: Request,
+    since: int | None = Query(None),
+    timeout: float = Query(30, gt=0, le=MAX_WATCH_SECONDS),
+    _: str | None = Depends(verify_token),
+) -> dict:
+    """Long-poll until the changeNumber exceeds since, or the timeout passes."""
+    if since is not None and (cache.change_number is None or cache.change_number <= since):
+        await watcher.wait(timeout)
+    changed = cache.change_number is not None and (since is None or cache.change_number > since)
+    return {
+        "change_number": cache.change_number,
+        "changed": changed,
+        "last_refresh": cache.last_refresh.isoformat() if cache.last_refresh else None,
+    }
+
+
+class LookupRequest(BaseModel):
+    ips: list[str] = Field(max_length=MAX_LOOKUP_BATCH)
+
+
+@app.get("/lookup")
+@limiter.limit("60/minute")
+async def lookup(
+    request: Request,
+    ip: str = Query(..., max_length=64),
+    feeds: FeedCache = Depends(source_cache),
+    _: str | None = Depends(verify_token),
+) -> dict:
+    tags = feeds.lookup(ip)
+    if tags is None:
+        raise HTTPException(status_code=400, detail="Invalid IP address")
+    return {"ip": ip, "tags": tags}
+
+
+@app.post("/lookup")
+@limiter.limit("30/minute")
+async def lookup_batch(
+    request: Request,
+    payload: LookupRequest,
+    feeds: FeedCache = Depends(source_cache),
+    _: str | None = Depends(verify_token),
+) -> dict:
+    results = []
+    for ip in payload.ips:
+        tags = feeds.lookup(ip)
+        if tags is None:
+            results.append({"ip": ip, "error": "Invalid IP address"})
+        else:
+            results.append({"ip": ip, "tags": tags})
+    return {"change_number": feeds.change_number, "results": results}
 
 
 @app.get("/", response_class=HTMLResponse)
 @limiter.limit("30/minute")
-async def index(request: Request) -> HTMLResponse:
-    tag_names = cache.get_all_tags()
-    links = "\n".join(
-        f'<li><a href="/feeds/{html.escape(name)}">{html.escape(name)}</a></li>'
-        for name in tag_names
-    )
-    return HTMLResponse(f"""<!DOCTYPE html>
-<html>
-<head><title>Fortinet External Feeds</title></head>
-<body>
-<h1>Available Service Tags</h1>
-<p>{len(tag_names)} service tags available. Each link returns a plain-text list of IP/CIDR prefixes.</p>
-<ul>{links}</ul>
-</body>
-</html>""")
+async def index(request: Request) -> Response:
+    started = time.perf_counter()
+    return observed("index", started, body_response(request, cache.index_html, "text/html"))
+
+
+@app.get("/metrics")
+async def metrics_endpoint(_: str | None = Depends(verify_token)) -> Response:
+    return Response(metrics.render(), media_type=metrics.CONTENT_TYPE)
@@ -0,0 +1,201 @@
+"""Minimal Prometheus text-format metrics.
+
+Updates are plain dict operations on the event loop thread: no locks, no
+per-sample allocation beyond the label tuple. Label values must come from a
+bounded set (route names, known tag names, stage names).
+"""
+from bisect import bisect_left
+from collections.abc import Iterable
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Seconds; request handlers are microseconds to milliseconds, refresh stages up to a minute
+LATENCY_BUCKETS = (
+    0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005,
+    0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0,
+)
+SIZE_BUCKETS = tuple(float(1 << n) for n in range(10, 26, 2))  # 1 KiB .. 32 MiB
+
+
+def _labels(names: tuple[str, ...], values: tuple[str, ...], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _number(value: float) -> str:
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    __slots__ = ("name", "description", "label_names", "_values")
+
+    def __init__(self, name: str, description: str, label_names: tuple[str, ...] = ()):
+        self.name = name
+        self.description = description
+        self.label_names = label_names
+        self._values: dict[tuple[str, ...], float] = {}
+
+    def inc(self, *labels: str, amount: float = 1) -> None:
+        values = self._values
+        values[labels] = values.get(labels, 0) + amount
+
+    def value(self, *labels: str) -> float:
+        return self._values.get(labels, 0)
+
+    def render(self) -> Iterable[str]:
+        yield f"# HELP {self.name} {self.description}"
+        yield f"# TYPE {self.name} counter"
+        for labels, value in sorted(self._values.items()):
+            yield f"{self.name}{_labels(self.label_names, labels)} {_number(value)}"
+
+
+class TrafficCounter:
+    """A request counter and a byte counter over the same labels, kept in one dict entry.
+
+    The feed routes update both on every request, so this halves their lookups;
+    record() also takes the route's latency observation in the same call.
+    """
+
+    __slots__ = ("requests", "bytes", "label_names", "_values")
+
+    def __init__(
+        self, requests: tuple[str, str], bytes: tuple[str, str], label_names: tuple[str, ...]
+    ):
+        # (name, description) of each rendered counter
+        self.requests = requests
+        self.bytes = bytes
+        self.label_names = label_names
+        self._values: dict[tuple[str, ...], list[int]] = {}
+
+    def add(self, labels: tuple[str, ...], size: int) -> None:
+        values = self._values.get(labels)
+        if values is None:
+            values = self._values[labels] = [0, 0]
+        values[0] += 1
+        values[1] += size
+
+    def record(
+        self, labels: tuple[str, ...], size: int, latency: "HistogramSeries", seconds: float
+    ) -> None:
+        """add(labels, size) and latency.observe(seconds), without the second call."""
+        values = self._values.get(labels)
+        if values is None:
+            values = self._values[labels] = [0, 0]
+        values[0] += 1
+        values[1] += size
+        series = latency.values
+        series[bisect_left(latency.buckets, seconds)] += 1
+        series[-1] += seconds
+
+    def value(self, *labels: str) -> tuple[int, int]:
+        return tuple(self._values.get(labels, (0, 0)))
+
+    def render(self) -> Iterable[str]:
+        items = sorted(self._values.items())
+        for index, (name, description) in enumerate((self.requests, self.bytes)):
+            yield f"# HELP {name} {description}"
+            yield f"# TYPE {name} counter"
+            for labels, values in items:
+                yield f"{name}{_labels(self.label_names, labels)} {values[index]}"
+
+
+class Histogram:
+    __slots__ = ("name", "description", "label_names", "buckets", "_series")
+
+    def __init__(
+        self,
+        name: str,
+        description: str,
+        label_names: tuple[str, ...] = (),
+        buckets: tuple[float, ...] = LATENCY_BUCKETS,
+    ):
+        self.name = name
+        self.description = description
+        self.label_names = label_names
+        self.buckets = buckets
+        # Per label set: a count per bucket (non-cumulative), one for +Inf, then the sum
+        self._series: dict[tuple[str, ...], list] = {}
+
+    def _values(self, labels: tuple[str, ...]) -> list:
+        series = self._series.get(labels)
+        if series is None:
+            series = self._series[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+        return series
+
+    def observe(self, value: float, *labels: str) -> None:
+        series = self._values(labels)
+        series[bisect_left(self.buckets, value)] += 1
+        series[-1] += value
+
+    def labels(self, *labels: str) -> "HistogramSeries":
+        """Bind one label set ahead of time, saving the lookup on every observation."""
+        return HistogramSeries(self.buckets, self._values(labels))
+
+    def count(self, *labels: str) -> int:
+        return sum(self._series.get(labels, [0])[:-1])
+
+    def render(self) -> Iterable[str]:
+        yield f"# HELP {self.name} {self.description}"
+        yield f"# TYPE {self.name} histogram"
+        for labels, series in sorted(self._series.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets, series):
+                cumulative += count
+                le = _labels(self.label_names, labels, f'le="{bound}"')
+                yield f"{self.name}_bucket{le} {cumulative}"
+            cumulative += series[-2]
+            le = _labels(self.label_names, labels, 'le="+Inf"')
+            yield f"{self.name}_bucket{le} {cumulative}"
+            plain = _labels(self.label_names, labels)
+            yield f"{self.name}_sum{plain} {_number(series[-1])}"
+            yield f"{self.name}_count{plain} {cumulative}"
+
+
+class HistogramSeries:
+    __slots__ = ("buckets", "values")
+
+    def __init__(self, buckets: tuple[float, ...], values: list):
+        self.buckets = buckets
+        self.values = values
+
+    def observe(self, value: float) -> None:
+        values = self.values
+        values[bisect_left(self.buckets, value)] += 1
+        values[-1] += value
+
+
+REQUEST_SECONDS = Histogram(
+    "feeds_request_duration_seconds", "Handler time for cached routes", ("route",)
+)
+FEED_TRAFFIC = TrafficCounter(
+    ("feeds_tag_requests_total", "Feed requests per source and tag"),
+    ("feeds_tag_response_bytes_total", "Feed body bytes sent per source and tag (304s send none)"),
+    ("source", "tag"),
+)
+NOT_MODIFIED = Counter("feeds_not_modified_total", "304 responses per route", ("route",))
+REFRESH_SECONDS = Histogram(
+    "feeds_refresh_stage_duration_seconds",
+    "Refresh time per stage (discover, download, parse, build, install)",
+    ("stage",),
+)
+REFRESHES = Counter(
+    "feeds_refreshes_total", "Refresh outcomes (updated, unchanged, error)", ("result",)
+)
+UPSTREAM_BYTES = Histogram(
+    "feeds_upstream_response_bytes", "Size of downloaded ServiceTags bodies", buckets=SIZE_BUCKETS
+)
+
+METRICS = (
+    REQUEST_SECONDS, FEED_TRAFFIC, NOT_MODIFIED,
+    REFRESH_SECONDS, REFRESHES, UPSTREAM_BYTES,
+)
+
+
+def render(metrics: Iterable[Counter | TrafficCounter | Histogram] = METRICS) -> bytes:
+    return ("\n".join(line for metric in metrics for line in metric.render()) + "\n").encode()
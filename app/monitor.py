@@ -0,0 +1,29 @@
+import asyncio
+from collections import deque
+
+
+class LoopLagMonitor:
+    """Measures event-loop lag: how late a periodic timer fires compared to when it was due.
+
+    Anything that blocks the loop (parsing, index building) shows up here directly
+    as added latency for every in-flight request.
+    """
+
+    def __init__(self, interval: float = 0.25, window: int = 240):
+        self.interval = interval
+        self._samples: deque[float] = deque(maxlen=window)
+
+    async def run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            due = loop.time() + self.interval
+            await asyncio.sleep(self.interval)
+            self._samples.append(max(0.0, loop.time() - due))
+
+    def stats(self) -> dict[str, float | None]:
+        if not self._samples:
+            return {"last_ms": None, "max_ms": None}
+        return {
+            "last_ms": round(self._samples[-1] * 1e3, 3),
+            "max_ms": round(max(self._samples) * 1e3, 3),
+        }
@@ -0,0 +1,111 @@
+from collections.abc import Mapping
+from datetime import datetime
+from email.utils import format_datetime, parsedate_to_datetime
+
+
+def http_date(value: datetime) -> str:
+    return format_datetime(value, usegmt=True)
+
+
+def etag_matches(if_none_match: str, etag: str) -> bool:
+    # If-None-Match uses the weak comparison function (RFC 9110 §13.1.2)
+    if if_none_match.strip() == "*":
+        return True
+    opaque = etag.removeprefix("W/")
+    for candidate in if_none_match.split(","):
+        if candidate.strip().removeprefix("W/") == opaque:
+            return True
+    return False
+
+
+def is_not_modified(
+    headers: Mapping[str, str], etag: str, last_modified: datetime | None
+) -> bool:
+    if_none_match = headers.get("if-none-match")
+    if if_none_match is not None:
+        # If-Modified-Since is ignored when If-None-Match is present
+        return etag_matches(if_none_match, etag)
+    if_modified_since = headers.get("if-modified-since")
+    if if_modified_since is None or last_modified is None:
+        return False
+    try:
+        since = parsedate_to_datetime(if_modified_since)
+    except (TypeError, ValueError):
+        return False
+    if since.tzinfo is None:
+        return False
+    return last_modified.replace(microsecond=0) <= since
+
+
+class RangeNotSatisfiable(ValueError):
+    pass
+
+
+def byte_range(
+    headers: Mapping[str, str], etag: str, size: int
+) -> tuple[int, int] | None:
+    """The (start, stop) slice a Range request asks for, or None to send the full body.
+
+    Only single byte ranges are served; multi-range requests, unknown units and
+    an If-Range that does not match the current ETag all fall back to a 200
+    (RFC 9110 §14.2). Raises RangeNotSatisfiable if no requested byte exists.
+    """
+    header = headers.get("range")
+    if header is None:
+        return None
+    if_range = headers.get("if-range")
+    # If-Range needs the strong comparison; dates are not honoured
+    if if_range is not None and (if_range.strip() != etag or etag.startswith("W/")):
+        return None
+    unit, _, spec = header.partition("=")
+    if unit.strip().lower() != "bytes" or "," in spec:
+        return None
+    first, sep, last = spec.strip().partition("-")
+    if not sep or not (first.isdigit() or last.isdigit()):
+        return None
+    if (first and not first.isdigit()) or (last and not last.isdigit()):
+        return None
+    if not first:
+        # Suffix range: the last N bytes
+        length = int(last)
+        if length == 0 or size == 0:
+            raise RangeNotSatisfiable
+        return max(size - length, 0), size
+    start = int(first)
+    if start >= size:
+        raise RangeNotSatisfiable
+    stop = size if not last else min(int(last) + 1, size)
+    if stop <= start:
+        return None
+    return start, stop
+
+
+# Server preference when the client weights several codings equally
+ENCODING_PREFERENCE = ("br", "gzip")
+
+
+def choose_encoding(
+    accept_encoding: str | None, available: Mapping[str, bytes | memoryview]
+) -> str | None:
+    if not accept_encoding or not available:
+        return None
+    weights: dict[str, float] = {}
+    for item in accept_encoding.split(","):
+        coding, _, params = item.strip().partition(";")
+        quality = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        weights[coding.strip().lower()] = quality
+    wildcard = weights.get("*", 0.0)
+    best, best_quality = None, 0.0
+    for coding in ENCODING_PREFERENCE:
+        if coding not in available:
+            continue
+        quality = weights.get(coding, wildcard)
+        if quality > best_quality:
+            best, best_quality = coding, quality
+    return best
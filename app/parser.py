@@ -0,0 +1,119 @@
+import codecs
+import json
+import re
+
+from app.cache import compact_entry
+
+_WHITESPACE = re.compile(r"[ \t\n\r]*")
+_DECODER = json.JSONDecoder()
+
+
+class ServiceTagsParser:
+    """Incremental parser for the ServiceTags JSON document.
+
+    Bytes are fed as they arrive; each element of the top-level ``values``
+    array is decoded on its own and immediately reduced with
+    ``compact_entry``, so neither the raw body nor the full object tree is
+    ever held in memory. Other top-level keys (``changeNumber``, ``cloud``)
+    are kept as-is.
+    """
+
+    def __init__(self):
+        self._decoder = codecs.getincrementaldecoder("utf-8")()
+        self._buffer = ""
+        self._pos = 0
+        self._state = "start"
+        self._key: str | None = None
+        # Set while an entry object is incomplete: it cannot finish without a "}"
+        self._entry_open = False
+        self.header: dict = {}
+        self.values: list[dict] = []
+
+    def feed(self, chunk: bytes) -> None:
+        text = self._decoder.decode(chunk)
+        self._buffer = self._buffer[self._pos:] + text
+        self._pos = 0
+        if self._entry_open and "}" not in text:
+            return
+        self._parse(final=False)
+
+    def close(self) -> dict:
+        self._buffer = self._buffer[self._pos:] + self._decoder.decode(b"", final=True)
+        self._pos = 0
+        self._parse(final=True)
+        if self._state != "done":
+            raise ValueError("Truncated ServiceTags document")
+        if self._buffer[self._pos:].strip():
+            raise ValueError("Unexpected data after ServiceTags document")
+        return {**self.header, "values": self.values}
+
+    def _skip(self) -> str:
+        self._pos = _WHITESPACE.match(self._buffer, self._pos).end()
+        return self._buffer[self._pos:self._pos + 1]
+
+    def _decode(self, final: bool):
+        """Decode one JSON value at the cursor; raise EOFError if more input is needed."""
+        try:
+            value, end = _DECODER.raw_decode(self._buffer, self._pos)
+        except json.JSONDecodeError:
+            if final:
+                raise
+            raise EOFError from None
+        if end == len(self._buffer) and not final:
+            # A number or literal may continue in the next chunk
+            raise EOFError
+        self._pos = end
+        return value
+
+    def _expect(self, char: str) -> None:
+        if self._skip() != char:
+            raise ValueError(f"Expected {char!r} at offset {self._pos} of buffered ServiceTags data")
+        self._pos += 1
+
+    def _parse(self, final: bool) -> None:
+        try:
+            while self._state != "done":
+                char = self._skip()
+                if not char:
+                    return
+                if self._state == "start":
+                    self._expect("{")
+                    self._state = "key"
+                elif self._state == "key":
+                    if char == "}":
+                        self._pos += 1
+                        self._state = "done"
+                        continue
+                    if char == ",":
+                        self._pos += 1
+                        continue
+                    key = self._decode(final)
+                    if not isinstance(key, str):
+                        raise ValueError("ServiceTags object key must be a string")
+                    self._key = key
+                    self._state = "colon"
+                elif self._state == "colon":
+                    self._expect(":")
+                    self._state = "values" if self._key == "values" else "value"
+                elif self._state == "value":
+                    self.header[self._key] = self._decode(final)
+                    self._state = "key"
+                elif self._state == "values":
+                    self._expect("[")
+                    self._state = "entry"
+                elif self._state == "entry":
+                    if char == "]":
+                        self._pos += 1
+                        self._state = "key"
+                        continue
+                    if char == ",":
+                        self._pos += 1
+                        continue
+                    self._entry_open = True
+                    entry = self._decode(final)
+                    self._entry_open = False
+                    if not isinstance(entry, dict) or "name" not in entry:
+                        raise ValueError("ServiceTags entry without a name")
+                    self.values.append(compact_entry(entry))
+        except EOFError:
+            return
@@ -0,0 +1,91 @@
+from array import array
+from collections.abc import Iterable, Iterator
+
+from app.ranges import Network, format_prefix, parse_cidr
+
+_LOW_64 = (1 << 64) - 1
+
+# (version, network address, prefix length)
+Cidr = tuple[int, int, int]
+
+
+class PackedPrefixes:
+    """A tag's prefixes as packed integer arrays, split by address family.
+
+    IPv4 networks are 32-bit integers and IPv6 networks are split into high and
+    low 64-bit halves, with one byte per prefix length. That is roughly 5 and 17
+    bytes per prefix instead of a Python str (~60 bytes) plus its parsed form.
+    Source order is kept within each family (IPv4 first); text is rendered only
+    on demand. Unparseable prefixes are dropped.
+    """
+
+    __slots__ = ("v4", "v4_len", "v6_hi", "v6_lo", "v6_len")
+
+    def __init__(self):
+        self.v4 = array("I")
+        self.v4_len = array("B")
+        self.v6_hi = array("Q")
+        self.v6_lo = array("Q")
+        self.v6_len = array("B")
+
+    @classmethod
+    def from_strings(cls, prefixes: Iterable[str]) -> "PackedPrefixes":
+        packed = cls()
+        for prefix in prefixes:
+            parsed = parse_cidr(prefix)
+            if parsed is None:
+                continue
+            version, network, prefix_len = parsed
+            if version == 4:
+                packed.v4.append(network)
+                packed.v4_len.append(prefix_len)
+            else:
+                packed.v6_hi.append(network >> 64)
+                packed.v6_lo.append(network & _LOW_64)
+                packed.v6_len.append(prefix_len)
+        return packed
+
+    @classmethod
+    def from_buffers(cls, buffers: Iterable[bytes | memoryview]) -> "PackedPrefixes":
+        """Rebuild from the raw bytes of each array in buffers() order."""
+        packed = cls()
+        for name, buffer in zip(cls.__slots__, buffers, strict=True):
+            getattr(packed, name).frombytes(buffer)
+        return packed
+
+    def buffers(self) -> tuple[array, ...]:
+        return tuple(getattr(self, name) for name in self.__slots__)
+
+    def __len__(self) -> int:
+        return len(self.v4) + len(self.v6_len)
+
+    def __eq__(self, other: object) -> bool:
+        if not isinstance(other, PackedPrefixes):
+            return NotImplemented
+        return all(getattr(self, name) == getattr(other, name) for name in self.__slots__)
+
+    @property
+    def ipv4_count(self) -> int:
+        return len(self.v4)
+
+    @property
+    def nbytes(self) -> int:
+        return sum(len(a) * a.itemsize for a in (getattr(self, name) for name in self.__slots__))
+
+    def cidrs(self, include_ipv6: bool = True) -> Iterator[Cidr]:
+        for network, prefix_len in zip(self.v4, self.v4_len):
+            yield 4, network, prefix_len
+        if include_ipv6:
+            for hi, lo, prefix_len in zip(self.v6_hi, self.v6_lo, self.v6_len):
+                yield 6, hi << 64 | lo, prefix_len
+
+    def networks(self, include_ipv6: bool = True) -> Iterator[Network]:
+        for network, prefix_len in zip(self.v4, self.v4_len):
+            yield 4, network, network | ((1 << (32 - prefix_len)) - 1)
+        if include_ipv6:
+            for hi, lo, prefix_len in zip(self.v6_hi, self.v6_lo, self.v6_len):
+                network = hi << 64 | lo
+                yield 6, network, network | ((1 << (128 - prefix_len)) - 1)
+
+    def texts(self, include_ipv6: bool = True) -> list[str]:
+        return [format_prefix(*cidr) for cidr in self.cidrs(include_ipv6)]
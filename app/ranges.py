@@ -0,0 +1,229 @@
+import ipaddress
+from array import array
+from bisect import bisect_left, bisect_right
+from collections import Counter
+from collections.abc import Iterable, Mapping, Sequence
+
+# (version, first address, last address) with the addresses as integers
+Network = tuple[int, int, int]
+
+ADDRESS_BITS = {4: 32, 6: 128}
+_LOW_64 = (1 << 64) - 1
+
+
+def _parse_ipv4(address: str) -> int | None:
+    # Fast path for the common case; same acceptance rules as ipaddress.IPv4Address
+    octets = address.split(".")
+    if len(octets) != 4:
+        return None
+    value = 0
+    for octet in octets:
+        if not (octet.isascii() and octet.isdigit()) or len(octet) > 3:
+            return None
+        if len(octet) > 1 and octet[0] == "0":
+            return None
+        number = int(octet)
+        if number > 255:
+            return None
+        value = value << 8 | number
+    return value
+
+
+def parse_cidr(prefix: str) -> tuple[int, int, int] | None:
+    """Parse a prefix into (version, network address, prefix length); host bits are cleared."""
+    address, sep, length = prefix.partition("/")
+    if ":" in address:
+        try:
+            value = int(ipaddress.IPv6Address(address))
+        except ValueError:
+            return None
+        version = 6
+    else:
+        value = _parse_ipv4(address)
+        if value is None:
+            return None
+        version = 4
+    bits = ADDRESS_BITS[version]
+    if not sep:
+        prefix_len = bits
+    elif length.isascii() and length.isdigit() and int(length) <= bits:
+        prefix_len = int(length)
+    else:
+        return None
+    return version, value & ~((1 << (bits - prefix_len)) - 1), prefix_len
+
+
+def parse_prefix(prefix: str) -> Network | None:
+    parsed = parse_cidr(prefix)
+    if parsed is None:
+        return None
+    version, start, prefix_len = parsed
+    return version, start, start | ((1 << (ADDRESS_BITS[version] - prefix_len)) - 1)
+
+
+def format_prefix(version: int, start: int, prefix_len: int) -> str:
+    if version == 4:
+        return f"{start >> 24}.{start >> 16 & 255}.{start >> 8 & 255}.{start & 255}/{prefix_len}"
+    return f"{ipaddress.IPv6Address(start)}/{prefix_len}"
+
+
+def collapse(ranges: Iterable[tuple[int, int]]) -> list[tuple[int, int]]:
+    """Merge overlapping and adjacent (start, end) ranges into a sorted disjoint list."""
+    merged: list[tuple[int, int]] = []
+    for start, end in sorted(ranges):
+        if merged and start <= merged[-1][1] + 1:
+            if end > merged[-1][1]:
+                merged[-1] = (merged[-1][0], end)
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def subtract(
+    ranges: list[tuple[int, int]], removed: list[tuple[int, int]]
+) -> list[tuple[int, int]]:
+    """Remove one sorted disjoint range list from another."""
+    result: list[tuple[int, int]] = []
+    j = 0
+    for start, end in ranges:
+        while j < len(removed) and removed[j][1] < start:
+            j += 1
+        k = j
+        while start <= end and k < len(removed) and removed[k][0] <= end:
+            cut_start, cut_end = removed[k]
+            if cut_start > start:
+                result.append((start, cut_start - 1))
+            start = max(start, cut_end + 1)
+            k += 1
+        if start <= end:
+            result.append((start, end))
+    return result
+
+
+def range_to_prefixes(version: int, start: int, end: int) -> list[str]:
+    """Minimal CIDR cover of the inclusive range [start, end]."""
+    bits = ADDRESS_BITS[version]
+    prefixes = []
+    while start <= end:
+        # Largest block aligned at start that does not overrun end
+        size = start & -start if start else 1 << bits
+        while size > end - start + 1:
+            size >>= 1
+        prefixes.append(format_prefix(version, start, bits - size.bit_length() + 1))
+        start += size
+    return prefixes
+
+
+def aggregate(networks: Iterable[Network], excluded: Iterable[Network] = ()) -> list[str]:
+    """Collapse networks, minus any excluded ones, to their minimal CIDR set.
+
+    IPv4 prefixes come before IPv6.
+    """
+    by_version: dict[int, list[tuple[int, int]]] = {4: [], 6: []}
+    for version, start, end in networks:
+        by_version[version].append((start, end))
+    removed: dict[int, list[tuple[int, int]]] = {4: [], 6: []}
+    for version, start, end in excluded:
+        removed[version].append((start, end))
+    return [
+        prefix
+        for version, ranges in by_version.items()
+        for start, end in subtract(collapse(ranges), collapse(removed[version]))
+        for prefix in range_to_prefixes(version, start, end)
+    ]
+
+
+def parse_address(address: str) -> tuple[int, int] | None:
+    try:
+        ip = ipaddress.ip_address(address.strip())
+    except ValueError:
+        return None
+    return ip.version, int(ip)
+
+
+class IntervalIndex:
+    """Maps an address to every label whose ranges contain it.
+
+    The address space is cut into elementary segments at every range boundary;
+    each segment stores the id of the label set covering it, so a lookup is a
+    bisect over the sorted segment starts. Starts and ids are flat integer
+    arrays (IPv6 starts as high and low 64-bit halves), so an index can be
+    saved and mapped back as is; see arrays().
+    """
+
+    def __init__(self, labelled: Iterable[tuple[str, Network]]):
+        events: dict[int, list[tuple[int, int, str]]] = {4: [], 6: []}
+        for label, (version, start, end) in labelled:
+            events[version].append((start, 1, label))
+            events[version].append((end + 1, -1, label))
+        ids: dict[tuple[str, ...], int] = {(): 0}
+        self.sets: list[tuple[str, ...]] = [()]
+        segments: dict[int, tuple[list[int], array]] = {}
+        for version, family_events in events.items():
+            family_events.sort()
+            starts: list[int] = []
+            labels = array("I")
+            active: Counter[str] = Counter()
+            i = 0
+            while i < len(family_events):
+                position = family_events[i][0]
+                while i < len(family_events) and family_events[i][0] == position:
+                    _, delta, label = family_events[i]
+                    active[label] += delta
+                    if not active[label]:
+                        del active[label]
+                    i += 1
+                current = tuple(sorted(active))
+                set_id = ids.get(current)
+                if set_id is None:
+                    set_id = ids[current] = len(self.sets)
+                    self.sets.append(current)
+                if labels and labels[-1] == set_id:
+                    continue
+                if position >> ADDRESS_BITS[version]:
+                    # Past the last address: unreachable, and too wide for the arrays
+                    continue
+                starts.append(position)
+                labels.append(set_id)
+            segments[version] = starts, labels
+        v4_starts, v6_starts = segments[4][0], segments[6][0]
+        self._arrays: dict[str, Sequence[int]] = {
+            "v4_starts": array("Q", v4_starts),
+            "v4_labels": segments[4][1],
+            "v6_hi": array("Q", (start >> 64 for start in v6_starts)),
+            "v6_lo": array("Q", (start & _LOW_64 for start in v6_starts)),
+            "v6_labels": segments[6][1],
+        }
+
+    @classmethod
+    def from_arrays(
+        cls, sets: Sequence[tuple[str, ...]], arrays: Mapping[str, Sequence[int]]
+    ) -> "IntervalIndex":
+        """Rebuild from another index's sets and arrays(), e.g. memoryviews of a mapped file."""
+        index = cls.__new__(cls)
+        index.sets = list(sets)
+        index._arrays = dict(arrays)
+        return index
+
+    def arrays(self) -> dict[str, Sequence[int]]:
+        """Segment starts (unsigned 64-bit) and label set ids (unsigned 32-bit) by family."""
+        return self._arrays
+
+    def lookup(self, version: int, address: int) -> tuple[str, ...]:
+        arrays = self._arrays
+        if version == 4:
+            i = bisect_right(arrays["v4_starts"], address)
+            labels = arrays["v4_labels"]
+        else:
+            # Starts are ordered by (high, low): narrow to the equal highs, then bisect the lows
+            high, low = address >> 64, address & _LOW_64
+            hi = arrays["v6_hi"]
+            first = bisect_left(hi, high)
+            i = bisect_right(arrays["v6_lo"], low, first, bisect_right(hi, high, first))
+            labels = arrays["v6_labels"]
+        if i == 0:
+            return ()
+        return self.sets[labels[i - 1]]
+
+    def __len__(self) -> int:
+        return len(self._arrays["v4_starts"]) + len(self._arrays["v6_hi"])
@@ -0,0 +1,127 @@
+import math
+import re
+import time
+from collections import OrderedDict
+from collections.abc import Callable, Hashable, Mapping
+from dataclasses import dataclass
+from functools import wraps
+
+from fastapi import HTTPException, Request
+
+PERIODS = {"second": 1, "minute": 60, "hour": 3600, "day": 86400}
+RATE_PATTERN = re.compile(r"^\s*(\d+)\s*/\s*(second|minute|hour|day)\s*$")
+
+
+@dataclass(frozen=True)
+class Rate:
+    count: int
+    period: int
+
+    @classmethod
+    def parse(cls, text: str) -> "Rate":
+        """Parse "60/minute" style limits."""
+        match = RATE_PATTERN.match(text)
+        if match is None or int(match[1]) < 1:
+            raise ValueError(f"Invalid rate: {text!r}")
+        return cls(int(match[1]), PERIODS[match[2]])
+
+    def __str__(self) -> str:
+        name = next(name for name, seconds in PERIODS.items() if seconds == self.period)
+        return f"{self.count} per 1 {name}"
+
+
+class RateLimiter:
+    """Per-client limits in constant time and bounded memory.
+
+    Each (client, key) pair stores a single float, its GCRA theoretical arrival
+    time: equivalent to a token bucket holding rate.count requests that refills
+    continuously over rate.period. The key is the route's path template unless
+    the caller passes one, so request paths (which clients choose freely) never
+    become keys on their own. Entries live in an LRU capped at max_keys; the
+    least recently seen client is dropped first, which at worst gives it a full
+    bucket again.
+
+    A client is its API token when the token has a quota, so devices behind one
+    NAT address stop sharing a limit; otherwise it is the source address.
+    """
+
+    def __init__(
+        self,
+        max_keys: int = 100_000,
+        quotas: Mapping[str, int] | None = None,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.max_keys = max_keys
+        # API token -> requests per minute, replacing the route's own limit
+        self.quotas = quotas if quotas is not None else {}
+        self.enabled = True
+        self.evicted = 0
+        self._clock = clock
+        self._arrivals: OrderedDict[Hashable, float] = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._arrivals)
+
+    def hit(self, key: Hashable, rate: Rate) -> float:
+        """Count one request; return 0.0 if allowed, else the seconds until it would be."""
+        now = self._clock()
+        arrivals = self._arrivals
+        interval = rate.period / rate.count
+        arrival = arrivals.get(key)
+        if arrival is None:
+            arrival = now
+            if len(arrivals) >= self.max_keys:
+                arrivals.popitem(last=False)
+                self.evicted += 1
+        else:
+            arrivals.move_to_end(key)
+            if arrival < now:
+                arrival = now
+        wait = arrival + interval - now - rate.period
+        if wait > 0:
+            return wait
+        arrivals[key] = arrival + interval
+        return 0.0
+
+    def check(self, request: Request, rate: Rate, key: str | None = None) -> None:
+        """Raise a 429 with Retry-After if the request's client is over its limit.
+
+        key defaults to the matched route's template, e.g. "/diff/{service_tag}";
+        callers outside routing pass one from a bounded set.
+        """
+        if not self.enabled:
+            return
+        if key is None:
+            key = request.scope["route"].path
+        token = request.query_params.get("token")
+        quota = self.quotas.get(token) if token else None
+        if quota is not None:
+            client = f"token:{token}"
+            rate = Rate(quota, PERIODS["minute"])
+        else:
+            client = request.client.host if request.client else "127.0.0.1"
+        wait = self.hit((client, key), rate)
+        if wait:
+            raise HTTPException(
+                status_code=429,
+                detail=f"Rate limit exceeded: {rate}",
+                headers={"Retry-After": str(math.ceil(wait))},
+            )
+
+    def limit(self, rate: Rate | str) -> Callable:
+        """Decorate a route taking a `request` argument; checked after its dependencies."""
+        if isinstance(rate, str):
+            rate = Rate.parse(rate)
+
+        def decorator(func: Callable) -> Callable:
+            @wraps(func)
+            async def wrapper(*args, request: Request, **kwargs):
+                self.check(request, rate)
+                return await func(*args, request=request, **kwargs)
+
+            return wrapper
+
+        return decorator
+
+    def stats(self) -> dict[str, int]:
+        return {"tracked": len(self._arrivals), "max": self.max_keys, "evicted": self.evicted}
@@ -0,0 +1,116 @@
+import asyncio
+import logging
+import random
+import time
+from collections.abc import Awaitable, Callable
+from datetime import datetime, timedelta, timezone
+from typing import TypeVar
+
+logger = logging.getLogger(__name__)
+
+# Called with force=True when a full conditional revalidation is due
+Refresh = Callable[[bool], Awaitable[None]]
+T = TypeVar("T")
+
+
+class RefreshScheduler:
+    """Decides when to poll upstream while the last good snapshot keeps being served.
+
+    Every check_interval a cheap check runs (the download URL is scraped and the
+    file is only fetched if it changed). Once per revalidate_interval the check
+    is forced into a conditional GET instead. After a failure the next attempt
+    follows exponential backoff with full jitter, capped at check_interval, so a
+    transient outage costs minutes of staleness rather than a whole interval.
+    """
+
+    def __init__(
+        self,
+        check_interval: float,
+        revalidate_interval: float,
+        retry_base: float,
+        rng: random.Random | None = None,
+    ):
+        self.check_interval = check_interval
+        self.revalidate_interval = revalidate_interval
+        self.retry_base = retry_base
+        self._rng = rng or random.Random()
+        self._last_revalidated = time.monotonic()
+        self.consecutive_failures = 0
+        self.last_error: str | None = None
+        self.last_success: datetime | None = None
+        self.next_refresh: datetime | None = None
+
+    def retry_delay(self) -> float:
+        ceiling = self.retry_base * 2 ** max(self.consecutive_failures - 1, 0)
+        return self._rng.uniform(0, min(ceiling, self.check_interval))
+
+    def next_delay(self) -> float:
+        return self.retry_delay() if self.consecutive_failures else self.check_interval
+
+    def revalidation_due(self) -> bool:
+        return time.monotonic() - self._last_revalidated >= self.revalidate_interval
+
+    async def run_once(self, refresh: Refresh) -> bool:
+        force = self.revalidation_due()
+        try:
+            await refresh(force)
+        except Exception as exc:
+            self.consecutive_failures += 1
+            self.last_error = f"{type(exc).__name__}: {exc}"
+            logger.exception(
+                "Cache refresh failed (%d consecutive failures)", self.consecutive_failures
+            )
+            return False
+        self.consecutive_failures = 0
+        self.last_error = None
+        self.last_success = datetime.now(timezone.utc)
+        if force:
+            self._last_revalidated = time.monotonic()
+        return True
+
+    async def sleep(self, delay: float) -> None:
+        self.next_refresh = datetime.now(timezone.utc) + timedelta(seconds=delay)
+        await asyncio.sleep(delay)
+
+    async def run(self, refresh: Refresh) -> None:
+        while True:
+            await self.sleep(self.next_delay())
+            await self.run_once(refresh)
+
+    def stats(self, data_refreshed_at: datetime | None) -> dict:
+        """Health view; staleness counts from the last time upstream confirmed the data."""
+        confirmed = max(
+            (t for t in (self.last_success, data_refreshed_at) if t is not None), default=None
+        )
+        staleness = (
+            None if confirmed is None
+            else (datetime.now(timezone.utc) - confirmed).total_seconds()
+        )
+        return {
+            "next_refresh": self.next_refresh.isoformat() if self.next_refresh else None,
+            "last_success": self.last_success.isoformat() if self.last_success else None,
+            "staleness_seconds": None if staleness is None else round(staleness, 1),
+            "stale": staleness is None or staleness > self.revalidate_interval,
+            "consecutive_failures": self.consecutive_failures,
+            "last_error": self.last_error,
+        }
+
+
+class SingleFlight:
+    """Coalesces concurrent calls into one in-flight run whose outcome every caller shares.
+
+    The shared run is shielded, so a caller that goes away (say, a disconnected
+    client) does not cancel it for the others.
+    """
+
+    def __init__(self):
+        self._task: asyncio.Task | None = None
+
+    @property
+    def in_flight(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    async def run(self, func: Callable[[], Awaitable[T]]) -> T:
+        if not self.in_flight:
+            self._task = asyncio.ensure_future(func())
+        return await asyncio.shield(self._task)
@@ -0,0 +1,87 @@
+import logging
+import os
+from pathlib import Path
+
+from app.snapshot import PersistedSnapshot, load_snapshot
+
+try:
+    import fcntl
+except ImportError:  # Windows: multi-worker mode is unavailable
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+LOCK_FILENAME = "leader.lock"
+
+
+class LeaderLock:
+    """Non-blocking exclusive file lock electing the one worker that fetches upstream.
+
+    The lock is tied to the open file descriptor, so the OS releases it when the
+    leader process exits and a follower can take over.
+    """
+
+    def __init__(self, path: Path):
+        if fcntl is None:
+            raise RuntimeError("Shared snapshot mode requires fcntl (Linux/macOS)")
+        self.path = path
+        self._fd: int | None = None
+
+    @property
+    def held(self) -> bool:
+        return self._fd is not None
+
+    def try_acquire(self) -> bool:
+        if self._fd is not None:
+            return True
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            os.close(fd)
+            return False
+        os.ftruncate(fd, 0)
+        os.write(fd, f"{os.getpid()}\n".encode())
+        self._fd = fd
+        logger.info("Worker %d elected as refresh leader", os.getpid())
+        return True
+
+    def release(self) -> None:
+        if self._fd is not None:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+            os.close(self._fd)
+            self._fd = None
+
+
+class SnapshotWatcher:
+    """Detects snapshots published by the leader via their generation number.
+
+    A stat() is the only cost per poll; the file is read only when its
+    identity changes (the leader always publishes with an atomic rename).
+    Given the cache's shard_size, the leader's rendered feeds are mapped
+    instead of reading the JSON (see load_snapshot).
+    """
+
+    def __init__(self, path: Path, shard_size: int | None = None):
+        self.path = path
+        self.shard_size = shard_size
+        self.generation: int | None = None
+        self._signature: tuple[int, int, int] | None = None
+
+    def poll(self) -> PersistedSnapshot | None:
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        signature = (st.st_ino, st.st_mtime_ns, st.st_size)
+        if signature == self._signature:
+            return None
+        restored = load_snapshot(self.path, self.shard_size)
+        if restored is None:
+            return None
+        self._signature = signature
+        if self.generation is not None and restored.generation <= self.generation:
+            return None
+        self.generation = restored.generation
+        return restored
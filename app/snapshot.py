@@ -0,0 +1,308 @@
+import json
+import logging
+import mmap
+import os
+import sys
+import tempfile
+import time
+from collections.abc import Callable
+from dataclasses import dataclass, field
+from datetime import datetime
+from pathlib import Path
+from typing import BinaryIO
+
+from app.cache import (
+    FeedBody, FeedCache, RenderedFeeds, Snapshot, TagFeed, TagMetadata, compact_entry,
+)
+from app.prefixes import PackedPrefixes
+from app.ranges import IntervalIndex
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_FILENAME = "snapshot.json"
+RENDERED_MAGIC = b"FEEDS01\n"
+# Chunks of the rendered feeds file start at multiples of this, so integer arrays map in place
+RENDERED_ALIGNMENT = 8
+
+
+def compact(data: dict) -> dict:
+    # Only what FeedCache.load reads is persisted
+    return {
+        "changeNumber": data["changeNumber"],
+        "cloud": data.get("cloud"),
+        "values": [compact_entry(entry) for entry in data.get("values", [])],
+    }
+
+
+@dataclass
+class PersistedSnapshot:
+    # The compacted upstream document; None when restored from rendered feeds
+    data: dict | None
+    refreshed_at: datetime | None = None
+    # Upstream validators (download URL, ETag, Last-Modified) for conditional refreshes
+    source: dict = field(default_factory=dict)
+    # Increases with every save; lets other workers spot a newly published snapshot
+    generation: int = 0
+    # Feeds rendered by the process that saved it, mapped from the rendered file
+    rendered: RenderedFeeds | None = None
+
+    def build(self, cache: FeedCache) -> Snapshot:
+        """The snapshot to install: mapped feeds if there are any, else rendered from data."""
+        if self.rendered is not None:
+            return cache.attach(self.rendered)
+        return cache.build(self.data)
+
+
+def rendered_path(path: Path) -> Path:
+    return path.with_suffix(".bin")
+
+
+def _write_atomic(path: Path, write: Callable[[BinaryIO], None]) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    # Write-then-rename so a crash never leaves a truncated file behind
+    fd, tmp_name = tempfile.mkstemp(dir=path.parent, prefix=f".{path.name}.", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            write(f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_name, path)
+    except BaseException:
+        Path(tmp_name).unlink(missing_ok=True)
+        raise
+
+
+def save_snapshot(
+    path: Path,
+    data: dict,
+    refreshed_at: datetime,
+    source: dict | None = None,
+    rendered: Snapshot | None = None,
+) -> None:
+    """Persist data, and the snapshot built from it if given, under one generation.
+
+    The rendered file is replaced first, so a reader that sees the new JSON
+    finds its rendered feeds (or, in a race, newer ones). Without a snapshot
+    the rendered file is removed, so stale feeds are never preferred.
+    """
+    payload = compact(data)
+    payload["refreshedAt"] = refreshed_at.isoformat()
+    payload["source"] = source or {}
+    payload["generation"] = time.time_ns()
+    if rendered is not None:
+        save_rendered(
+            rendered_path(path), rendered, payload["generation"], refreshed_at, payload["source"]
+        )
+    else:
+        rendered_path(path).unlink(missing_ok=True)
+    encoded = json.dumps(payload, separators=(",", ":")).encode()
+    _write_atomic(path, lambda f: f.write(encoded))
+    logger.info("Saved snapshot changeNumber=%s to %s", data["changeNumber"], path)
+
+
+def save_rendered(
+    path: Path,
+    snapshot: Snapshot,
+    generation: int,
+    refreshed_at: datetime | None = None,
+    source: dict | None = None,
+) -> None:
+    """Write everything a snapshot serves to one file that other workers can map.
+
+    Layout: magic, an 8-byte header length, a JSON header, then the raw bytes.
+    The header holds tag metadata and the [offset, length] of every body,
+    packed prefix array and lookup array within the raw bytes, so a reader
+    serves slices of the mapping instead of parsing and rendering the JSON.
+    """
+    chunks: list[memoryview] = []
+    position = 0
+
+    def place(chunk) -> list[int]:
+        nonlocal position
+        chunk = memoryview(chunk).cast("B")
+        padding = -position % RENDERED_ALIGNMENT
+        if padding:
+            chunks.append(memoryview(bytes(padding)))
+        chunks.append(chunk)
+        position += padding + len(chunk)
+        return [position - len(chunk), len(chunk)]
+
+    def describe(feed_body: FeedBody) -> list:
+        return [
+            feed_body.etag,
+            feed_body.entries,
+            feed_body.shards,
+            place(feed_body.body),
+            {coding: place(body) for coding, body in feed_body.encodings.items()},
+        ]
+
+    def properties(meta: TagMetadata) -> list:
+        return [meta.region, meta.region_id, meta.platform, meta.system_service,
+                meta.network_features]
+
+    header = {
+        "generation": generation,
+        "byteOrder": sys.byteorder,
+        "changeNumber": snapshot.change_number,
+        "shardSize": snapshot.shard_size,
+        "refreshedAt": refreshed_at.isoformat() if refreshed_at else None,
+        "source": source or {},
+        "tags": {
+            name: [
+                feed.digest.hex(),
+                [place(buffer) for buffer in feed.prefixes.buffers()],
+                [describe(body) for body in (
+                    feed.ipv4, feed.all, feed.aggregated_ipv4, feed.aggregated_all
+                )],
+                properties(snapshot.metadata[name]),
+            ]
+            for name, feed in snapshot.tags.items()
+        },
+        "listings": [
+            describe(body)
+            for body in (snapshot.tags_json, snapshot.tags_detail_json, snapshot.index_html)
+        ],
+        "lookup": {
+            "sets": snapshot.lookup.sets,
+            "arrays": {name: place(values) for name, values in snapshot.lookup.arrays().items()},
+        },
+    }
+    encoded = json.dumps(header, separators=(",", ":")).encode()
+    # Trailing spaces are valid JSON; they keep the raw bytes aligned in the file
+    encoded += b" " * (-(len(RENDERED_MAGIC) + 8 + len(encoded)) % RENDERED_ALIGNMENT)
+
+    def write(f: BinaryIO) -> None:
+        f.write(RENDERED_MAGIC)
+        f.write(len(encoded).to_bytes(8, "little"))
+        f.write(encoded)
+        for chunk in chunks:
+            f.write(chunk)
+
+    _write_atomic(path, write)
+    logger.info("Saved %d bytes of rendered feeds to %s", position, path)
+
+
+def keep_rendered(path: Path, restored: PersistedSnapshot, snapshot: Snapshot) -> None:
+    """Save the feeds rendered for a snapshot restored from JSON alone, so the
+    next start (and any follower) maps them instead of rendering them again."""
+    if restored.rendered is not None:
+        return
+    try:
+        save_rendered(
+            rendered_path(path), snapshot, restored.generation, restored.refreshed_at,
+            restored.source,
+        )
+    except OSError:
+        logger.exception("Failed to persist rendered feeds for %s", path)
+
+
+def load_rendered(path: Path, shard_size: int) -> PersistedSnapshot | None:
+    """Map a file written by save_rendered; None if missing, unreadable or cut
+    into shards of another size.
+
+    Bodies and lookup arrays are memoryviews into the mapping, so every worker
+    serving them shares one copy in the page cache. Prefix arrays are copied.
+    """
+    try:
+        with open(path, "rb") as f:
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError):
+        logger.exception("Ignoring unreadable rendered feeds at %s", path)
+        return None
+    view = memoryview(mapped)
+    try:
+        if view[:len(RENDERED_MAGIC)] != RENDERED_MAGIC:
+            raise ValueError("not a rendered feeds file")
+        start = len(RENDERED_MAGIC) + 8
+        size = int.from_bytes(view[len(RENDERED_MAGIC):start], "little")
+        header = json.loads(bytes(view[start:start + size]))
+        if header["shardSize"] != shard_size or header["byteOrder"] != sys.byteorder:
+            return None
+        raw = view[start + size:]
+
+        def span(location: list[int]) -> memoryview:
+            offset, length = location
+            if offset + length > len(raw):
+                raise ValueError("rendered feeds file is truncated")
+            return raw[offset:offset + length]
+
+        def feed_body(description: list) -> FeedBody:
+            etag, entries, shards, body, encodings = description
+            return FeedBody(
+                body=span(body),
+                etag=etag,
+                entries=entries,
+                encodings={coding: span(location) for coding, location in encodings.items()},
+                shards=tuple(shards),
+            )
+
+        tags, metadata = {}, {}
+        for name, (digest, buffers, bodies, properties) in header["tags"].items():
+            tags[name] = TagFeed(
+                bytes.fromhex(digest),
+                PackedPrefixes.from_buffers(span(location) for location in buffers),
+                *(feed_body(body) for body in bodies),
+            )
+            region, region_id, platform, system_service, features = properties
+            metadata[name] = TagMetadata(region, region_id, platform, system_service,
+                                         tuple(features))
+        lookup = header["lookup"]
+        # Label sets name the same tags many times over; share the tags' own strings
+        names = {name: name for name in tags}
+        lookup_index = IntervalIndex.from_arrays(
+            [tuple(names[name] for name in labels) for labels in lookup["sets"]],
+            {
+                name: span(location).cast("Q" if name.endswith(("starts", "hi", "lo")) else "I")
+                for name, location in lookup["arrays"].items()
+            },
+        )
+        refreshed_at = header["refreshedAt"]
+        return PersistedSnapshot(
+            data=None,
+            refreshed_at=datetime.fromisoformat(refreshed_at) if refreshed_at else None,
+            source=header["source"],
+            generation=header["generation"],
+            rendered=RenderedFeeds(
+                header["changeNumber"],
+                header["shardSize"],
+                tags,
+                metadata,
+                lookup_index,
+                *(feed_body(body) for body in header["listings"]),
+            ),
+        )
+    except (KeyError, TypeError, ValueError):
+        logger.exception("Ignoring unreadable rendered feeds at %s", path)
+        return None
+
+
+def load_snapshot(path: Path, shard_size: int | None = None) -> PersistedSnapshot | None:
+    """Load the snapshot saved at path.
+
+    Given the shard size of the cache it will be installed in, the rendered
+    feeds saved next to it are mapped instead when they match, and the JSON
+    is not read at all.
+    """
+    if shard_size is not None:
+        restored = load_rendered(rendered_path(path), shard_size)
+        if restored is not None:
+            return restored
+    try:
+        payload = json.loads(path.read_bytes())
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError):
+        logger.exception("Ignoring unreadable snapshot at %s", path)
+        return None
+    if not isinstance(payload, dict) or "changeNumber" not in payload:
+        logger.error("Ignoring snapshot without changeNumber at %s", path)
+        return None
+    refreshed_at = payload.pop("refreshedAt", None)
+    return PersistedSnapshot(
+        data=payload,
+        refreshed_at=datetime.fromisoformat(refreshed_at) if refreshed_at else None,
+        source=payload.pop("source", None) or {},
+        generation=payload.pop("generation", 0),
+    )
@@ -0,0 +1,308 @@
+"""Feed sources served next to the primary Azure public cloud feed.
+
+A source fetches one upstream document and parses it into the ServiceTags
+shape ({"changeNumber", "cloud", "values": [{"name", "properties"}]}) that
+FeedCache loads, so every source gets the same feeds, search and lookups.
+Each configured source is kept current by its own SourceRefresher: its own
+FeedCache (the source's namespace, selected with ?source=<name>), its own
+RefreshScheduler and its own persisted snapshot. Refreshers run as separate
+tasks, so a slow or failing source never delays another.
+"""
+import asyncio
+import json
+import logging
+import os
+import re
+import time
+from collections.abc import Callable
+from dataclasses import asdict
+from pathlib import Path
+from typing import Protocol
+
+import httpx
+
+from app.cache import FeedCache, Snapshot
+from app.fetcher import (
+    MAX_RESPONSE_BYTES,
+    FetchStats,
+    ServiceTagsFetcher,
+    Validators,
+    create_client,
+)
+from app.parser import ServiceTagsParser
+from app.scheduler import RefreshScheduler
+from app.shared import LeaderLock, SnapshotWatcher
+from app.snapshot import PersistedSnapshot, keep_rendered, load_snapshot, save_snapshot
+
+logger = logging.getLogger(__name__)
+
+# Namespace of the primary feed, which keeps serving requests without ?source=
+PRIMARY_SOURCE = "azure"
+SOURCE_NAME_PATTERN = re.compile(r"^[a-z0-9-]{1,32}$")
+AWS_IP_RANGES_URL = "https://ip-ranges.amazonaws.com/ip-ranges.json"
+
+
+def snapshot_filename(name: str) -> str:
+    return f"snapshot-{name}.json"
+
+
+class Source(Protocol):
+    """What a SourceRefresher needs; ServiceTagsFetcher already is one."""
+
+    validators: Validators
+
+    async def fetch(self, force: bool = False) -> tuple[dict | None, Validators]:
+        """Return the parsed document, or None if it has not changed, and its validators.
+
+        The caller stores the validators once the document is installed.
+        """
+
+    def stats_dict(self) -> dict[str, int]: ...
+
+    async def aclose(self) -> None: ...
+
+
+# --- Parse stages: upstream document bytes -> ServiceTags shape ---
+
+
+def parse_service_tags(body: bytes) -> dict:
+    parser = ServiceTagsParser()
+    parser.feed(body)
+    return parser.close()
+
+
+def parse_aws_ip_ranges(body: bytes) -> dict:
+    """Map AWS ip-ranges.json to one tag per service and one per service and region.
+
+    AMAZON covers every AWS range, like AzureCloud; EC2.us-east-1 is the
+    us-east-1 share of EC2, like Storage.westeurope.
+    """
+    document = json.loads(body)
+    tags: dict[str, dict] = {}
+
+    def add(name: str, prefix: str, region: str, service: str) -> None:
+        properties = tags.get(name)
+        if properties is None:
+            properties = tags[name] = {
+                "region": region,
+                "platform": "AWS",
+                "systemService": service,
+                "addressPrefixes": {},
+            }
+        properties["addressPrefixes"][prefix] = None
+
+    for key, prefixes in (("ip_prefix", "prefixes"), ("ipv6_prefix", "ipv6_prefixes")):
+        for item in document.get(prefixes, []):
+            service, region = item["service"], item["region"]
+            add(service, item[key], "", service)
+            add(f"{service}.{region}", item[key], region.lower(), service)
+    for properties in tags.values():
+        properties["addressPrefixes"] = list(properties["addressPrefixes"])
+    return {
+        "changeNumber": int(document["syncToken"]),
+        "cloud": "AWS",
+        "values": [{"name": name, "properties": tags[name]} for name in sorted(tags)],
+    }
+
+
+PARSERS: dict[str, Callable[[bytes], dict]] = {
+    "servicetags": parse_service_tags,
+    "aws": parse_aws_ip_ranges,
+}
+
+
+# --- Sources ---
+
+
+async def fetch_document(
+    client: httpx.AsyncClient, url: str, validators: Validators
+) -> tuple[bytes | None, Validators]:
+    """Conditionally download url with the usual size ceiling; None on 304."""
+    async with client.stream("GET", url, headers=validators.headers()) as response:
+        if response.status_code == 304:
+            return None, validators
+        response.raise_for_status()
+        chunks = []
+        received = 0
+        async for chunk in response.aiter_bytes():
+            received += len(chunk)
+            if received > MAX_RESPONSE_BYTES:
+                raise RuntimeError(f"Response from {url} too large")
+            chunks.append(chunk)
+    return b"".join(chunks), Validators(
+        url=url,
+        etag=response.headers.get("etag"),
+        last_modified=response.headers.get("last-modified"),
+    )
+
+
+class HttpSource:
+    """A document at a fixed URL, revalidated with its ETag / Last-Modified."""
+
+    def __init__(self, url: str, parse: Callable[[bytes], dict]):
+        if not url.startswith("https://"):
+            raise ValueError(f"Expected HTTPS URL, got {url!r}")
+        self.url = url
+        self.parse = parse
+        self.validators = Validators()
+        self.stats = FetchStats()
+        self._client: httpx.AsyncClient | None = None
+
+    async def fetch(self, force: bool = False) -> tuple[dict | None, Validators]:
+        if self._client is None:
+            self._client = create_client()
+        # A fixed URL has nothing cheaper to check first, so every check is conditional
+        body, validators = await fetch_document(self._client, self.url, self.validators)
+        if body is None:
+            self.stats.not_modified += 1
+            return None, validators
+        data = await asyncio.to_thread(self.parse, body)
+        self.stats.full += 1
+        return data, validators
+
+    def stats_dict(self) -> dict[str, int]:
+        return asdict(self.stats)
+
+    async def aclose(self) -> None:
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+
+class FileSource:
+    """A local document, reread when its size or mtime changes.
+
+    For air-gapped mirrors and as a stand-in for an upstream in tests.
+    """
+
+    def __init__(self, path: Path, parse: Callable[[bytes], dict]):
+        self.path = path
+        self.parse = parse
+        self.validators = Validators()
+        self.stats = FetchStats()
+
+    def _signature(self) -> str:
+        st = os.stat(self.path)
+        return f"{st.st_size}-{st.st_mtime_ns}"
+
+    async def fetch(self, force: bool = False) -> tuple[dict | None, Validators]:
+        signature = await asyncio.to_thread(self._signature)
+        if signature == self.validators.etag and not force:
+            self.stats.not_modified += 1
+            return None, self.validators
+        data = await asyncio.to_thread(lambda: self.parse(self.path.read_bytes()))
+        self.stats.full += 1
+        # as_uri() only accepts absolute paths, and settings may give a relative one
+        return data, Validators(url=self.path.resolve().as_uri(), etag=signature)
+
+    def stats_dict(self) -> dict[str, int]:
+        return asdict(self.stats)
+
+    async def aclose(self) -> None:
+        pass
+
+
+def build_source(spec: dict) -> Source:
+    """Create a source from its settings entry, e.g. {"type": "aws"}.
+
+    Types: "azure" (with "cloud": Public, AzureGovernment or China), "aws"
+    (optionally "url") and "file" (with "path" and "format": servicetags or aws).
+    """
+    kind = spec.get("type")
+    if kind == "azure":
+        # The refresh metrics describe the primary feed; other clouds stay out of them
+        return ServiceTagsFetcher(cloud=spec.get("cloud", "Public"), record_metrics=False)
+    if kind == "aws":
+        return HttpSource(spec.get("url", AWS_IP_RANGES_URL), parse_aws_ip_ranges)
+    if kind == "file":
+        fmt = spec.get("format", "servicetags")
+        if fmt not in PARSERS:
+            raise ValueError(f"Unknown file format {fmt!r}, expected one of {list(PARSERS)}")
+        return FileSource(Path(spec["path"]), PARSERS[fmt])
+    raise ValueError(f"Unknown source type {kind!r}")
+
+
+# --- Refresh ---
+
+
+class SourceRefresher:
+    def __init__(
+        self,
+        name: str,
+        source: Source,
+        cache: FeedCache,
+        scheduler: RefreshScheduler,
+        snapshot_path: Path | None = None,
+    ):
+        if not SOURCE_NAME_PATTERN.match(name) or name == PRIMARY_SOURCE:
+            raise ValueError(f"Invalid source name {name!r}")
+        self.name = name
+        self.source = source
+        self.cache = cache
+        self.scheduler = scheduler
+        self.snapshot_path = snapshot_path
+
+    async def refresh(self, force: bool = False) -> None:
+        data, validators = await self.source.fetch(force=force)
+        if data is None:
+            self.source.validators = validators
+            logger.info("Source %s unchanged: changeNumber=%s", self.name, self.cache.change_number)
+            return
+        started = time.perf_counter()
+        snapshot = await asyncio.to_thread(self.cache.build, data)
+        self.cache.install(snapshot)
+        # Kept only for installed data, so a document that fails to build is fetched again
+        self.source.validators = validators
+        logger.info("Source %s refreshed: changeNumber=%s in %.2fs",
+                    self.name, self.cache.change_number, time.perf_counter() - started)
+        if self.snapshot_path is not None:
+            try:
+                await asyncio.to_thread(
+                    save_snapshot, self.snapshot_path, data, self.cache.last_refresh,
+                    asdict(self.source.validators), snapshot,
+                )
+            except OSError:
+                logger.exception("Failed to persist %s snapshot to %s", self.name, self.snapshot_path)
+
+    async def restore(self) -> bool:
+        if self.snapshot_path is None:
+            return False
+        restored = await asyncio.to_thread(
+            load_snapshot, self.snapshot_path, self.cache.shard_size
+        )
+        if restored is None:
+            return False
+        snapshot = await self._apply(restored)
+        await asyncio.to_thread(keep_rendered, self.snapshot_path, restored, snapshot)
+        logger.info("Restored %s snapshot changeNumber=%s", self.name, self.cache.change_number)
+        return True
+
+    async def _apply(self, restored: PersistedSnapshot) -> Snapshot:
+        snapshot = await asyncio.to_thread(restored.build, self.cache)
+        self.cache.install(snapshot, refreshed_at=restored.refreshed_at)
+        self.source.validators = Validators.from_dict(restored.source)
+        return snapshot
+
+    async def run(self) -> None:
+        """Refresh now (conditionally, behind a restored snapshot), then on schedule."""
+        await self.scheduler.run_once(self.refresh)
+        await self.scheduler.run(self.refresh)
+
+    async def follow(self, lock: LeaderLock, poll_seconds: float) -> None:
+        """Load the leader's snapshots of this source; fetch once this worker leads."""
+        published = SnapshotWatcher(self.snapshot_path, self.cache.shard_size)
+        while not lock.try_acquire():
+            restored = await asyncio.to_thread(published.poll)
+            if restored is not None:
+                await self._apply(restored)
+            await asyncio.sleep(poll_seconds)
+        await self.run()
+
+    def stats(self) -> dict:
+        cache = self.cache
+        return {
+            "change_number": cache.change_number,
+            "last_refresh": cache.last_refresh.isoformat() if cache.last_refresh else None,
+            "upstream": self.source.stats_dict(),
+            "refresh": self.scheduler.stats(cache.last_refresh),
+        }
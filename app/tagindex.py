@@ -0,0 +1,97 @@
+from array import array
+from bisect import bisect_left, bisect_right
+from collections.abc import Iterable
+
+# Joins the folded names for the suffix array; never part of a valid tag name
+_SEPARATOR = "\0"
+
+
+class TagIndex:
+    """Sorted tag names with case-insensitive prefix and substring search.
+
+    Built once per snapshot. Prefix queries bisect the sorted folded names;
+    substring queries bisect a suffix array over all folded names, so neither
+    scans the tag list.
+    """
+
+    __slots__ = ("names", "_folded", "_folded_order", "_text", "_starts", "_suffixes")
+
+    def __init__(self, names: Iterable[str]):
+        self.names = tuple(sorted(names))
+        order = sorted(range(len(self.names)), key=lambda i: self.names[i].casefold())
+        self._folded = [self.names[i].casefold() for i in order]
+        self._folded_order = array("I", order)
+        folded = [name.casefold() for name in self.names]
+        self._text = _SEPARATOR.join(folded)
+        starts = []
+        position = 0
+        for name in folded:
+            starts.append(position)
+            position += len(name) + 1
+        self._starts = array("I", starts)
+        # Positions of every suffix of every name, ordered by the suffix text
+        suffixes = sorted(
+            (name[offset:], start + offset)
+            for name, start in zip(folded, starts)
+            for offset in range(len(name))
+        )
+        self._suffixes = array("I", (position for _, position in suffixes))
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    def prefix(self, query: str) -> list[str]:
+        query = query.casefold()
+        size = len(query)
+        lo = bisect_left(self._folded, query)
+        hi = bisect_right(self._folded, query, lo, key=lambda name: name[:size])
+        return sorted(self.names[i] for i in self._folded_order[lo:hi])
+
+    def contains(self, query: str) -> list[str]:
+        query = query.casefold()
+        if not query:
+            return list(self.names)
+        text, size = self._text, len(query)
+
+        def key(position: int) -> str:
+            return text[position:position + size]
+
+        lo = bisect_left(self._suffixes, query, key=key)
+        hi = bisect_right(self._suffixes, query, lo, key=key)
+        matches = {bisect_right(self._starts, i) - 1 for i in self._suffixes[lo:hi]}
+        return [self.names[i] for i in sorted(matches)]
+
+
+class AttributeIndex:
+    """Inverted index from (attribute, value) pairs to sorted tag names.
+
+    Values are matched case-insensitively; a selection is the intersection of
+    the posting lists for each requested attribute.
+    """
+
+    __slots__ = ("_postings",)
+
+    def __init__(self, pairs: Iterable[tuple[str, str, str]]):
+        postings: dict[tuple[str, str], set[str]] = {}
+        for name, attribute, value in pairs:
+            postings.setdefault((attribute, value.casefold()), set()).add(name)
+        self._postings = {key: tuple(sorted(names)) for key, names in postings.items()}
+
+    def values(self, attribute: str) -> list[str]:
+        return sorted(value for key, value in self._postings if key == attribute)
+
+    def select(self, filters: dict[str, str]) -> list[str]:
+        if not filters:
+            return []
+        postings = sorted(
+            (
+                self._postings.get((attribute, value.casefold()), ())
+                for attribute, value in filters.items()
+            ),
+            key=len,
+        )
+        # Intersect starting from the shortest posting list
+        selected = set(postings[0])
+        for names in postings[1:]:
+            selected.intersection_update(names)
+        return sorted(selected)
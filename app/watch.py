@@ -0,0 +1,57 @@
+import asyncio
+import math
+
+
+class ChangeWatcher:
+    """Parks long-poll requests until a newer changeNumber is installed.
+
+    All waiters share one future that is resolved on change. Timeouts are
+    grouped into one-second deadline buckets, each a shared future with a single
+    loop.call_at, so thousands of idle waiters cost neither a task nor a timer
+    each. A waiter may wake up to a second late.
+    """
+
+    def __init__(self):
+        self.change_number: int | None = None
+        self.waiting = 0
+        self._changed: asyncio.Future | None = None
+        self._deadlines: dict[int, asyncio.Future] = {}
+
+    def notify(self, change_number: int | None) -> None:
+        if change_number is None or (
+            self.change_number is not None and change_number <= self.change_number
+        ):
+            return
+        self.change_number = change_number
+        changed, self._changed = self._changed, None
+        if changed is not None and not changed.done():
+            changed.set_result(change_number)
+
+    async def wait(self, timeout: float) -> bool:
+        """Wait up to timeout seconds; return True if a newer changeNumber arrived."""
+        loop = asyncio.get_running_loop()
+        if self._changed is None or self._changed.get_loop() is not loop:
+            self._changed = loop.create_future()
+        changed = self._changed
+        deadline = self._deadline(loop, timeout)
+        self.waiting += 1
+        try:
+            await asyncio.wait((changed, deadline), return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            self.waiting -= 1
+        return changed.done()
+
+    def _deadline(self, loop: asyncio.AbstractEventLoop, timeout: float) -> asyncio.Future:
+        when = math.ceil(loop.time() + timeout)
+        deadline = self._deadlines.get(when)
+        if deadline is None or deadline.get_loop() is not loop:
+            deadline = loop.create_future()
+            self._deadlines[when] = deadline
+            loop.call_at(when, self._expire, when, deadline)
+        return deadline
+
+    def _expire(self, when: int, deadline: asyncio.Future) -> None:
+        if self._deadlines.get(when) is deadline:
+            del self._deadlines[when]
+        if not deadline.done():
+            deadline.set_result(None)
@@ -0,0 +1,99 @@
+"""Microbenchmarks for FeedCache: load, per-request gets and rendering.
+
+Run with: python -m benchmarks.bench_cache [--small] [--output results.json]
+
+Uses a full-size synthetic payload (~3000 tags) unless --small is given.
+"""
+import argparse
+import time
+import timeit
+from pathlib import Path
+
+from app.cache import FeedBody, FeedCache, _render_index
+from benchmarks.results import write_results
+from benchmarks.synthetic import FULL_SIZE, generate_service_tags
+
+SERVICE_TAG = "Storage.westeurope"
+COMPOSITE = ("Storage", "Sql", "AzureKeyVault")
+
+
+def _per_call(func, number: int) -> float:
+    return min(timeit.repeat(func, number=number, repeat=5)) / number
+
+
+def _timed(func) -> float:
+    started = time.perf_counter()
+    func()
+    return time.perf_counter() - started
+
+
+def run(small: bool = False) -> dict:
+    sizes = {} if small else FULL_SIZE
+    data = generate_service_tags(**sizes)
+    next_data = generate_service_tags(change_number=2, seed=1, **sizes)
+    results: dict[str, dict] = {
+        "payload": {"tags": len(data["values"])},
+    }
+    cold = min(_timed(lambda: FeedCache().load(data)) for _ in range(3))
+    cache = FeedCache()
+    cache.load(data)
+    # Tags whose content did not change reuse the previous snapshot's rendered feeds
+    unchanged = min(_timed(lambda: cache.build(data)) for _ in range(3))
+    changed = min(_timed(lambda: cache.build(next_data)) for _ in range(3))
+    snapshot = cache.build(next_data)
+    install = _timed(lambda: cache.install(snapshot))
+    results["load"] = {
+        "cold_load_ms": round(cold * 1e3, 1),
+        "build_unchanged_ms": round(unchanged * 1e3, 1),
+        "build_all_changed_ms": round(changed * 1e3, 1),
+        "install_ms": round(install * 1e3, 3),
+    }
+
+    cloud = cache.get_tag("AzureCloud", include_ipv6=True)
+    results["payload"]["azurecloud_prefixes"] = len(cloud)
+    names = cache.get_all_tags()
+    gets = {
+        "get_feed": lambda: cache.get_feed(SERVICE_TAG),
+        "get_feed_ipv6": lambda: cache.get_feed(SERVICE_TAG, include_ipv6=True),
+        "get_feed_missing": lambda: cache.get_feed("NoSuchTag"),
+        "search_prefix": lambda: cache.search_tags("storage"),
+        "search_substring": lambda: cache.search_tags("west", substring=True),
+        "select": lambda: cache.select_tags(region="westeurope"),
+        "lookup": lambda: cache.lookup("20.1.2.3"),
+    }
+    results["get_us"] = {
+        label: round(_per_call(func, 20_000) * 1e6, 3) for label, func in gets.items()
+    }
+
+    def composite():
+        cache._composites.clear()  # measure the render, not the LRU hit
+        cache.get_composite(COMPOSITE)
+
+    renders = {
+        "get_tag_azurecloud": lambda: cache.get_tag("AzureCloud"),
+        "feed_body_azurecloud": lambda: FeedBody.from_prefixes(cloud, 1),
+        "composite_uncached": composite,
+        "index_html": lambda: _render_index(names),
+    }
+    results["render_ms"] = {
+        label: round(_per_call(func, 3) * 1e3, 2) for label, func in renders.items()
+    }
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.bench_cache")
+    parser.add_argument("--small", action="store_true", help="~400 tags instead of ~3000")
+    parser.add_argument("--output", type=Path, help="write results as JSON")
+    args = parser.parse_args()
+    results = run(args.small)
+    for section, values in results.items():
+        print(f"{section}:")
+        for label, value in values.items():
+            print(f"  {label:<24} {value}")
+    if args.output:
+        write_results(args.output, "cache", results)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,48 @@
+"""Per-request cost of producing a feed body, and precompressed sizes.
+
+Run with: python -m benchmarks.bench_feed
+"""
+import ipaddress
+import timeit
+
+from app.cache import FeedCache
+from benchmarks.synthetic import generate_service_tags
+
+TAGS = ("AzureCloud", "AzureCloud.westeurope", "Storage")
+
+
+def _is_ipv4(prefix: str) -> bool:
+    # The pre-rendering request path, kept here as the baseline
+    try:
+        return isinstance(ipaddress.ip_network(prefix, strict=False), ipaddress.IPv4Network)
+    except ValueError:
+        return False
+
+
+def main() -> None:
+    data = generate_service_tags()
+    raw = {entry["name"]: entry["properties"]["addressPrefixes"] for entry in data["values"]}
+    cache = FeedCache()
+    cache.load(data)
+
+    def per_request(name: str) -> bytes:
+        prefixes = [p for p in raw[name] if _is_ipv4(p)]
+        return ("\n".join(prefixes) + "\n").encode()
+
+    print(f"{'tag':<24} {'entries':>8} {'per-request':>14} {'pre-rendered':>14}")
+    for name in TAGS:
+        assert per_request(name) == cache.get_body(name)
+        number = 20 if name == "AzureCloud" else 200
+        before = min(timeit.repeat(lambda: per_request(name), number=number, repeat=3)) / number
+        after = min(timeit.repeat(lambda: cache.get_body(name), number=100_000, repeat=3)) / 100_000
+        print(f"{name:<24} {len(raw[name]):>8} {before * 1e6:>12.1f}us {after * 1e6:>12.3f}us")
+
+    print(f"\n{'tag':<24} {'identity':>10} " + " ".join(f"{c:>10}" for c in ("gzip", "br")))
+    for name in TAGS:
+        feed = cache.get_feed(name)
+        sizes = [str(len(feed.encodings[c])) if c in feed.encodings else "-" for c in ("gzip", "br")]
+        print(f"{name:<24} {len(feed.body):>10} " + " ".join(f"{s:>10}" for s in sizes))
+
+
+if __name__ == "__main__":
+    main()
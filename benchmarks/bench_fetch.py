@@ -0,0 +1,124 @@
+"""Peak RSS and time of a refresh download: buffered json vs streaming parse.
+
+Run with: python -m benchmarks.bench_fetch [--small]
+
+Uses the full-size synthetic payload (~3000 tags) unless --small is given.
+Each variant runs in a fresh process, which reads the payload from a file and
+then fetches it from a mock transport in 64 KiB chunks. Reported per variant:
+the process's peak RSS (getrusage ru_maxrss, which also covers start-up and
+reading the file), and the fetch's own peak over the RSS the process had just
+before it: /proc/self/status VmHWM, reset through /proc/self/clear_refs, since
+ru_maxrss cannot be reset. Linux only. Each variant runs in --repeat fresh
+processes; the fastest time and the largest memory figures are kept.
+
+Streaming trades time for memory: the incremental parser does Python work per
+chunk and per entry, where json.loads is a single C call, but it never holds
+the raw body and the full document tree at once.
+"""
+import argparse
+import asyncio
+import json
+import multiprocessing
+import resource
+import tempfile
+import time
+from pathlib import Path
+
+import httpx
+
+from app.fetcher import fetch_service_tags
+from benchmarks.synthetic import FULL_SIZE, generate_service_tags
+
+URL = "https://download.microsoft.com/download/bench/ServiceTags_Public_20260101.json"
+CHUNK = 64 * 1024
+
+
+def _client(body: bytes) -> httpx.AsyncClient:
+    async def stream():
+        for i in range(0, len(body), CHUNK):
+            yield body[i:i + CHUNK]
+
+    return httpx.AsyncClient(
+        transport=httpx.MockTransport(lambda request: httpx.Response(200, content=stream()))
+    )
+
+
+async def buffered(body: bytes) -> dict:
+    # The pre-streaming implementation: buffer everything, then build the full tree
+    async with _client(body) as client:
+        response = await client.get(URL)
+        if len(response.content) > 20 * 1024 * 1024:
+            raise RuntimeError("ServiceTags response too large")
+        return response.json()
+
+
+async def streaming(body: bytes) -> dict:
+    async with _client(body) as client:
+        data, _ = await fetch_service_tags(client, URL)
+        return data
+
+
+VARIANTS = {"buffered": buffered, "streaming": streaming}
+
+
+def _status(field: str) -> int:
+    for line in Path("/proc/self/status").read_text().splitlines():
+        if line.startswith(f"{field}:"):
+            return int(line.split()[1]) * 1024
+    raise KeyError(field)
+
+
+def _run(variant: str, path: Path, conn) -> None:
+    body = path.read_bytes()
+    # Resets VmHWM to the current RSS, dropping whatever start-up reached
+    Path("/proc/self/clear_refs").write_text("5")
+    baseline = _status("VmRSS")
+    started = time.perf_counter()
+    data = asyncio.run(VARIANTS[variant](body))
+    elapsed = time.perf_counter() - started
+    # Kilobytes on Linux
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+    conn.send((elapsed, max_rss, _status("VmHWM") - baseline, len(data["values"])))
+
+
+def _once(variant: str, path: Path) -> tuple[float, int, int, int]:
+    # spawn, not fork: a forked child would start from this process's peak RSS
+    context = multiprocessing.get_context("spawn")
+    parent, child = context.Pipe()
+    process = context.Process(target=_run, args=(variant, path, child))
+    process.start()
+    result = parent.recv()
+    process.join()
+    return result
+
+
+def measure(variant: str, path: Path, repeat: int) -> float:
+    runs = [_once(variant, path) for _ in range(repeat)]
+    elapsed = min(run[0] for run in runs)
+    max_rss = max(run[1] for run in runs)
+    growth = max(run[2] for run in runs)
+    tags = runs[0][3]
+    print(f"{variant:<10} {elapsed * 1e3:>8.0f} ms {max_rss / 2**20:>10.1f} MiB "
+          f"{growth / 2**20:>11.1f} MiB   ({tags} tags)")
+    return elapsed
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.bench_fetch")
+    parser.add_argument("--small", action="store_true", help="~400 tags instead of ~3000")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+    data = generate_service_tags() if args.small else generate_service_tags(**FULL_SIZE)
+    body = json.dumps(data, indent=2).encode()
+    del data
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp) / "ServiceTags_Public.json"
+        path.write_bytes(body)
+        print(f"payload: {len(body) / 2**20:.1f} MiB\n")
+        print(f"{'variant':<10} {'time':>11} {'ru_maxrss':>14} {'fetch peak':>15}")
+        times = {variant: measure(variant, path, args.repeat) for variant in VARIANTS}
+    print(f"\nstreaming takes {times['streaming'] / times['buffered']:.2f}x the buffered time")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,188 @@
+"""In-process HTTP load driver: latency percentiles and throughput per route.
+
+Run with: python -m benchmarks.bench_http [--small] [--requests N] [--concurrency C]
+                                          [--output results.json]
+
+Requests go through the whole ASGI stack (middleware, routing, rate limiter
+bookkeeping, negotiation) over httpx.ASGITransport, so no sockets are involved;
+the numbers still include the httpx client's own per-request work.
+"feed_direct" calls the ASGI app with no client at all, sequentially, which
+gives the application's requests/sec on one core. Rate limits are disabled
+for the run. "refresh_under_load" serves feeds while snapshots are rebuilt and
+swapped in back to back, using a canned upstream instead of the network.
+"""
+import argparse
+import asyncio
+import itertools
+import random
+import time
+from pathlib import Path
+
+from httpx import ASGITransport, AsyncClient
+
+from app import main as server
+from app.fetcher import Validators
+from benchmarks.results import latency_summary, write_results
+from benchmarks.synthetic import FULL_SIZE, generate_service_tags
+
+
+class CannedUpstream:
+    """Stands in for ServiceTagsFetcher, returning each payload in turn."""
+
+    def __init__(self, payloads: list[dict]):
+        self.validators = server.upstream.validators
+        self._payloads = itertools.cycle(payloads)
+
+    async def fetch(self, force: bool = False) -> tuple[dict, Validators]:
+        return next(self._payloads), self.validators
+
+
+async def drive(
+    client: AsyncClient,
+    targets: list[tuple[str, dict[str, str]]],
+    requests: int,
+    concurrency: int,
+    expect: int | None = None,
+) -> dict:
+    """Send requests cycling over (path, headers) from concurrency workers.
+
+    Responses with status >= 400, or other than expect if given, count as errors.
+    """
+    latencies: list[float] = []
+    errors = 0
+    pending = iter(itertools.islice(itertools.cycle(targets), requests))
+
+    async def worker() -> None:
+        nonlocal errors
+        for path, headers in pending:
+            started = time.perf_counter()
+            response = await client.get(path, headers=headers)
+            latencies.append(time.perf_counter() - started)
+            status = response.status_code
+            if status >= 400 or (expect is not None and status != expect):
+                errors += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    summary = latency_summary(latencies, time.perf_counter() - started)
+    summary["errors"] = errors
+    return summary
+
+
+async def drive_direct(path: str, headers: dict[str, str], requests: int) -> dict:
+    """Call the ASGI app directly, one request at a time: the app's own cost on one core."""
+    raw_path, _, query = path.partition("?")
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1",
+        "method": "GET", "scheme": "http", "path": raw_path, "raw_path": raw_path.encode(),
+        "query_string": query.encode(), "root_path": "",
+        "headers": [(b"host", b"bench")]
+        + [(name.lower().encode(), value.encode()) for name, value in headers.items()],
+        "client": ("127.0.0.1", 1), "server": ("bench", 80),
+    }
+    status = 0
+
+    async def receive() -> dict:
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message: dict) -> None:
+        nonlocal status
+        if message["type"] == "http.response.start":
+            status = message["status"]
+
+    latencies: list[float] = []
+    errors = 0
+    started = time.perf_counter()
+    for _ in range(requests):
+        request_started = time.perf_counter()
+        await server.app(dict(scope), receive, send)
+        latencies.append(time.perf_counter() - request_started)
+        errors += status >= 400
+    summary = latency_summary(latencies, time.perf_counter() - started)
+    summary["errors"] = errors
+    return summary
+
+
+async def run(small: bool = False, requests: int = 2000, concurrency: int = 16) -> dict:
+    sizes = {} if small else FULL_SIZE
+    payloads = [generate_service_tags(change_number=n, seed=n, **sizes) for n in (1, 2)]
+    server.cache.load(payloads[0])
+    server.limiter.enabled = False
+    server.settings.data_dir = None  # do not persist benchmark snapshots
+    server.upstream = CannedUpstream(payloads[1:] + payloads[:1])
+
+    rng = random.Random(0)
+    names = server.cache.get_all_tags()
+    feeds = [f"/feeds/{name}" for name in rng.sample(names, min(200, len(names)))]
+    compressed = {"Accept-Encoding": "gzip, br"}
+
+    def each(paths: list[str], headers: dict[str, str] = compressed) -> list:
+        return [(path, headers) for path in paths]
+
+    results: dict[str, dict] = {}
+    transport = ASGITransport(app=server.app)
+    async with AsyncClient(transport=transport, base_url="http://bench") as client:
+        revalidations = []
+        for path in feeds[:50]:
+            etag = (await client.get(path, headers=compressed)).headers["ETag"]
+            revalidations.append((path, {**compressed, "If-None-Match": etag}))
+
+        scenarios = {
+            "feeds": each(feeds),
+            "feeds_identity": each(feeds, {}),
+            "feed_azurecloud": each(["/feeds/AzureCloud"]),
+            "tags": each(["/tags"]),
+            "tags_search": each(["/tags?q=storage", "/tags?q=west&match=substring"]),
+            "index": each(["/"]),
+        }
+        for label, targets in scenarios.items():
+            results[label] = await drive(client, targets, requests, concurrency)
+        results["feeds_not_modified"] = await drive(
+            client, revalidations, requests, concurrency, expect=304
+        )
+        # Without the client: what the server itself spends per feed request
+        results["feed_direct"] = await drive_direct(
+            "/feeds/Storage.westeurope", compressed, requests * 5
+        )
+
+        refreshes = 0
+        stop = asyncio.Event()
+
+        async def refresh_loop() -> None:
+            nonlocal refreshes
+            while not stop.is_set():
+                await server.refresh_cache()
+                refreshes += 1
+
+        refresher = asyncio.create_task(refresh_loop())
+        summary = await drive(client, each(feeds), requests, concurrency)
+        stop.set()
+        await refresher
+        summary["refreshes"] = refreshes
+        results["refresh_under_load"] = summary
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.bench_http")
+    parser.add_argument("--small", action="store_true", help="~400 tags instead of ~3000")
+    parser.add_argument("--requests", type=int, default=2000, help="requests per scenario")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--output", type=Path, help="write results as JSON")
+    args = parser.parse_args()
+    results = asyncio.run(run(args.small, args.requests, args.concurrency))
+    print(f"{'scenario':<20} {'req/s':>9} {'p50 ms':>8} {'p99 ms':>8} {'max ms':>8} {'errors':>7}")
+    for label, summary in results.items():
+        print(f"{label:<20} {summary['requests_per_second']:>9} {summary['p50_ms']:>8} "
+              f"{summary['p99_ms']:>8} {summary['max_ms']:>8} {summary['errors']:>7}")
+    if "refresh_under_load" in results:
+        print(f"\nsnapshots rebuilt during refresh_under_load: "
+              f"{results['refresh_under_load']['refreshes']}")
+    if args.output:
+        write_results(args.output, "http", {
+            "requests": args.requests, "concurrency": args.concurrency, "scenarios": results,
+        })
+
+
+if __name__ == "__main__":
+    main()
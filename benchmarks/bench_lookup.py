@@ -0,0 +1,40 @@
+"""IP-to-service-tag lookup: linear scan over every tag vs the interval index.
+
+Run with: python -m benchmarks.bench_lookup
+"""
+import ipaddress
+import random
+import time
+import timeit
+
+from app.cache import FeedCache
+from benchmarks.synthetic import generate_service_tags
+
+
+def main() -> None:
+    data = generate_service_tags()
+    started = time.perf_counter()
+    cache = FeedCache()
+    cache.load(data)
+    print(f"load incl. index build: {(time.perf_counter() - started) * 1e3:.0f} ms")
+
+    networks = [
+        (entry["name"], ipaddress.ip_network(p, strict=False))
+        for entry in data["values"]
+        for p in entry["properties"]["addressPrefixes"]
+    ]
+
+    def scan(address: str) -> list[str]:
+        ip = ipaddress.ip_address(address)
+        return sorted({name for name, net in networks if ip.version == net.version and ip in net})
+
+    rng = random.Random(1)
+    sample = [str(next(iter(net.hosts()), net.network_address)) for _, net in rng.sample(networks, 50)]
+    assert all(scan(a) == cache.lookup(a) for a in sample[:5])
+    before = timeit.timeit(lambda: [scan(a) for a in sample[:5]], number=1) / 5
+    after = timeit.timeit(lambda: [cache.lookup(a) for a in sample], number=200) / (200 * len(sample))
+    print(f"{len(networks)} prefixes: linear scan {before * 1e3:.1f} ms/ip, index {after * 1e6:.2f} us/ip")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,35 @@
+"""Event-loop lag while a new snapshot is built: on the loop vs in a worker thread.
+
+Run with: python -m benchmarks.bench_loop_lag
+"""
+import asyncio
+
+from app.cache import FeedCache
+from app.monitor import LoopLagMonitor
+from benchmarks.synthetic import generate_service_tags
+
+
+async def measure(off_loop: bool) -> dict:
+    cache = FeedCache()
+    cache.load(generate_service_tags(change_number=1, seed=1))
+    data = generate_service_tags(change_number=2, seed=2)
+    monitor = LoopLagMonitor(interval=0.005, window=100_000)
+    task = asyncio.create_task(monitor.run())
+    await asyncio.sleep(0.05)
+    if off_loop:
+        cache.install(await asyncio.to_thread(cache.build, data))
+    else:
+        cache.load(data)
+    await asyncio.sleep(0.05)
+    task.cancel()
+    return monitor.stats()
+
+
+def main() -> None:
+    for label, off_loop in (("on loop", False), ("to_thread", True)):
+        stats = asyncio.run(measure(off_loop))
+        print(f"{label:<10} max event-loop lag during refresh: {stats['max_ms']:>8.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,59 @@
+"""Memory held for prefixes: str tuples plus parsed networks vs packed arrays.
+
+Run with: python -m benchmarks.bench_memory [--small]
+
+Uses the full-size synthetic payload (~3000 tags, ~12k prefixes in AzureCloud)
+unless --small is given.
+"""
+import argparse
+import sys
+import tracemalloc
+
+from app.cache import FeedCache
+from app.prefixes import PackedPrefixes
+from app.ranges import parse_prefix
+from benchmarks.synthetic import FULL_SIZE, generate_service_tags
+
+
+def _deep_size(prefixes: tuple[str, ...], networks: tuple) -> int:
+    size = sys.getsizeof(prefixes) + sum(sys.getsizeof(p) for p in prefixes)
+    size += sys.getsizeof(networks)
+    for net in networks:
+        size += sys.getsizeof(net) + sum(sys.getsizeof(n) for n in net)
+    return size
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.bench_memory")
+    parser.add_argument("--small", action="store_true", help="~400 tags instead of ~3000")
+    args = parser.parse_args()
+    data = generate_service_tags() if args.small else generate_service_tags(**FULL_SIZE)
+    tag_prefixes = [entry["properties"]["addressPrefixes"] for entry in data["values"]]
+    total = sum(len(p) for p in tag_prefixes)
+
+    old = 0
+    for prefixes in tag_prefixes:
+        prefixes = tuple(prefixes)
+        old += _deep_size(prefixes, tuple(parse_prefix(p) for p in prefixes))
+    packed = [PackedPrefixes.from_strings(p) for p in tag_prefixes]
+    new = sum(p.nbytes for p in packed)
+    print(f"{len(tag_prefixes)} tags, {total} prefixes")
+    print(f"str + network tuples: {old / 1024:8.0f} KiB ({old / total:.0f} B/prefix)")
+    print(f"packed arrays:        {new / 1024:8.0f} KiB ({new / total:.1f} B/prefix)")
+
+    tracemalloc.start()
+    cache = FeedCache()
+    cache.load(data)
+    cache_bytes, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    bodies = sum(
+        len(body.body) + sum(map(len, body.encodings.values()))
+        for feed in cache._tags.values()
+        for body in (feed.ipv4, feed.all, feed.aggregated_ipv4, feed.aggregated_all)
+    )
+    print(f"FeedCache.load retained (tracemalloc): {cache_bytes / 1024:.0f} KiB, "
+          f"of which rendered bodies {bodies / 1024:.0f} KiB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,46 @@
+"""Rate limiter cost per request and memory as the number of tracked clients grows.
+
+Run with: python -m benchmarks.bench_ratelimit
+"""
+import random
+import timeit
+import tracemalloc
+
+from app.ratelimit import Rate, RateLimiter
+
+RATE = Rate.parse("60/minute")
+PATH = "/feeds/AzureCloud"
+SIZES = (100, 1_000, 10_000, 100_000)
+
+
+def main() -> None:
+    print(f"{'clients':>8} {'dict.get':>10} {'known client':>14} {'new client':>12} "
+          f"{'bytes/client':>13}")
+    for size in SIZES:
+        keys = [(f"10.{n >> 16 & 255}.{n >> 8 & 255}.{n & 255}", PATH) for n in range(size)]
+        tracemalloc.start()
+        limiter = RateLimiter(max_keys=size)
+        for key in keys:
+            limiter.hit(key, RATE)
+        memory = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+
+        sample = random.Random(0).choices(keys, k=100_000)
+        # Baseline: a bare lookup of the same keys, to separate cache misses from the limiter
+        table = dict.fromkeys(keys, 0.0)
+        lookups = iter(sample * 5)
+        per_get = min(timeit.repeat(lambda: table.get(next(lookups)), number=100_000, repeat=5))
+        known = iter(sample * 5)
+        hit = limiter.hit
+        per_known = min(timeit.repeat(lambda: hit(next(known), RATE), number=100_000, repeat=5))
+        # At the cap, every unseen client evicts the least recently seen one
+        fresh = iter([(f"172.16.0.{n}", str(n)) for n in range(500_000)])
+        per_new = min(timeit.repeat(lambda: hit(next(fresh), RATE), number=100_000, repeat=5))
+        get_ns, known_ns, new_ns = (t / 100_000 * 1e9 for t in (per_get, per_known, per_new))
+        print(f"{size:>8} {get_ns:>7.0f} ns {known_ns:>11.0f} ns {new_ns:>9.0f} ns "
+              f"{memory / size:>13.0f}")
+    print("\n(bytes/client excludes the key tuples, which each request allocates anyway)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,54 @@
+"""Time from process start to a servable cache when a persisted snapshot exists.
+
+Run with: python -m benchmarks.bench_startup [--small]
+
+Uses the full-size synthetic payload (~3000 tags). A snapshot is restored
+either from its JSON, rendering every feed again, or by mapping the feeds
+rendered when it was saved (see app.snapshot.load_rendered), which is what a
+restart with the same FEED_SHARD_SIZE does.
+"""
+import argparse
+import tempfile
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+
+from app.cache import FeedCache
+from app.config import settings
+from app.snapshot import load_snapshot, rendered_path, save_snapshot
+from benchmarks.synthetic import FULL_SIZE, generate_service_tags
+
+
+def _restore(path: Path, shard_size: int | None) -> tuple[float, float]:
+    started = time.perf_counter()
+    restored = load_snapshot(path, shard_size)
+    read = time.perf_counter()
+    cache = FeedCache(shard_size=settings.feed_shard_size)
+    cache.install(restored.build(cache), refreshed_at=restored.refreshed_at)
+    return read - started, time.perf_counter() - read
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.bench_startup")
+    parser.add_argument("--small", action="store_true", help="~400 tags instead of ~3000")
+    args = parser.parse_args()
+    data = generate_service_tags() if args.small else generate_service_tags(**FULL_SIZE)
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp) / "snapshot.json"
+        cache = FeedCache(shard_size=settings.feed_shard_size)
+        snapshot = cache.build(data)
+        started = time.perf_counter()
+        save_snapshot(path, data, datetime.now(timezone.utc), rendered=snapshot)
+        saved = time.perf_counter()
+        print(f"{len(data['values'])} tags; snapshot {path.stat().st_size / 2**20:.1f} MiB, "
+              f"rendered feeds {rendered_path(path).stat().st_size / 2**20:.1f} MiB")
+        print(f"save (atomic renames): {(saved - started) * 1e3:8.1f} ms")
+        for label, shard_size in (("from JSON", None), ("mapped", settings.feed_shard_size)):
+            read, build = _restore(path, shard_size)
+            print(f"restore {label:<10} read {read * 1e3:8.1f} ms + install {build * 1e3:8.1f} ms "
+                  f"= ready after {(read + build) * 1e3:8.1f} ms")
+        print("(vs. page scrape + download + up to 5 x 30 s retries without a snapshot)")
+
+
+if __name__ == "__main__":
+    main()
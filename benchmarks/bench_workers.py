@@ -0,0 +1,97 @@
+"""Memory and load time per follower worker: rebuilding the snapshot vs mapping its feeds.
+
+Run with: python -m benchmarks.bench_workers [--workers 4]
+
+The leader's snapshot of a full-size synthetic payload is saved once; each
+worker process then loads it the way a follower does and reads every body
+(as serving would), and its memory is read from /proc/<pid>/smaps_rollup.
+PSS splits shared pages between the processes mapping them, so the PSS
+total is what the workers cost together. Linux only.
+"""
+import argparse
+import gc
+import hashlib
+import multiprocessing
+import tempfile
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+
+from app.cache import FeedCache
+from app.config import settings
+from app.snapshot import load_snapshot, rendered_path, save_snapshot
+from benchmarks.synthetic import FULL_SIZE, generate_service_tags
+
+
+def _memory(pid: int | str = "self") -> dict[str, int]:
+    fields = {}
+    for line in Path(f"/proc/{pid}/smaps_rollup").read_text().splitlines()[1:]:
+        name, value = line.split(":")
+        fields[name] = int(value.split()[0]) * 1024
+    return fields
+
+
+def _worker(path: Path, mapped: bool, conn) -> None:
+    started = time.perf_counter()
+    cache = FeedCache(shard_size=settings.feed_shard_size)
+    restored = load_snapshot(path, cache.shard_size if mapped else None)
+    cache.install(restored.build(cache))
+    elapsed = time.perf_counter() - started
+    del restored
+    for name in cache.get_all_tags():
+        for ipv6 in (False, True):
+            for aggregated in (False, True):
+                feed_body = cache.get_feed(name, ipv6, aggregated)
+                for body in (feed_body.body, *feed_body.encodings.values()):
+                    hashlib.blake2b(body)
+    gc.collect()
+    conn.send(elapsed)
+    conn.recv()
+
+
+def run(path: Path, workers: int, mapped: bool) -> None:
+    context = multiprocessing.get_context("fork")
+    processes, pipes, times = [], [], []
+    for _ in range(workers):
+        parent, child = context.Pipe()
+        process = context.Process(target=_worker, args=(path, mapped, child))
+        process.start()
+        processes.append(process)
+        pipes.append(parent)
+    times = [pipe.recv() for pipe in pipes]
+    memory = [_memory(process.pid) for process in processes]
+    for pipe in pipes:
+        pipe.send(None)
+    for process in processes:
+        process.join()
+    label = "mapped feeds" if mapped else "rebuild"
+    rss = max(m["Rss"] for m in memory) / 2**20
+    private = max(m["Private_Clean"] + m["Private_Dirty"] for m in memory) / 2**20
+    pss = sum(m["Pss"] for m in memory) / 2**20
+    print(f"{label:<13} {workers:>7} {max(times):>9.2f} s {rss:>8.1f} MiB "
+          f"{private:>11.1f} MiB {pss:>10.1f} MiB")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.bench_workers")
+    parser.add_argument("--workers", type=int, default=4)
+    args = parser.parse_args()
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp) / "snapshot.json"
+        data = generate_service_tags(**FULL_SIZE)
+        cache = FeedCache(shard_size=settings.feed_shard_size)
+        snapshot = cache.build(data)
+        save_snapshot(path, data, datetime.now(timezone.utc), rendered=snapshot)
+        print(f"{len(data['values'])} tags; rendered feeds file "
+              f"{rendered_path(path).stat().st_size / 2**20:.1f} MiB\n")
+        del data, cache, snapshot
+        gc.collect()
+        print(f"{'follower':<13} {'workers':>7} {'load':>11} {'max RSS':>12} "
+              f"{'max private':>15} {'PSS total':>14}")
+        for mapped in (False, True):
+            for workers in sorted({1, args.workers}):
+                run(path, workers, mapped)
+
+
+if __name__ == "__main__":
+    main()
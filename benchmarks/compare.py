@@ -0,0 +1,38 @@
+"""Compare two saved benchmark result files.
+
+Run with: python -m benchmarks.compare BEFORE.json AFTER.json
+"""
+import argparse
+import json
+from collections.abc import Iterable
+from pathlib import Path
+
+
+def _numbers(value, path: str = "") -> Iterable[tuple[str, float]]:
+    if isinstance(value, dict):
+        for key, child in value.items():
+            yield from _numbers(child, f"{path}.{key}" if path else key)
+    elif isinstance(value, (int, float)) and not isinstance(value, bool):
+        yield path, value
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.compare")
+    parser.add_argument("before", type=Path)
+    parser.add_argument("after", type=Path)
+    args = parser.parse_args()
+    before, after = (json.loads(path.read_text()) for path in (args.before, args.after))
+    if before.get("benchmark") != after.get("benchmark"):
+        parser.error(f"different benchmarks: {before.get('benchmark')} vs {after.get('benchmark')}")
+    print(f"{before.get('git_revision')} -> {after.get('git_revision')}")
+    old = dict(_numbers(before["results"]))
+    for key, new in _numbers(after["results"]):
+        if key not in old:
+            print(f"{key:<48} {'':>12} {new:>12}")
+            continue
+        change = f"{(new - old[key]) / old[key] * 100:+.1f}%" if old[key] else ""
+        print(f"{key:<48} {old[key]:>12} {new:>12} {change:>9}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,53 @@
+"""Shared helpers for benchmarks that save their results for later comparison."""
+import json
+import os
+import platform
+import subprocess
+import sys
+from datetime import datetime, timezone
+from pathlib import Path
+
+
+def percentile(sorted_values: list[float], fraction: float) -> float:
+    # Nearest-rank on an already sorted list
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, round(fraction * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+def latency_summary(latencies: list[float], elapsed: float) -> dict:
+    """p50/p99/max in milliseconds and throughput in requests per second."""
+    ordered = sorted(latencies)
+    return {
+        "requests": len(ordered),
+        "p50_ms": round(percentile(ordered, 0.50) * 1e3, 3),
+        "p99_ms": round(percentile(ordered, 0.99) * 1e3, 3),
+        "max_ms": round(ordered[-1] * 1e3, 3) if ordered else 0.0,
+        "requests_per_second": round(len(ordered) / elapsed, 1) if elapsed else 0.0,
+    }
+
+
+def _git_revision() -> str | None:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True, text=True, check=True, timeout=5,
+        ).stdout.strip()
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def write_results(path: Path, benchmark: str, results: dict) -> None:
+    """Write results with enough context (revision, interpreter, CPUs) to compare runs."""
+    document = {
+        "benchmark": benchmark,
+        "recorded_at": datetime.now(timezone.utc).isoformat(),
+        "git_revision": _git_revision(),
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "results": results,
+    }
+    path.write_text(json.dumps(document, indent=1) + "\n")
+    print(f"\nresults written to {path}")
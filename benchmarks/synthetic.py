@@ -0,0 +1,90 @@
+import random
+
+REGIONS = [
+    "australiaeast", "brazilsouth", "canadacentral", "centralindia", "centralus",
+    "eastasia", "eastus", "eastus2", "francecentral", "germanywestcentral",
+    "japaneast", "koreacentral", "northcentralus", "northeurope", "norwayeast",
+    "southafricanorth", "southcentralus", "southeastasia", "swedencentral",
+    "switzerlandnorth", "uaenorth", "uksouth", "westeurope", "westus", "westus2",
+]
+SERVICES = [
+    "ActionGroup", "ApiManagement", "AppService", "AzureBackup", "AzureContainerRegistry",
+    "AzureCosmosDB", "AzureDataLake", "AzureKeyVault", "AzureMonitor", "DataFactory",
+    "EventHub", "HDInsight", "ServiceBus", "Sql", "Storage",
+]
+# Roughly the shape of the real public file: ~3000 tags, AzureCloud with ~12k prefixes
+FULL_SIZE = {"regions": 60, "services": 50, "region_prefixes": 200, "service_prefixes": 20}
+
+
+def _names(base: list[str], count: int) -> list[str]:
+    # Past the real names, repeat them with a numeric suffix (westeurope2, Storage2, ...)
+    return [base[i % len(base)] + (str(i // len(base) + 1) if i >= len(base) else "")
+            for i in range(count)]
+
+
+def _ipv4_prefix(rng: random.Random) -> str:
+    length = rng.choice((16, 20, 22, 23, 24, 25, 26, 27, 28, 29, 30, 31, 32))
+    address = rng.getrandbits(32) & (0xFFFFFFFF << (32 - length)) & 0xFFFFFFFF
+    return f"{address >> 24}.{(address >> 16) & 255}.{(address >> 8) & 255}.{address & 255}/{length}"
+
+
+def _ipv6_prefix(rng: random.Random) -> str:
+    length = rng.choice((44, 48, 56, 59, 60, 63, 64, 123, 125, 128))
+    address = (0x2603 << 112 | rng.getrandbits(112)) & (((1 << 128) - 1) << (128 - length))
+    groups = [(address >> (112 - 16 * i)) & 0xFFFF for i in range(8)]
+    return ":".join(f"{g:x}" for g in groups) + f"/{length}"
+
+
+def _entry(
+    name: str, prefixes: list[str], region: str = "", region_id: int = 0, service: str = ""
+) -> dict:
+    return {
+        "name": name,
+        "id": name,
+        "properties": {
+            "changeNumber": 1,
+            "region": region,
+            "regionId": region_id,
+            "platform": "Azure",
+            "systemService": service,
+            "addressPrefixes": prefixes,
+            "networkFeatures": ["API", "NSG", "UDR", "FW"],
+        },
+    }
+
+
+def generate_service_tags(
+    change_number: int = 1,
+    seed: int = 0,
+    region_prefixes: int = 400,
+    service_prefixes: int = 30,
+    ipv6_ratio: float = 0.2,
+    regions: int = len(REGIONS),
+    services: int = len(SERVICES),
+) -> dict:
+    """Deterministic ServiceTags-shaped payload with a realistic tag layout.
+
+    The defaults give ~400 tags; generate_service_tags(**FULL_SIZE) is full size.
+    """
+    rng = random.Random(seed)
+
+    def prefixes(count: int) -> list[str]:
+        return [_ipv6_prefix(rng) if rng.random() < ipv6_ratio else _ipv4_prefix(rng)
+                for _ in range(count)]
+
+    values = []
+    all_cloud: list[str] = []
+    service_names = _names(SERVICES, services)
+    service_totals: dict[str, list[str]] = {service: [] for service in service_names}
+    for region_id, region in enumerate(_names(REGIONS, regions), start=1):
+        regional = prefixes(region_prefixes)
+        all_cloud.extend(regional)
+        values.append(_entry(f"AzureCloud.{region}", regional, region, region_id))
+        for service in service_names:
+            subset = rng.sample(regional, service_prefixes)
+            service_totals[service].extend(subset)
+            values.append(_entry(f"{service}.{region}", subset, region, region_id, service))
+    for service, service_prefixes_all in service_totals.items():
+        values.append(_entry(service, service_prefixes_all, service=service))
+    values.append(_entry("AzureCloud", all_cloud))
+    return {"changeNumber": change_number, "cloud": "Public", "values": values}
@@ -105,3 +105,220 @@ def test_get_nonexistent_tag():
         "values": [],
     })
     assert cache.get_tag("DoesNotExist") is None
+
+
+def test_get_body_pre_rendered():
+    cache = FeedCache()
+    cache.load({
+        "changeNumber": 1,
+        "cloud": "Public",
+        "values": [
+            {
+                "name": "TestTag",
+                "id": "TestTag",
+                "properties": {
+                    "addressPrefixes": ["10.0.0.0/8", "2001:db8::/32"],
+                },
+            },
+            {"name": "Empty", "id": "Empty", "properties": {"addressPrefixes": []}},
+        ],
+    })
+    assert cache.get_body("TestTag") == b"10.0.0.0/8\n"
+    assert cache.get_body("TestTag", include_ipv6=True) == b"10.0.0.0/8\n2001:db8::/32\n"
+    assert cache.get_body("Empty") == b"\n"
+    assert cache.get_body("DoesNotExist") is None
+
+
+def test_composite_union_and_exclusion():
+    cache = FeedCache(composite_cache_size=2)
+    cache.load({
+        "changeNumber": 5,
+        "values": [
+            {"name": "West", "properties": {"addressPrefixes": ["10.0.0.0/24", "2001:db8::/48"]}},
+            {"name": "North", "properties": {"addressPrefixes": ["10.0.1.0/24", "10.0.2.0/24"]}},
+            {"name": "Storage", "properties": {"addressPrefixes": ["10.0.2.0/25"]}},
+        ],
+    })
+    result = cache.get_composite(["West", "North"], ["Storage"])
+    assert result.body == b"10.0.0.0/23\n10.0.2.128/25\n"
+    assert result.entries == 2
+    # Normalized expression hits the same LRU entry
+    assert cache.get_composite(["North", "West", "North"], ["Storage"]) is result
+    with_v6 = cache.get_composite(["West"], include_ipv6=True)
+    assert with_v6.body == b"10.0.0.0/24\n2001:db8::/48\n"
+    assert cache.get_composite(["West", "Missing"]) is None
+
+
+def test_composite_cache_is_bounded():
+    cache = FeedCache(composite_cache_size=2)
+    cache.load({
+        "changeNumber": 1,
+        "values": [
+            {"name": name, "properties": {"addressPrefixes": [f"10.0.{i}.0/24"]}}
+            for i, name in enumerate(("A", "B", "C"))
+        ],
+    })
+    first = cache.get_composite(["A"])
+    cache.get_composite(["B"])
+    cache.get_composite(["C"])
+    assert len(cache._composites) == 2
+    assert cache.get_composite(["A"]) is not first
+
+
+def test_composite_cache_is_bounded_by_bytes():
+    cache = FeedCache(composite_cache_bytes=0)
+    cache.load({
+        "changeNumber": 1,
+        "values": [
+            {"name": name, "properties": {"addressPrefixes": [f"10.{i}.{2 * j}.0/24" for j in range(100)]}}
+            for i, name in enumerate(("A", "B", "C"))
+        ],
+    })
+    size = cache.get_composite(["A"]).size
+    assert size > len(cache.get_body("A"))  # encodings count too
+    # Over budget on its own: served, not kept
+    assert not cache._composites
+
+    cache._composite_cache_bytes = 2 * size + size // 2
+    first = cache.get_composite(["A"])
+    cache.get_composite(["B"])
+    cache.get_composite(["C"])
+    assert len(cache._composites) == 2
+    assert cache._composite_bytes == sum(body.size for body in cache._composites.values())
+    assert cache.get_composite(["A"]) is not first
+
+
+def _snapshot(change_number: int, tags: dict[str, list[str]]) -> dict:
+    return {
+        "changeNumber": change_number,
+        "values": [
+            {"name": name, "properties": {"addressPrefixes": prefixes}}
+            for name, prefixes in tags.items()
+        ],
+    }
+
+
+def test_unchanged_tags_are_shared_between_snapshots():
+    cache = FeedCache()
+    cache.load(_snapshot(1, {"Same": ["10.0.0.0/8"], "Moves": ["10.1.0.0/16"]}))
+    same_before = cache.get_feed("Same")
+    cache.load(_snapshot(2, {"Same": ["10.0.0.0/8"], "Moves": ["10.2.0.0/16"]}))
+    assert cache.get_feed("Same") is same_before
+    assert cache.get_body("Moves") == b"10.2.0.0/16\n"
+    assert cache.history() == [1, 2]
+
+
+def test_diff_between_change_numbers():
+    cache = FeedCache(history_size=3)
+    cache.load(_snapshot(1, {"Tag": ["10.0.0.0/24", "10.0.1.0/24"], "Gone": ["1.1.1.1/32"]}))
+    cache.load(_snapshot(2, {"Tag": ["10.0.1.0/24", "10.0.2.0/24"]}))
+    cache.load(_snapshot(3, {"Tag": ["10.0.0.0/24", "10.0.1.0/24", "10.0.3.0/24"]}))
+
+    assert cache.history_span() == (2, 3)
+    latest = cache.get_diff("Tag", 2, 3)
+    assert latest.added == ("10.0.0.0/24", "10.0.3.0/24")
+    assert latest.removed == ("10.0.2.0/24",)
+
+    # 10.0.0.0/24 was removed then re-added: net effect is only the /24 at .3
+    net = cache.get_diff("Tag", 1, 3)
+    assert net.added == ("10.0.3.0/24",)
+    assert net.removed == ()
+
+    assert cache.get_diff("Gone", 1, 2).removed == ("1.1.1.1/32",)
+    assert cache.get_diff("Missing", 1, 3) is None
+    assert cache.history_span(3, 1) is None
+
+    cache.load(_snapshot(4, {"Tag": []}))
+    assert cache.history() == [2, 3, 4]
+    assert cache.history_span(1, 4) is None
+
+
+def test_build_does_not_touch_served_state():
+    cache = FeedCache()
+    cache.load(_snapshot(1, {"Tag": ["10.0.0.0/8"]}))
+    snapshot = cache.build(_snapshot(2, {"Tag": ["11.0.0.0/8"]}))
+    assert cache.change_number == 1
+    assert cache.get_body("Tag") == b"10.0.0.0/8\n"
+    cache.install(snapshot)
+    assert cache.change_number == 2
+    assert cache.get_body("Tag") == b"11.0.0.0/8\n"
+
+
+def test_install_rebases_diffs_on_concurrent_install():
+    cache = FeedCache()
+    cache.load(_snapshot(1, {"Tag": ["10.0.0.0/8"]}))
+    slow = cache.build(_snapshot(3, {"Tag": ["12.0.0.0/8"]}))
+    cache.load(_snapshot(2, {"Tag": ["11.0.0.0/8"]}))
+    cache.install(slow)
+    step = cache.get_diff("Tag", 2, 3)
+    assert step.added == ("12.0.0.0/8",)
+    assert step.removed == ("11.0.0.0/8",)
+
+
+def test_feeds_render_normalized_prefixes():
+    cache = FeedCache()
+    cache.load(_snapshot(1, {"Tag": ["2001:DB8:0::/32", "10.1.2.3/8", "bogus"]}))
+    assert cache.get_body("Tag", include_ipv6=True) == b"10.0.0.0/8\n2001:db8::/32\n"
+    assert cache.get_tag("Tag") == ["10.0.0.0/8"]
+
+
+def test_index_page_rendered_once_per_snapshot():
+    cache = FeedCache()
+    assert b"0 service tags" in cache.index_html.body
+    cache.load(_snapshot(1, {"B<": ["10.0.0.0/8"], "A": ["11.0.0.0/8"]}))
+    page = cache.index_html
+    assert b"B&lt;" in page.body
+    assert page.body.index(b">A<") < page.body.index(b"B&lt;")
+    assert cache.search_tags("b") == ["B<"]
+
+
+def test_metadata_kept_and_indexed():
+    cache = FeedCache()
+    cache.load({
+        "changeNumber": 1,
+        "values": [
+            {"name": "AzureCloud.westeurope", "properties": {
+                "region": "westeurope", "regionId": 18, "platform": "Azure", "systemService": "",
+                "addressPrefixes": ["10.0.0.0/16"], "networkFeatures": ["API", "NSG"],
+            }},
+            {"name": "Storage.WestEurope", "properties": {
+                "region": "westeurope", "platform": "Azure", "systemService": "AzureStorage",
+                "addressPrefixes": ["10.0.1.0/24"], "networkFeatures": ["NSG"],
+            }},
+            {"name": "Storage.EastUS", "properties": {
+                "region": "eastus", "platform": "Azure", "systemService": "AzureStorage",
+                "addressPrefixes": ["10.1.0.0/24"],
+            }},
+        ],
+    })
+    meta = cache.get_metadata("AzureCloud.westeurope")
+    assert meta.region_id == 18
+    assert meta.network_features == ("API", "NSG")
+    assert cache.select_tags(region="westeurope") == ["AzureCloud.westeurope", "Storage.WestEurope"]
+    assert cache.select_tags(system_service="AzureStorage", region=None) == [
+        "Storage.EastUS", "Storage.WestEurope"
+    ]
+    assert cache.select_tags(network_feature="nsg", system_service="AzureStorage") == [
+        "Storage.WestEurope"
+    ]
+    assert cache.attribute_values("system_service") == ["azurestorage"]
+
+
+def test_shards_slice_the_rendered_body():
+    cache = FeedCache(shard_size=2)
+    prefixes = ["10.0.0.0/24", "10.0.1.0/24", "10.0.2.0/24", "10.0.3.0/24", "2001:db8::/32"]
+    cache.load(_snapshot(1, {"Tag": prefixes, "Empty": []}))
+    feed = cache.get_feed("Tag")
+    assert feed.shard_count == 2
+    assert feed.shard(1) == b"10.0.0.0/24\n10.0.1.0/24\n"
+    assert feed.shard(2) == b"10.0.2.0/24\n10.0.3.0/24\n"
+    assert feed.shard(3) is None and feed.shard(0) is None
+    full = cache.get_feed("Tag", include_ipv6=True)
+    assert full.shard_count == 3
+    assert b"".join(full.shard(n) for n in (1, 2, 3)) == full.body
+    assert cache.get_feed("Empty").shard(1) == b"\n"
+
+    (detail,) = cache.get_details(["Tag", "Missing"])
+    assert (detail["entries"], detail["entries_all"]) == (4, 5)
+    assert (detail["shards"], detail["shards_all"]) == (2, 3)
+    assert FeedCache().get_feed("Tag") is None
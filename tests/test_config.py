@@ -11,6 +11,12 @@ def test_default_settings():
     assert settings.listen_port == 8080
     assert settings.log_level == "info"
     assert settings.api_token is None
+    assert settings.feed_cache_control == "no-cache"
+    assert settings.composite_cache_size == 256
+    assert settings.composite_cache_bytes == 64 * 1024 * 1024
+    assert settings.history_size == 8
+    assert settings.data_dir is None
+    assert settings.shared_snapshot is False
 
 
 def test_custom_settings(monkeypatch):
@@ -27,3 +33,12 @@ def test_invalid_log_level(monkeypatch):
     monkeypatch.setenv("LOG_LEVEL", "verbose")
     with pytest.raises(ValidationError):
         Settings()
+
+
+def test_token_quotas_must_be_positive(monkeypatch):
+    monkeypatch.setenv("API_TOKENS", '{"branch-a": 60}')
+    assert Settings().api_tokens == {"branch-a": 60}
+    for quota in (0, -5):
+        monkeypatch.setenv("API_TOKENS", f'{{"branch-a": 60, "secret-b": {quota}}}')
+        with pytest.raises(ValidationError):
+            Settings()
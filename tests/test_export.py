@@ -0,0 +1,67 @@
+import json
+
+from app.cache import FeedCache
+from app.export import export, main, read_manifest
+
+
+def _cache(change_number: int, tags: dict[str, list[str]]) -> FeedCache:
+    cache = FeedCache()
+    cache.load({
+        "changeNumber": change_number,
+        "values": [
+            {"name": name, "properties": {"addressPrefixes": prefixes}}
+            for name, prefixes in tags.items()
+        ],
+    })
+    return cache
+
+
+LARGE = [f"10.{i // 256}.{i % 256}.0/24" for i in range(200)]
+
+
+def test_export_writes_feeds_and_manifest(tmp_path):
+    generation = export(_cache(1, {"Big": LARGE, "V6": ["2001:db8::/32"], "..": ["1.1.1.1"]}), tmp_path)
+    current = tmp_path / "current"
+    assert current.resolve() == generation
+    assert (current / "feeds" / "V6").read_bytes() == b"\n"
+    assert (current / "feeds-all" / "V6").read_bytes() == b"2001:db8::/32\n"
+    assert (current / "feeds" / "Big.gz").exists()
+    assert not (current / "feeds" / "V6.gz").exists()
+    assert json.loads((current / "tags.json").read_bytes()) == ["..", "Big", "V6"]
+    assert b"Big" in (current / "index.html").read_bytes()
+    assert not (tmp_path / "feeds" / "..").exists()
+
+    manifest = read_manifest(tmp_path)
+    assert manifest["changeNumber"] == 1
+    assert manifest["files"]["feeds/Big"].startswith('"1-')
+    assert "feeds/.." not in manifest["files"]
+
+
+def test_unchanged_files_are_hardlinked(tmp_path):
+    first = export(_cache(1, {"Same": LARGE, "Moves": ["10.1.0.0/16"]}), tmp_path)
+    second = export(_cache(2, {"Same": LARGE, "Moves": ["10.2.0.0/16"]}), tmp_path)
+    same, moved = "feeds/Same.gz", "feeds/Moves"
+    assert (second / same).stat().st_ino == (first / same).stat().st_ino
+    assert (second / moved).stat().st_ino != (first / moved).stat().st_ino
+    assert (tmp_path / "current" / moved).read_bytes() == b"10.2.0.0/16\n"
+
+    # Only the current and the previous generation are kept
+    third = export(_cache(3, {"Same": LARGE}), tmp_path)
+    generations = {p.name for p in tmp_path.iterdir() if p.name.startswith("gen-")}
+    assert generations == {second.name, third.name}
+    assert not (third / moved).exists()
+
+
+def test_cli_from_file_skips_unchanged(tmp_path):
+    source = tmp_path / "ServiceTags.json"
+    source.write_text(json.dumps({
+        "changeNumber": 5,
+        "values": [{"name": "Tag", "properties": {"addressPrefixes": ["10.0.0.0/8"]}}],
+    }))
+    out = tmp_path / "out"
+    assert main([str(out), "--input", str(source)]) == 0
+    generation = (out / "current").resolve()
+    assert main([str(out), "--input", str(source)]) == 0
+    assert (out / "current").resolve() == generation
+    assert main([str(out), "--input", str(source), "--force"]) == 0
+    assert (out / "current").resolve() != generation
@@ -1,7 +1,17 @@
+import json
+
+import httpx
 import pytest
 from unittest.mock import AsyncMock, patch
 
-from app.fetcher import discover_download_url, fetch_service_tags, _validate_download_url
+from app.fetcher import (
+    ServiceTagsFetcher,
+    Validators,
+    discover_download_url,
+    fetch_service_tags,
+    _validate_download_url,
+)
+from app.metrics import REFRESH_SECONDS, UPSTREAM_BYTES
 
 
 FAKE_DOWNLOAD_PAGE = """
@@ -32,6 +42,12 @@ FAKE_SERVICE_TAGS = {
 }
 
 
+def _mock_client(response) -> AsyncMock:
+    client = AsyncMock()
+    client.get = AsyncMock(return_value=response)
+    return client
+
+
 @pytest.mark.asyncio
 async def test_discover_download_url():
     mock_response = AsyncMock()
@@ -40,36 +56,130 @@ async def test_discover_download_url():
     mock_response.content = FAKE_DOWNLOAD_PAGE.encode()
     mock_response.raise_for_status = lambda: None
 
-    with patch("app.fetcher.httpx.AsyncClient") as mock_client_cls:
-        mock_client = AsyncMock()
-        mock_client.__aenter__ = AsyncMock(return_value=mock_client)
-        mock_client.__aexit__ = AsyncMock(return_value=False)
-        mock_client.get = AsyncMock(return_value=mock_response)
-        mock_client_cls.return_value = mock_client
-
-        url = await discover_download_url()
-        assert "ServiceTags_Public" in url
-        assert url.endswith(".json")
+    url = await discover_download_url(_mock_client(mock_response))
+    assert "ServiceTags_Public" in url
+    assert url.endswith(".json")
 
 
 @pytest.mark.asyncio
-async def test_fetch_service_tags():
+async def test_discover_download_url_for_other_clouds():
+    page = FAKE_DOWNLOAD_PAGE + FAKE_DOWNLOAD_PAGE.replace("_Public_", "_AzureGovernment_")
     mock_response = AsyncMock()
-    mock_response.status_code = 200
-    mock_response.content = b'{"changeNumber": 200}'
-    mock_response.json = lambda: FAKE_SERVICE_TAGS
+    mock_response.text = page
+    mock_response.content = page.encode()
     mock_response.raise_for_status = lambda: None
+    client = _mock_client(mock_response)
+
+    url = await discover_download_url(client, "AzureGovernment")
+    assert "ServiceTags_AzureGovernment_" in url
+    assert client.get.call_args.args[0].endswith("id=57063")
+    with pytest.raises(ValueError):
+        ServiceTagsFetcher(cloud="Germany")
+
+
+def _transport_client(handler) -> httpx.AsyncClient:
+    return httpx.AsyncClient(transport=httpx.MockTransport(handler))
+
+
+@pytest.mark.asyncio
+async def test_fetch_service_tags():
+    body = json.dumps(FAKE_SERVICE_TAGS, indent=2).encode()
+
+    def handler(request):
+        return httpx.Response(200, content=body, headers={"etag": '"v1"'})
+
+    async with _transport_client(handler) as client:
+        data, validators = await fetch_service_tags(client, "https://download.microsoft.com/fake.json")
+    assert data["changeNumber"] == 200
+    assert len(data["values"]) == 1
+    # Only the fields FeedCache uses are kept
+    properties = dict(FAKE_SERVICE_TAGS["values"][0]["properties"])
+    del properties["changeNumber"]
+    assert data["values"][0] == {"name": "AzureCloud", "properties": properties}
+    assert validators.etag == '"v1"'
+
+
+@pytest.mark.asyncio
+async def test_other_clouds_stay_out_of_the_refresh_metrics():
+    body = json.dumps(FAKE_SERVICE_TAGS).encode()
+    fetcher = ServiceTagsFetcher(cloud="AzureGovernment", record_metrics=False)
+    fetcher._client = _transport_client(lambda request: httpx.Response(200, content=body))
+    counts = [REFRESH_SECONDS.count(stage) for stage in ("discover", "download", "parse")]
+    downloads = UPSTREAM_BYTES.count()
+    url = "https://download.microsoft.com/download/x/ServiceTags_AzureGovernment_20260223.json"
+    with patch("app.fetcher.discover_download_url", AsyncMock(return_value=url)):
+        data, _ = await fetcher.fetch()
+    assert data["changeNumber"] == 200
+    assert [REFRESH_SECONDS.count(stage) for stage in ("discover", "download", "parse")] == counts
+    assert UPSTREAM_BYTES.count() == downloads
+    await fetcher.aclose()
+
+
+@pytest.mark.asyncio
+async def test_fetch_service_tags_conditional():
+    seen = {}
+
+    def handler(request):
+        seen.update(request.headers)
+        return httpx.Response(304)
+
+    validators = Validators(url="u", etag='"v1"', last_modified="Mon, 23 Feb 2026 00:00:00 GMT")
+    async with _transport_client(handler) as client:
+        data, returned = await fetch_service_tags(
+            client, "https://download.microsoft.com/fake.json", validators
+        )
+    assert data is None
+    assert returned is validators
+    assert seen["if-none-match"] == '"v1"'
+    assert seen["if-modified-since"] == "Mon, 23 Feb 2026 00:00:00 GMT"
+
+
+@pytest.mark.asyncio
+async def test_fetch_service_tags_size_ceiling_mid_stream():
+    async def oversized():
+        for _ in range(10):
+            yield b" " * 1024
+
+    def handler(request):
+        return httpx.Response(200, content=oversized())
+
+    with patch("app.fetcher.MAX_RESPONSE_BYTES", 4096):
+        async with _transport_client(handler) as client:
+            with pytest.raises(RuntimeError, match="too large"):
+                await fetch_service_tags(client, "https://download.microsoft.com/fake.json")
 
-    with patch("app.fetcher.httpx.AsyncClient") as mock_client_cls:
-        mock_client = AsyncMock()
-        mock_client.__aenter__ = AsyncMock(return_value=mock_client)
-        mock_client.__aexit__ = AsyncMock(return_value=False)
-        mock_client.get = AsyncMock(return_value=mock_response)
-        mock_client_cls.return_value = mock_client
 
-        data = await fetch_service_tags("https://download.microsoft.com/fake.json")
-        assert data["changeNumber"] == 200
-        assert len(data["values"]) == 1
+@pytest.mark.asyncio
+async def test_fetcher_skips_unchanged_url():
+    url = "https://download.microsoft.com/download/x/ServiceTags_Public_20260223.json"
+    fetcher = ServiceTagsFetcher()
+    fetch = AsyncMock(return_value=(FAKE_SERVICE_TAGS, Validators(url=url, etag='"v1"')))
+    with (
+        patch("app.fetcher.discover_download_url", AsyncMock(return_value=url)),
+        patch("app.fetcher.fetch_service_tags", fetch),
+    ):
+        data, validators = await fetcher.fetch()
+        assert data == FAKE_SERVICE_TAGS
+        # Not kept until the caller has installed the data
+        assert fetcher.validators.url is None
+        fetcher.validators = validators
+        assert await fetcher.fetch() == (None, validators)
+        assert fetch.await_count == 1
+
+        fetch.return_value = (None, fetcher.validators)
+        data, _ = await fetcher.fetch(force=True)
+        assert data is None
+        assert fetch.call_args.args[2].etag == '"v1"'
+    assert fetcher.stats_dict() == {"full": 1, "unchanged_url": 1, "not_modified": 1}
+
+
+@pytest.mark.asyncio
+async def test_fetcher_reuses_one_client():
+    fetcher = ServiceTagsFetcher()
+    client = fetcher.client
+    assert fetcher.client is client
+    await fetcher.aclose()
+    assert client.is_closed
 
 
 def test_validate_download_url_valid():
@@ -1,3 +1,7 @@
+import asyncio
+import json
+from datetime import datetime, timezone
+
 import pytest
 from unittest.mock import patch, AsyncMock
 from httpx import AsyncClient, ASGITransport
@@ -64,6 +68,9 @@ async def test_health(app, preloaded_cache):
             assert data["status"] == "ok"
             assert data["change_number"] == 100
             assert "last_refresh" in data
+            assert set(data["upstream"]) == {"full", "unchanged_url", "not_modified"}
+            assert data["refresh"]["stale"] is False
+            assert data["refresh"]["consecutive_failures"] == 0
 
 
 @pytest.mark.asyncio
@@ -140,9 +147,8 @@ async def test_feed_with_token_auth(app, preloaded_cache):
     """When API_TOKEN is set, requests without valid token are rejected."""
     with (
         patch("app.main.cache", preloaded_cache),
-        patch("app.main.settings") as mock_settings,
+        patch("app.main.settings.api_token", "test-secret"),
     ):
-        mock_settings.api_token = "test-secret"
         transport = ASGITransport(app=app)
         async with AsyncClient(transport=transport, base_url="http://test") as client:
             # No token — forbidden
@@ -177,3 +183,664 @@ async def test_swagger_ui_disabled(app, preloaded_cache):
             assert (await client.get("/docs")).status_code == 404
             assert (await client.get("/redoc")).status_code == 404
             assert (await client.get("/openapi.json")).status_code == 404
+
+
+@pytest.mark.asyncio
+async def test_feed_conditional_request(app, preloaded_cache):
+    with patch("app.main.cache", preloaded_cache):
+        transport = ASGITransport(app=app)
+        async with AsyncClient(transport=transport, base_url="http://test") as client:
+            response = await client.get("/feeds/AzureCloud")
+            etag = response.headers["etag"]
+            assert etag.startswith('"100-')
+            assert response.headers["cache-control"] == "no-cache"
+            assert "last-modified" in response.headers
+
+            response = await client.get("/feeds/AzureCloud", headers={"If-None-Match": etag})
+            assert response.status_code == 304
+            assert response.content == b""
+            assert response.headers["etag"] == etag
+
+            response = await client.get(
+                "/feeds/AzureCloud?ipv6=true", headers={"If-None-Match": etag}
+            )
+            assert response.status_code == 200
+            assert response.headers["etag"] != etag
+
+
+@pytest.mark.asyncio
+async def test_tags_and_index_conditional_request(app, preloaded_cache):
+    with patch("app.main.cache", preloaded_cache):
+        transport = ASGITransport(app=app)
+        async with AsyncClient(transport=transport, base_url="http://test") as client:
+            for path in ("/tags", "/"):
+                response = await client.get(path)
+                assert response.status_code == 200
+                response = await client.get(
+                    path, headers={"If-Modified-Since": response.headers["last-modified"]}
+                )
+                assert response.status_code == 304
+
+
+@pytest.mark.asyncio
+async def test_uncached_routes_keep_no_store(app, preloaded_cache):
+    with patch("app.main.cache", preloaded_cache):
+        transport = ASGITransport(app=app)
+        async with AsyncClient(transport=transport, base_url="http://test") as client:
+            response = await client.get("/health")
+            assert response.headers["cache-control"] == "no-store"
+
+
+@pytest.mark.asyncio
+async def test_feed_fast_path_matches_routed_responses(app, preloaded_cache):
+    with patch("app.main.cache", preloaded_cache):
+        transport = ASGITransport(app=app)
+        async with AsyncClient(transport=transport, base_url="http://test") as client:
+            response = await client.get("/feeds/AzureCloud?ipv6=TRUE")
+            assert response.status_code == 200
+            assert "2001:db8::/32" in response.text
+            assert response.headers["x-frame-options"] == "DENY"
+            assert response.headers["cache-control"] != "no-store"
+
+            missing = await client.get("/feeds/NoSuchTag")
+            assert missing.status_code == 404
+            assert missing.json() == {"detail": "Not found"}
+            assert missing.headers["cache-control"] == "no-store"
+            # Served by the regular route, which must answer the same way
+            routed = await client.get("/feeds/No/Such/Tag")
+            assert routed.status_code == 404
+            assert routed.json() == missing.json()
+
+            # Values FastAPI rejects fall through to its validation
+            assert (await client.get("/feeds/AzureCloud?ipv6=maybe")).status_code == 422
+
+
+@pytest.mark.asyncio
+async def test_feed_fast_path_enforces_the_route_rate_limit(app, preloaded_cache):
+    with patch("app.main.cache", preloaded_cache):
+        transport = ASGITransport(app=app, client=("192.0.2.60", 1234))
+        async with AsyncClient(transport=transport, base_url="http://test") as client:
+            for _ in range(60):
+                assert (await client.get("/feeds/AzureCloud")).status_code == 200
+            response = await client.get("/feeds/AzureCloud")
+            assert response.status_code == 429
+            assert response.json() == {"detail": "Rate limit exceeded: 60 per 1 minute"}
+            assert int(response.headers["retry-after"]) >= 1
+            # The limit is per path, whatever the query
+            response = await client.get("/feeds/AzureCloud?ipv6=1&aggregate=no")
+            assert response.status_code == 429
+
+
+@pytest.mark.asyncio
+async def test_unknown_feed_paths_share_one_limiter_key(app, preloaded_cache):
+    from app import main
+
+    with patch("app.main.cache", preloaded_cache):
+        transport = ASGITransport(app=app, client=("192.0.2.62", 1234))
+        async with AsyncClient(transport=transport, base_url="http://test") as client:
+            tracked = len(main.limiter)
+            for n in range(20):
+                assert (await client.get(f"/feeds/NoSuchTag{n}")).status_code == 404
+                assert (await client.get(f"/feeds/x/{'y' * n}")).status_code == 404
+                assert (await client.get(f"/feeds/AzureCloud/part/{n + 2}")).status_code == 404
+                assert (await client.get(f"/diff/NoSuchTag{n}")).status_code == 404
+            # One key for all missing feeds and shards, one for the diff route
+            assert len(main.limiter) == tracked + 2
+            # ...which they exhaust together
+            assert (await client.get("/feeds/NoSuchTag")).status_code == 429
+            assert (await client.get("/feeds/AzureCloud")).status_code == 200
+
+
+@pytest.mark.asyncio
+async def test_client_tokens_get_their_own_quota(app, preloaded_cache):
+    quotas = {"branch-a": 2, "branch-b": 2}
+    with (
+        patch("app.main.cache", preloaded_cache),
+        patch("app.main.settings.api_tokens", quotas),
+        patch("app.main.limiter.quotas", quotas),
+    ):
+        # Both devices sit behind the same NAT address
+        transport = ASGITransport(app=app, client=("192.0.2.61", 1234))
+        async with AsyncClient(transport=transport, base_url="http://test") as client:
+            assert (await client.get("/tags")).status_code == 403
+            assert (await client.get("/tags?token=unknown")).status_code == 403
+            for token in ("branch-a", "branch-b"):
+                for _ in range(2):
+                    assert (await client.get(f"/tags?token={token}")).status_code == 200
+            response = await client.get("/tags?token=branch-a")
+            assert response.status_code == 429
+            assert response.json()["detail"] == "Rate limit exceeded: 2 per 1 minute"
+
+
+@pytest.mark.asyncio
+async def test_feed_precompressed_gzip(app):
+    large = FeedCache()
+    large.load({
+        "changeNumber": 7,
+        "values": [
+            {
+                "name": "Large",
+                "properties": {"addressPrefixes": [f"10.{i // 256}.{i % 256}.0/24" for i in range(500)]},
+            }
+        ],
+    })
+    with patch("app.main.cache", large):
+        transport = ASGITransport(app=app)
+        async with AsyncClient(transport=transport, base_url="http://test") as client:
+            plain = await client.get("/feeds/Large", headers={"Accept-Encoding": "identity"})
+            assert "content-encoding" not in plain.headers
+            assert plain.headers["vary"] == "Accept-Encoding"
+
+            response = await client.get("/feeds/Large", headers={"Accept-Encoding": "gzip"})
+            assert response.headers["content-encoding"] == "gzip"
+            assert response.content == plain.content  # httpx decodes transparently
+            assert int(response.headers["content-length"]) < len(plain.content)
+            assert response.headers["etag"] != plain.headers["etag"]
+
+            response = await client.get(
+                "/feeds/Large",
+                headers={"Accept-Encoding": "gzip", "If-None-Match": response.headers["etag"]},
+            )
+            assert response.status_code == 304
+
+
+@pytest.mark.asyncio
+async def test_lookup_single_ip(app, preloaded_cache):
+    with patch("app.main.cache", preloaded_cache):
+        transport = ASGITransport(app=app)
+        async with AsyncClient(transport=transport, base_url="http://test") as client:
+            response = await client.get("/lookup?ip=20.0.1.2")
+            assert response.status_code == 200
+            assert response.json() == {"ip": "20.0.1.2", "tags": ["AzureCloud.EastUS"]}
+
+            response = await client.get("/lookup?ip=not-an-ip")
+            assert response.status_code == 400
+
+
+@pytest.mark.asyncio
+async def test_lookup_batch(app, preloaded_cache):
+    with patch("app.main.cache", preloaded_cache):
+        transport = ASGITransport(app=app)
+        async with AsyncClient(transport=transport, base_url="http://test") as client:
+            response = await client.post(
+                "/lookup", json={"ips": ["10.1.2.3", "2001:db8::1", "8.8.8.8", "bogus"]}
+            )
+            assert response.status_code == 200
+            results = response.json()["results"]
+            assert results[0]["tags"] == ["AzureCloud"]
+            assert results[1]["tags"] == ["AzureCloud"]
+            assert results[2]["tags"] == []
+            assert "error" in results[3]
+
+
+@pytest.mark.asyncio
+async def test_feed_aggregated(app):
+    cache = FeedCache()
+    cache.load({
+        "changeNumber": 3,
+        "values": [
+            {
+                "name": "Split",
+                "properties": {
+                    "addressPrefixes": [
+                        "10.0.0.0/25", "10.0.0.128/25", "10.0.1.0/24", "10.0.1.16/28", "2001:db8::/32",
+                    ],
+                },
+            }
+        ],
+    })
+    with patch("app.main.cache", cache):
+        transport = ASGITransport(app=app)
+        async with AsyncClient(transport=transport, base_url="http://test") as client:
+            response = await client.get("/feeds/Split")
+            assert response.headers["x-entry-count"] == "4"
+            assert "x-original-entry-count" not in response.headers
+
+            response = await client.get("/feeds/Split?aggregate=true")
+            assert response.text == "10.0.0.0/23\n"
+            assert response.headers["x-entry-count"] == "1"
+            assert response.headers["x-original-entry-count"] == "4"
+
+            response = await client.get("/feeds/Split?aggregate=true&ipv6=true")
+            assert response.text == "10.0.0.0/23\n2001:db8::/32\n"
+            assert response.headers["x-original-entry-count"] == "5"
+
+
+@pytest.mark.asyncio
+async def test_composite_feed(app, preloaded_cache):
+    with patch("app.main.cache", preloaded_cache):
+        transport = ASGITransport(app=app)
+        async with AsyncClient(transport=transport, base_url="http://test") as client:
+            response = await client.get(
+                "/composite?include=AzureCloud&include=AzureCloud.EastUS&exclude=AzureCloud.EastUS"
+            )
+            assert response.status_code == 200
+            assert response.text == "10.0.0.0/8\n172.16.0.0/12\n"
+            assert response.headers["x-entry-count"] == "2"
+
+            response = await client.get("/composite?include=AzureCloud&exclude=Nope")
+            assert response.status_code == 404
+            response = await client.get("/composite")
+            assert response.status_code == 422
+
+
+@pytest.mark.asyncio
+async def test_diff_endpoint(app, preloaded_cache):
+    updated = {**SAMPLE_DATA, "changeNumber": 101, "values": [
+        {**SAMPLE_DATA["values"][1], "properties": {
+            **SAMPLE_DATA["values"][1]["properties"], "addressPrefixes": ["20.1.0.0/16"],
+        }},
+    ]}
+    preloaded_cache.load(updated)
+    with patch("app.main.cache", preloaded_cache):
+        transport = ASGITransport(app=app)
+        async with AsyncClient(transport=transport, base_url="http://test") as client:
+            response = await client.get("/diff/AzureCloud.EastUS")
+            assert response.status_code == 200
+            assert response.json() == {
+                "service_tag": "AzureCloud.EastUS",
+                "from": 100,
+                "to": 101,
+                "added": ["20.1.0.0/16"],
+                "removed": ["20.0.0.0/16"],
+                "history": [100, 101],
+            }
+            response = await client.get("/diff/AzureCloud?from=100&to=101")
+            assert response.json()["removed"] == ["10.0.0.0/8", "172.16.0.0/12", "2001:db8::/32"]
+
+            response = await client.get("/diff/AzureCloud?from=1")
+            assert response.status_code == 404
+
+
+@pytest.mark.asyncio
+async def test_startup_serves_persisted_snapshot(tmp_path):
+    from app import main
+    from app.snapshot import save_snapshot
+
+    save_snapshot(tmp_path / "snapshot.json", SAMPLE_DATA, datetime(2026, 3, 1, tzinfo=timezone.utc))
+    cache = FeedCache()
+    started = asyncio.Event()
+
+    async def slow_refresh(force=False):
+        started.set()
+        await asyncio.sleep(3600)
+
+    with (
+        patch("app.main.cache", cache),
+        patch("app.main.settings.data_dir", str(tmp_path)),
+        patch("app.main.refresh_cache", slow_refresh),
+    ):
+        async with main.lifespan(main.app):
+            # Startup did not wait for the (stalled) upstream refresh
+            assert cache.change_number == 100
+            assert cache.get_body("AzureCloud.EastUS") == b"20.0.0.0/16\n"
+            await asyncio.wait_for(started.wait(), 1)
+
+
+@pytest.mark.asyncio
+async def test_startup_refreshes_sources_alongside_the_primary_feed(tmp_path):
+    from app import main
+    from app.snapshot import save_snapshot
+
+    save_snapshot(tmp_path / "snapshot.json", SAMPLE_DATA, datetime(2026, 3, 1, tzinfo=timezone.utc))
+    (tmp_path / "gov.json").write_text(json.dumps({**SAMPLE_DATA, "changeNumber": 7}))
+
+    async def stalled_refresh(force=False):
+        await asyncio.sleep(3600)
+
+    with (
+        patch("app.main.cache", FeedCache()),
+        patch("app.main.settings.data_dir", str(tmp_path)),
+        patch("app.main.refresh_cache", stalled_refresh),
+    ):
+        sources = main.build_refreshers({"gov": {"type": "file", "path": str(tmp_path / "gov.json")}})
+        with patch("app.main.sources", sources):
+            async with main.lifespan(main.app):
+                # Persisted after it is installed
+                for _ in range(100):
+                    if (tmp_path / "snapshot-gov.json").exists():
+                        break
+                    await asyncio.sleep(0.01)
+                assert sources["gov"].cache.change_number == 7
+                assert (tmp_path / "snapshot-gov.json").exists()
+
+
+@pytest.mark.asyncio
+async def test_refresh_persists_snapshot(tmp_path):
+    from app import main
+    from app.fetcher import ServiceTagsFetcher, Validators
+    from app.snapshot import load_snapshot
+
+    url = "https://download.microsoft.com/download/x/ServiceTags_Public_20260223.json"
+    fetcher = ServiceTagsFetcher()
+    with (
+        patch("app.main.cache", FeedCache()),
+        patch("app.main.upstream", fetcher),
+        patch("app.main.settings.data_dir", str(tmp_path)),
+        patch("app.fetcher.discover_download_url", AsyncMock(return_value=url)),
+        patch(
+            "app.fetcher.fetch_service_tags",
+            AsyncMock(return_value=(SAMPLE_DATA, Validators(url=url, etag='"v1"'))),
+        ),
+    ):
+        await main.refresh_cache()
+    restored = load_snapshot(tmp_path / "snapshot.json")
+    assert restored.data["changeNumber"] == 100
+    assert restored.refreshed_at is not None
+    assert restored.source["url"] == url
+    assert restored.source["etag"] == '"v1"'
+
+
+@pytest.mark.asyncio
+async def test_refresh_downloads_again_after_a_failed_build():
+    from app import main
+    from app.fetcher import ServiceTagsFetcher, Validators
+
+    url = "https://download.microsoft.com/download/x/ServiceTags_Public_20260223.json"
+    fetcher = ServiceTagsFetcher()
+    cache = FeedCache()
+    download = AsyncMock(return_value=({"values": []}, Validators(url=url, etag='"v1"')))
+    with (
+        patch("app.main.cache", cache),
+        patch("app.main.upstream", fetcher),
+        patch("app.fetcher.discover_download_url", AsyncMock(return_value=url)),
+        patch("app.fetcher.fetch_service_tags", download),
+    ):
+        with pytest.raises(KeyError):
+            await main.refresh_cache()
+        # The URL of data that was never served must not make the next check a no-op
+        assert fetcher.validators.url is None
+        download.return_value = (SAMPLE_DATA, Validators(url=url, etag='"v2"'))
+        await main.refresh_cache()
+    assert download.await_count == 2
+    assert cache.change_number == 100
+    assert fetcher.validators.etag == '"v2"'
+
+
+@pytest.mark.asyncio
+async def test_follower_worker_attaches_to_leader_snapshot(tmp_path):
+    from app import main
+    from app.shared import LeaderLock, fcntl
+    from app.snapshot import save_snapshot
+
+    if fcntl is None:
+        pytest.skip("requires fcntl")
+    leader = LeaderLock(tmp_path / "leader.lock")
+    assert leader.try_acquire()
+    save_snapshot(tmp_path / "snapshot.json", SAMPLE_DATA, datetime(2026, 3, 1, tzinfo=timezone.utc))
+    cache = FeedCache()
+    refresh = AsyncMock()
+    try:
+        with (
+            patch("app.main.cache", cache),
+            patch("app.main.settings.data_dir", str(tmp_path)),
+            patch("app.main.settings.shared_snapshot", True),
+            patch("app.main.refresh_cache", refresh),
+        ):
+            async with main.lifespan(main.app):
+                assert cache.change_number == 100
+            refresh.assert_not_awaited()
+    finally:
+        leader.release()
+
+
+@pytest.mark.asyncio
+async def test_tags_search_and_pagination(app, preloaded_cache):
+    with patch("app.main.cache", preloaded_cache):
+        transport = ASGITransport(app=app)
+        async with AsyncClient(transport=transport, base_url="http://test") as client:
+            response = await client.get("/tags?q=azurecloud.")
+            assert response.json() == ["AzureCloud.EastUS"]
+            assert response.headers["x-total-count"] == "1"
+
+            response = await client.get("/tags?q=east&match=substring")
+            assert response.json() == ["AzureCloud.EastUS"]
+
+            response = await client.get("/tags?offset=1&limit=1")
+            assert response.json() == ["AzureCloud.EastUS"]
+            assert response.headers["x-total-count"] == "2"
+
+            assert (await client.get("/tags?q=a/b")).status_code == 422
+            assert (await client.get("/tags?limit=0")).status_code == 422
+
+
+@pytest.mark.asyncio
+async def test_select_feed_and_tag_filters(app, preloaded_cache):
+    with patch("app.main.cache", preloaded_cache):
+        transport = ASGITransport(app=app)
+        async with AsyncClient(transport=transport, base_url="http://test") as client:
+            response = await client.get("/select?region=eastus")
+            assert response.status_code == 200
+            assert response.text == "20.0.0.0/16\n"
+            assert response.headers["x-tag-count"] == "1"
+
+            response = await client.get("/select?platform=Azure&ipv6=true")
+            assert response.text == "10.0.0.0/8\n20.0.0.0/16\n172.16.0.0/12\n2001:db8::/32\n"
+            assert response.headers["x-tag-count"] == "2"
+
+            assert (await client.get("/select")).status_code == 400
+            assert (await client.get("/select?region=nowhere")).status_code == 404
+
+            response = await client.get("/tags?platform=azure")
+            assert response.json() == ["AzureCloud", "AzureCloud.EastUS"]
+            response = await client.get("/tags?q=AzureCloud&region=eastus")
+            assert response.json() == ["AzureCloud.EastUS"]
+
+
+@pytest.fixture
+def sharded_cache():
+    sharded = FeedCache(shard_size=2)
+    sharded.load({
+        "changeNumber": 9,
+        "values": [{"name": "Big", "properties": {
+            "addressPrefixes": ["10.0.0.0/24", "10.0.1.0/24", "10.0.2.0/24"],
+        }}],
+    })
+    return sharded
+
+
+@pytest.mark.asyncio
+async def test_feed_shards(app, sharded_cache):
+    with patch("app.main.cache", sharded_cache):
+        transport = ASGITransport(app=app)
+        async with AsyncClient(transport=transport, base_url="http://test") as client:
+            response = await client.get("/feeds/Big")
+            assert response.headers["x-shard-count"] == "2"
+            assert response.headers["accept-ranges"] == "bytes"
+
+            response = await client.get("/feeds/Big/part/2")
+            assert response.status_code == 200
+            assert response.text == "10.0.2.0/24\n"
+            etag = response.headers["etag"]
+            assert etag.endswith('-part2"')
+            response = await client.get("/feeds/Big/part/2", headers={"If-None-Match": etag})
+            assert response.status_code == 304
+
+            assert (await client.get("/feeds/Big/part/3")).status_code == 404
+            assert (await client.get("/feeds/Big/part/0")).status_code == 404
+            assert (await client.get("/feeds/Nope/part/1")).status_code == 404
+
+            response = await client.get("/tags?detail=true")
+            assert response.json()[0]["shards"] == 2
+
+
+@pytest.mark.asyncio
+async def test_feed_byte_ranges(app, sharded_cache):
+    with patch("app.main.cache", sharded_cache):
+        transport = ASGITransport(app=app)
+        async with AsyncClient(transport=transport, base_url="http://test") as client:
+            etag = (await client.get("/feeds/Big")).headers["etag"]
+            response = await client.get("/feeds/Big", headers={"Range": "bytes=12-23"})
+            assert response.status_code == 206
+            assert response.text == "10.0.1.0/24\n"
+            assert response.headers["content-range"] == "bytes 12-23/36"
+
+            response = await client.get(
+                "/feeds/Big", headers={"Range": "bytes=0-1", "If-Range": '"stale"'}
+            )
+            assert response.status_code == 200
+            response = await client.get("/feeds/Big", headers={"Range": "bytes=0-1", "If-Range": etag})
+            assert response.status_code == 206
+
+            response = await client.get("/feeds/Big", headers={"Range": "bytes=100-"})
+            assert response.status_code == 416
+            assert response.headers["content-range"] == "bytes */36"
+
+
+@pytest.mark.asyncio
+async def test_watch_long_poll(app, preloaded_cache):
+    from app import main
+    from app.watch import ChangeWatcher
+
+    watcher = ChangeWatcher()
+    with patch("app.main.cache", preloaded_cache), patch("app.main.watcher", watcher):
+        transport = ASGITransport(app=app)
+        async with AsyncClient(transport=transport, base_url="http://test") as client:
+            response = await client.get("/watch?since=99")
+            assert response.json()["changed"] is True
+            assert response.json()["change_number"] == 100
+
+            pending = asyncio.create_task(client.get("/watch?since=100&timeout=30"))
+            await asyncio.sleep(0.05)
+            assert watcher.waiting == 1
+            preloaded_cache.load({**SAMPLE_DATA, "changeNumber": 101})
+            main.watcher.notify(101)
+            response = await asyncio.wait_for(pending, 1)
+            assert response.json() == {
+                "change_number": 101,
+                "changed": True,
+                "last_refresh": preloaded_cache.last_refresh.isoformat(),
+            }
+
+            response = await client.get("/watch?since=101&timeout=0.01")
+            assert response.json()["changed"] is False
+            assert (await client.get("/watch?timeout=600")).status_code == 422
+
+
+@pytest.mark.asyncio
+async def test_manual_refresh_requires_admin_token(app, preloaded_cache):
+    with patch("app.main.cache", preloaded_cache):
+        transport = ASGITransport(app=app)
+        async with AsyncClient(transport=transport, base_url="http://test") as client:
+            assert (await client.post("/refresh")).status_code == 404
+            with patch("app.main.settings.admin_token", "admin-secret"):
+                assert (await client.post("/refresh")).status_code == 403
+                response = await client.post(
+                    "/refresh", headers={"Authorization": "Bearer wrong"}
+                )
+                assert response.status_code == 403
+
+
+@pytest.mark.asyncio
+async def test_manual_refresh_coalesces_with_scheduled_refresh(app, preloaded_cache):
+    from app import main
+
+    calls = []
+    release = asyncio.Event()
+
+    async def refresh(force=False):
+        calls.append(force)
+        await release.wait()
+        preloaded_cache.load({**SAMPLE_DATA, "changeNumber": 200})
+
+    headers = {"Authorization": "Bearer admin-secret"}
+    with (
+        patch("app.main.cache", preloaded_cache),
+        patch("app.main.refresh_cache", refresh),
+        patch("app.main.settings.admin_token", "admin-secret"),
+    ):
+        transport = ASGITransport(app=app)
+        async with AsyncClient(transport=transport, base_url="http://test") as client:
+            scheduled = asyncio.create_task(main.scheduled_refresh(False))
+            manual = [asyncio.create_task(client.post("/refresh", headers=headers)) for _ in range(3)]
+            await asyncio.sleep(0.05)
+            release.set()
+            await scheduled
+            responses = [await r for r in manual]
+    assert calls == [False]
+    assert all(r.status_code == 200 for r in responses)
+    assert all(r.json()["coalesced"] for r in responses)
+    assert responses[0].json()["change_number"] == 200
+
+
+@pytest.mark.asyncio
+async def test_manual_refresh_reports_upstream_failure(app, preloaded_cache):
+    with (
+        patch("app.main.cache", preloaded_cache),
+        patch("app.main.refresh_cache", AsyncMock(side_effect=RuntimeError("down"))),
+        patch("app.main.settings.admin_token", "admin-secret"),
+    ):
+        transport = ASGITransport(app=app)
+        async with AsyncClient(transport=transport, base_url="http://test") as client:
+            response = await client.post(
+                "/refresh", headers={"Authorization": "Bearer admin-secret"}
+            )
+    assert response.status_code == 502
+
+
+@pytest.mark.asyncio
+async def test_metrics_endpoint_counts_feed_requests(app, preloaded_cache):
+    from app.metrics import FEED_TRAFFIC, NOT_MODIFIED, REQUEST_SECONDS
+
+    requests_before, bytes_before = FEED_TRAFFIC.value("azure", "AzureCloud.EastUS")
+    not_modified_before = NOT_MODIFIED.value("feed")
+    observed_before = REQUEST_SECONDS.count("feed")
+    with patch("app.main.cache", preloaded_cache):
+        transport = ASGITransport(app=app)
+        async with AsyncClient(transport=transport, base_url="http://test") as client:
+            etag = (await client.get("/feeds/AzureCloud.EastUS")).headers["etag"]
+            await client.get("/feeds/AzureCloud.EastUS", headers={"If-None-Match": etag})
+            await client.get("/feeds/Unknown")
+            response = await client.get("/metrics")
+    requests_after, bytes_after = FEED_TRAFFIC.value("azure", "AzureCloud.EastUS")
+    assert requests_after - requests_before == 2
+    assert bytes_after - bytes_before == len(b"20.0.0.0/16\n")
+    assert NOT_MODIFIED.value("feed") - not_modified_before == 1
+    assert REQUEST_SECONDS.count("feed") - observed_before == 2
+    assert response.headers["content-type"].startswith("text/plain; version=0.0.4")
+    assert 'feeds_tag_requests_total{source="azure",tag="AzureCloud.EastUS"}' in response.text
+    assert 'tag="Unknown"' not in response.text
+
+
+@pytest.mark.asyncio
+async def test_sources_are_served_in_their_own_namespace(app, preloaded_cache, tmp_path):
+    from app.main import build_refreshers
+    from app.metrics import FEED_TRAFFIC
+
+    path = tmp_path / "ip-ranges.json"
+    path.write_text(
+        '{"syncToken": "5", "prefixes": [{"ip_prefix": "52.94.76.0/22",'
+        ' "region": "us-west-2", "service": "EC2"}]}'
+    )
+    sources = build_refreshers({"aws": {"type": "file", "path": str(path), "format": "aws"}})
+    await sources["aws"].refresh()
+    with patch("app.main.cache", preloaded_cache), patch("app.main.sources", sources):
+        transport = ASGITransport(app=app)
+        async with AsyncClient(transport=transport, base_url="http://test") as client:
+            before = FEED_TRAFFIC.value("aws", "EC2")
+            response = await client.get("/feeds/EC2?source=aws")
+            assert response.status_code == 200
+            assert response.text == "52.94.76.0/22\n"
+            # Counted under its own source, not the primary feed's series
+            assert FEED_TRAFFIC.value("aws", "EC2") == (before[0] + 1, before[1] + 14)
+            assert FEED_TRAFFIC.value("azure", "EC2") == (0, 0)
+            assert (await client.get("/feeds/EC2/part/1?source=aws")).status_code == 200
+            assert FEED_TRAFFIC.value("aws", "EC2")[0] == before[0] + 2
+            metrics = (await client.get("/metrics")).text
+            assert 'feeds_tag_requests_total{source="aws",tag="EC2"}' in metrics
+            assert (await client.get("/feeds/EC2")).status_code == 404
+            assert (await client.get("/feeds/AzureCloud?source=azure")).status_code == 200
+            assert (await client.get("/feeds/AzureCloud?source=aws")).status_code == 404
+            response = await client.get("/feeds/EC2?source=gcp")
+            assert response.status_code == 404
+            assert response.json() == {"detail": "Unknown source"}
+
+            assert (await client.get("/tags?source=aws")).json() == ["EC2", "EC2.us-west-2"]
+            response = await client.get("/lookup?ip=52.94.76.1&source=aws")
+            assert response.json()["tags"] == ["EC2", "EC2.us-west-2"]
+            response = await client.get("/select?region=us-west-2&source=aws")
+            assert response.text == "52.94.76.0/22\n"
+
+            health = (await client.get("/health")).json()
+            assert health["sources"]["aws"]["change_number"] == 5
+            assert health["sources"]["aws"]["upstream"]["full"] == 1
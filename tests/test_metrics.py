@@ -0,0 +1,52 @@
+from app.metrics import Counter, Histogram, TrafficCounter, render
+
+
+def test_counter_renders_labels_escaped():
+    counter = Counter("requests_total", "Requests", ("tag",))
+    counter.inc("b")
+    counter.inc("a", amount=3)
+    counter.inc('q"\\')
+    assert counter.value("a") == 3
+    assert render([counter]).decode().splitlines() == [
+        "# HELP requests_total Requests",
+        "# TYPE requests_total counter",
+        'requests_total{tag="a"} 3',
+        'requests_total{tag="b"} 1',
+        'requests_total{tag="q\\"\\\\"} 1',
+    ]
+
+
+def test_histogram_buckets_are_cumulative():
+    histogram = Histogram("latency_seconds", "Latency", buckets=(0.1, 1.0))
+    for value in (0.05, 0.1, 0.5, 2.0):
+        histogram.observe(value)
+    assert histogram.count() == 4
+    assert render([histogram]).decode().splitlines()[2:] == [
+        'latency_seconds_bucket{le="0.1"} 2',
+        'latency_seconds_bucket{le="1.0"} 3',
+        'latency_seconds_bucket{le="+Inf"} 4',
+        "latency_seconds_sum 2.65",
+        "latency_seconds_count 4",
+    ]
+
+
+def test_traffic_counter_renders_two_families():
+    traffic = TrafficCounter(("req_total", "Requests"), ("bytes_total", "Bytes"), ("tag",))
+    traffic.add(("a",), 10)
+    traffic.add(("a",), 0)
+    assert traffic.value("a") == (2, 10)
+    assert [line for line in render([traffic]).decode().splitlines() if line[0] != "#"] == [
+        'req_total{tag="a"} 2',
+        'bytes_total{tag="a"} 10',
+    ]
+
+
+def test_traffic_counter_records_latency_in_the_same_call():
+    traffic = TrafficCounter(("req_total", "Requests"), ("bytes_total", "Bytes"), ("tag",))
+    histogram = Histogram("latency_seconds", "Latency", ("route",), buckets=(0.1, 1.0))
+    series = histogram.labels("feed")
+    traffic.record(("a",), 10, series, 0.5)
+    traffic.record(("a",), 5, series, 2.0)
+    assert traffic.value("a") == (2, 15)
+    assert histogram.count("feed") == 2
+    assert 'latency_seconds_bucket{route="feed",le="1.0"} 1' in render([histogram]).decode()
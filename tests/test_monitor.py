@@ -0,0 +1,18 @@
+import asyncio
+import time
+
+import pytest
+
+from app.monitor import LoopLagMonitor
+
+
+@pytest.mark.asyncio
+async def test_loop_lag_records_blocking():
+    monitor = LoopLagMonitor(interval=0.01)
+    assert monitor.stats() == {"last_ms": None, "max_ms": None}
+    task = asyncio.create_task(monitor.run())
+    await asyncio.sleep(0.03)
+    time.sleep(0.1)  # block the loop
+    await asyncio.sleep(0.03)
+    task.cancel()
+    assert monitor.stats()["max_ms"] >= 50
@@ -0,0 +1,69 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from app.negotiation import (
+    RangeNotSatisfiable,
+    byte_range,
+    choose_encoding,
+    etag_matches,
+    http_date,
+    is_not_modified,
+)
+
+ETAG = '"100-abcdef"'
+LOADED = datetime(2026, 3, 1, 12, 0, 0, 500000, tzinfo=timezone.utc)
+
+
+def test_etag_matches():
+    assert etag_matches(ETAG, ETAG)
+    assert etag_matches(f'"other", W/{ETAG}', ETAG)
+    assert etag_matches("*", ETAG)
+    assert not etag_matches('"other"', ETAG)
+
+
+def test_if_modified_since():
+    assert is_not_modified({"if-modified-since": http_date(LOADED)}, ETAG, LOADED)
+    earlier = http_date(LOADED - timedelta(seconds=1))
+    assert not is_not_modified({"if-modified-since": earlier}, ETAG, LOADED)
+    assert not is_not_modified({"if-modified-since": "garbage"}, ETAG, LOADED)
+
+
+def test_if_none_match_takes_precedence():
+    headers = {"if-none-match": '"stale"', "if-modified-since": http_date(LOADED)}
+    assert not is_not_modified(headers, ETAG, LOADED)
+
+
+def test_choose_encoding():
+    available = {"gzip": b"", "br": b""}
+    assert choose_encoding("gzip, deflate, br", available) == "br"
+    assert choose_encoding("gzip;q=1.0, br;q=0.5", available) == "gzip"
+    assert choose_encoding("br;q=0, gzip", available) == "gzip"
+    assert choose_encoding("*", {"gzip": b""}) == "gzip"
+    assert choose_encoding("identity", available) is None
+    assert choose_encoding(None, available) is None
+    assert choose_encoding("gzip", {}) is None
+
+
+def test_byte_range():
+    assert byte_range({}, ETAG, 100) is None
+    assert byte_range({"range": "bytes=0-9"}, ETAG, 100) == (0, 10)
+    assert byte_range({"range": "bytes=90-"}, ETAG, 100) == (90, 100)
+    assert byte_range({"range": "bytes=95-200"}, ETAG, 100) == (95, 100)
+    assert byte_range({"range": "bytes=-10"}, ETAG, 100) == (90, 100)
+    assert byte_range({"range": "bytes=-500"}, ETAG, 100) == (0, 100)
+    # Unsupported or invalid forms fall back to the full body
+    assert byte_range({"range": "bytes=0-1,5-6"}, ETAG, 100) is None
+    assert byte_range({"range": "items=0-1"}, ETAG, 100) is None
+    assert byte_range({"range": "bytes=5-1"}, ETAG, 100) is None
+    assert byte_range({"range": "bytes=a-b"}, ETAG, 100) is None
+    with pytest.raises(RangeNotSatisfiable):
+        byte_range({"range": "bytes=100-"}, ETAG, 100)
+    with pytest.raises(RangeNotSatisfiable):
+        byte_range({"range": "bytes=-0"}, ETAG, 100)
+
+
+def test_if_range_requires_current_strong_etag():
+    assert byte_range({"range": "bytes=0-9", "if-range": ETAG}, ETAG, 100) == (0, 10)
+    assert byte_range({"range": "bytes=0-9", "if-range": '"old"'}, ETAG, 100) is None
+    assert byte_range({"range": "bytes=0-9", "if-range": http_date(LOADED)}, ETAG, 100) is None
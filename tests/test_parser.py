@@ -0,0 +1,55 @@
+import json
+
+import pytest
+
+from app.parser import ServiceTagsParser
+
+DOCUMENT = {
+    "changeNumber": 123456,
+    "cloud": "Public",
+    "values": [
+        {
+            "name": "AzureCloud",
+            "id": "AzureCloud",
+            "properties": {"changeNumber": 9, "addressPrefixes": ["10.0.0.0/8", "2001:db8::/32"]},
+        },
+        {"name": "Empty", "id": "Empty", "properties": {"addressPrefixes": []}},
+    ],
+}
+
+
+def _parse(body: bytes, chunk_size: int) -> dict:
+    parser = ServiceTagsParser()
+    for i in range(0, len(body), chunk_size):
+        parser.feed(body[i:i + chunk_size])
+    return parser.close()
+
+
+@pytest.mark.parametrize("chunk_size", [1, 7, 64, 1 << 20])
+def test_parse_in_chunks(chunk_size):
+    body = json.dumps(DOCUMENT, indent=2).encode()
+    data = _parse(body, chunk_size)
+    assert data["changeNumber"] == 123456
+    assert data["cloud"] == "Public"
+    assert data["values"] == [
+        {"name": "AzureCloud", "properties": {"addressPrefixes": ["10.0.0.0/8", "2001:db8::/32"]}},
+        {"name": "Empty", "properties": {"addressPrefixes": []}},
+    ]
+
+
+def test_values_before_header_and_multibyte_split():
+    body = '{"values": [{"name": "Ünïcode", "properties": {}}], "changeNumber": 7}'.encode()
+    data = _parse(body, 1)
+    assert data["changeNumber"] == 7
+    assert data["values"][0]["name"] == "Ünïcode"
+
+
+@pytest.mark.parametrize("body", [
+    b'{"changeNumber": 1, "values": [{"name": "A"}',
+    b'{"changeNumber": 1, "values": {}}',
+    b'{"changeNumber": 1, "values": [1]}',
+    b'[]',
+])
+def test_malformed_documents(body):
+    with pytest.raises(ValueError):
+        _parse(body, 5)
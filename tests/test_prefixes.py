@@ -0,0 +1,33 @@
+from app.prefixes import PackedPrefixes
+from app.ranges import parse_prefix
+
+
+def test_round_trip_keeps_family_order():
+    packed = PackedPrefixes.from_strings(
+        ["10.0.0.0/8", "2001:db8::/32", "192.168.1.0/24", "2001:db8:1::/48"]
+    )
+    assert len(packed) == 4
+    assert packed.ipv4_count == 2
+    assert packed.texts() == ["10.0.0.0/8", "192.168.1.0/24", "2001:db8::/32", "2001:db8:1::/48"]
+    assert packed.texts(include_ipv6=False) == ["10.0.0.0/8", "192.168.1.0/24"]
+
+
+def test_normalizes_and_drops_invalid():
+    packed = PackedPrefixes.from_strings(
+        ["10.1.2.3/8", "2001:0DB8:0000::/32", "192.168.1.1", "not-a-prefix", "10.0.0.0/33"]
+    )
+    assert packed.texts() == ["10.0.0.0/8", "192.168.1.1/32", "2001:db8::/32"]
+
+
+def test_networks_match_parse_prefix():
+    prefixes = ["10.0.0.0/8", "0.0.0.0/0", "2001:db8::/32", "::/0", "ffff::1/128"]
+    packed = PackedPrefixes.from_strings(prefixes)
+    assert sorted(packed.networks()) == sorted(parse_prefix(p) for p in prefixes)
+    assert all(net[0] == 4 for net in packed.networks(include_ipv6=False))
+
+
+def test_equality_and_size():
+    a = PackedPrefixes.from_strings(["10.0.0.0/8", "2001:db8::/32"])
+    assert a == PackedPrefixes.from_strings(["10.0.0.0/8", "2001:db8::/32"])
+    assert a != PackedPrefixes.from_strings(["10.0.0.0/8"])
+    assert a.nbytes == 4 + 1 + 8 + 8 + 1
@@ -0,0 +1,58 @@
+from app.ranges import IntervalIndex, aggregate, parse_address, parse_prefix, range_to_prefixes
+
+
+def test_parse_prefix():
+    assert parse_prefix("10.0.0.0/8") == (4, 0x0A000000, 0x0AFFFFFF)
+    assert parse_prefix("10.1.2.3/8") == (4, 0x0A000000, 0x0AFFFFFF)
+    assert parse_prefix("192.168.1.1") == (4, 0xC0A80101, 0xC0A80101)
+    assert parse_prefix("2001:db8::/32") == (6, 0x20010DB8 << 96, (0x20010DB8 << 96) | ((1 << 96) - 1))
+    assert parse_prefix("10.0.0.0/33") is None
+    assert parse_prefix("not-a-prefix") is None
+
+
+def test_interval_index_nested_and_overlapping():
+    index = IntervalIndex([
+        ("AzureCloud", parse_prefix("10.0.0.0/8")),
+        ("Region", parse_prefix("10.1.0.0/16")),
+        ("Storage", parse_prefix("10.1.2.0/24")),
+        ("Other", parse_prefix("10.1.0.0/16")),
+        ("V6", parse_prefix("2001:db8::/32")),
+    ])
+    assert index.lookup(*parse_address("10.1.2.3")) == ("AzureCloud", "Other", "Region", "Storage")
+    assert index.lookup(*parse_address("10.1.3.0")) == ("AzureCloud", "Other", "Region")
+    assert index.lookup(*parse_address("10.255.255.255")) == ("AzureCloud",)
+    assert index.lookup(*parse_address("11.0.0.0")) == ()
+    assert index.lookup(*parse_address("9.255.255.255")) == ()
+    assert index.lookup(*parse_address("2001:db8::1")) == ("V6",)
+    assert index.lookup(*parse_address("::1")) == ()
+
+
+def test_interval_index_from_arrays():
+    index = IntervalIndex([
+        ("A", parse_prefix("10.0.0.0/8")),
+        ("B", parse_prefix("10.1.0.0/16")),
+        ("C", parse_prefix("2001:db8::/32")),
+        ("D", parse_prefix("2001:db8:0:1::/64")),
+        ("E", parse_prefix("::/0")),
+    ])
+    copy = IntervalIndex.from_arrays(
+        index.sets,
+        {name: memoryview(values) for name, values in index.arrays().items()},
+    )
+    for address in ("10.1.0.1", "10.2.0.0", "2001:db8:0:1::5", "2001:db8:0:2::",
+                    "ffff:ffff:ffff:ffff:ffff:ffff:ffff:ffff", "255.255.255.255"):
+        assert copy.lookup(*parse_address(address)) == index.lookup(*parse_address(address))
+    assert copy.lookup(*parse_address("2001:db8:0:1::5")) == ("C", "D", "E")
+
+
+def test_aggregate_minimal_cidr_set():
+    networks = [parse_prefix(p) for p in (
+        "10.0.0.0/25", "10.0.0.128/25", "10.0.1.0/24", "10.0.0.5/32",
+        "10.0.3.0/24", "2001:db8::/33", "2001:db8:8000::/33",
+    )]
+    assert aggregate(networks) == ["10.0.0.0/23", "10.0.3.0/24", "2001:db8::/32"]
+
+
+def test_range_to_prefixes_unaligned():
+    assert range_to_prefixes(4, 1, 6) == ["0.0.0.1/32", "0.0.0.2/31", "0.0.0.4/31", "0.0.0.6/32"]
+    assert range_to_prefixes(4, 0, 0xFFFFFFFF) == ["0.0.0.0/0"]
@@ -0,0 +1,48 @@
+import pytest
+
+from app.ratelimit import Rate, RateLimiter
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def test_parse_rate():
+    assert Rate.parse("60/minute") == Rate(60, 60)
+    assert Rate.parse(" 6 / hour ") == Rate(6, 3600)
+    assert str(Rate.parse("30/minute")) == "30 per 1 minute"
+    for text in ("0/minute", "60/fortnight", "sixty/minute"):
+        with pytest.raises(ValueError):
+            Rate.parse(text)
+
+
+def test_burst_then_steady_refill():
+    clock = Clock()
+    limiter = RateLimiter(clock=clock)
+    rate = Rate(60, 60)
+    assert all(limiter.hit("a", rate) == 0.0 for _ in range(60))
+    assert limiter.hit("a", rate) == pytest.approx(1.0)
+    assert limiter.hit("b", rate) == 0.0  # other clients are unaffected
+    clock.now += 1
+    assert limiter.hit("a", rate) == 0.0
+    assert limiter.hit("a", rate) > 0
+    clock.now += 3600
+    assert all(limiter.hit("a", rate) == 0.0 for _ in range(60))
+
+
+def test_least_recently_seen_keys_are_evicted_at_the_cap():
+    clock = Clock()
+    limiter = RateLimiter(max_keys=3, clock=clock)
+    rate = Rate(1, 60)
+    for key in ("a", "b", "c"):
+        limiter.hit(key, rate)
+    assert limiter.hit("a", rate) > 0  # refreshes "a"
+    limiter.hit("d", rate)
+    assert len(limiter) == 3
+    assert limiter.stats() == {"tracked": 3, "max": 3, "evicted": 1}
+    assert limiter.hit("a", rate) > 0
+    assert limiter.hit("b", rate) == 0.0  # evicted, so it starts over
@@ -0,0 +1,100 @@
+import asyncio
+import random
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from app.scheduler import RefreshScheduler, SingleFlight
+
+
+def _scheduler(**kwargs) -> RefreshScheduler:
+    options = {"check_interval": 1800, "revalidate_interval": 86400, "retry_base": 30}
+    return RefreshScheduler(**{**options, **kwargs}, rng=random.Random(0))
+
+
+@pytest.mark.asyncio
+async def test_backoff_grows_with_full_jitter_and_resets():
+    scheduler = _scheduler()
+    assert scheduler.next_delay() == 1800
+
+    async def failing(force):
+        raise RuntimeError("upstream down")
+
+    ceilings = []
+    for _ in range(8):
+        assert not await scheduler.run_once(failing)
+        ceilings.append(min(30 * 2 ** (scheduler.consecutive_failures - 1), 1800))
+        delays = [scheduler.next_delay() for _ in range(50)]
+        assert all(0 <= d <= ceilings[-1] for d in delays)
+    assert ceilings == [30, 60, 120, 240, 480, 960, 1800, 1800]
+    assert scheduler.last_error == "RuntimeError: upstream down"
+
+    async def ok(force):
+        pass
+
+    assert await scheduler.run_once(ok)
+    assert scheduler.consecutive_failures == 0
+    assert scheduler.last_error is None
+    assert scheduler.next_delay() == 1800
+
+
+@pytest.mark.asyncio
+async def test_revalidation_forced_once_per_interval():
+    scheduler = _scheduler(revalidate_interval=0)
+    calls = []
+
+    async def refresh(force):
+        calls.append(force)
+
+    await scheduler.run_once(refresh)
+    assert calls == [True]
+
+    scheduler = _scheduler()
+    await scheduler.run_once(refresh)
+    assert calls == [True, False]
+
+
+def test_stats_report_staleness():
+    scheduler = _scheduler(revalidate_interval=3600)
+    assert scheduler.stats(None)["stale"] is True
+    fresh = scheduler.stats(datetime.now(timezone.utc) - timedelta(minutes=5))
+    assert 290 < fresh["staleness_seconds"] < 310
+    assert fresh["stale"] is False
+    old = scheduler.stats(datetime.now(timezone.utc) - timedelta(hours=2))
+    assert old["stale"] is True
+    assert old["next_refresh"] is None
+
+
+@pytest.mark.asyncio
+async def test_single_flight_coalesces_callers():
+    flight = SingleFlight()
+    calls = 0
+    release = asyncio.Event()
+
+    async def work():
+        nonlocal calls
+        calls += 1
+        await release.wait()
+        return calls
+
+    callers = [asyncio.create_task(flight.run(work)) for _ in range(10)]
+    await asyncio.sleep(0)
+    assert flight.in_flight
+    callers[0].cancel()  # one caller leaving does not cancel the shared run
+    release.set()
+    results = await asyncio.gather(*callers[1:])
+    assert results == [1] * 9
+    assert not flight.in_flight
+    assert await flight.run(work) == 2
+
+
+@pytest.mark.asyncio
+async def test_single_flight_shares_failures():
+    flight = SingleFlight()
+
+    async def fail():
+        await asyncio.sleep(0)
+        raise RuntimeError("boom")
+
+    results = await asyncio.gather(flight.run(fail), flight.run(fail), return_exceptions=True)
+    assert [str(r) for r in results] == ["boom", "boom"]
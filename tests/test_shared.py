@@ -0,0 +1,42 @@
+from datetime import datetime, timezone
+
+import pytest
+
+from app.shared import LeaderLock, SnapshotWatcher, fcntl
+from app.snapshot import save_snapshot
+
+pytestmark = pytest.mark.skipif(fcntl is None, reason="requires fcntl")
+
+NOW = datetime(2026, 3, 1, tzinfo=timezone.utc)
+
+
+def _data(change_number: int) -> dict:
+    return {"changeNumber": change_number, "values": [
+        {"name": "AzureCloud", "properties": {"addressPrefixes": ["10.0.0.0/8"]}},
+    ]}
+
+
+def test_only_one_leader(tmp_path):
+    first = LeaderLock(tmp_path / "leader.lock")
+    second = LeaderLock(tmp_path / "leader.lock")
+    assert first.try_acquire()
+    assert not second.try_acquire()
+    first.release()
+    assert second.try_acquire()
+    second.release()
+
+
+def test_watcher_picks_up_new_generations(tmp_path):
+    path = tmp_path / "snapshot.json"
+    watcher = SnapshotWatcher(path)
+    assert watcher.poll() is None
+
+    save_snapshot(path, _data(1), NOW)
+    first = watcher.poll()
+    assert first.data["changeNumber"] == 1
+    assert watcher.poll() is None
+
+    save_snapshot(path, _data(2), NOW)
+    second = watcher.poll()
+    assert second.data["changeNumber"] == 2
+    assert second.generation > first.generation
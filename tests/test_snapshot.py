@@ -0,0 +1,89 @@
+from datetime import datetime, timezone
+
+from app.cache import FeedCache
+from app.snapshot import keep_rendered, load_snapshot, rendered_path, save_snapshot
+
+REFRESHED_AT = datetime(2026, 3, 1, 12, 0, tzinfo=timezone.utc)
+DATA = {
+    "changeNumber": 42,
+    "cloud": "Public",
+    "values": [
+        {
+            "name": "AzureCloud",
+            "id": "AzureCloud",
+            "properties": {
+                "changeNumber": 3,
+                "platform": "Azure",
+                "addressPrefixes": ["10.0.0.0/8", "2001:db8::/32"],
+            },
+        }
+    ],
+}
+
+
+def test_snapshot_round_trip(tmp_path):
+    path = tmp_path / "data" / "snapshot.json"
+    source = {"url": "https://download.microsoft.com/x.json", "etag": '"abc"', "last_modified": None}
+    save_snapshot(path, DATA, REFRESHED_AT, source)
+    assert [p.name for p in path.parent.iterdir()] == ["snapshot.json"]
+
+    restored = load_snapshot(path)
+    assert restored.refreshed_at == REFRESHED_AT
+    assert restored.source == source
+    assert "id" not in restored.data["values"][0]
+    cache = FeedCache()
+    cache.load(restored.data, refreshed_at=restored.refreshed_at)
+    assert cache.change_number == 42
+    assert cache.last_refresh == REFRESHED_AT
+    assert cache.get_tag("AzureCloud", include_ipv6=True) == ["10.0.0.0/8", "2001:db8::/32"]
+
+
+def test_missing_or_corrupt_snapshot(tmp_path):
+    assert load_snapshot(tmp_path / "missing.json") is None
+    corrupt = tmp_path / "snapshot.json"
+    corrupt.write_text('{"values": [')
+    assert load_snapshot(corrupt) is None
+    corrupt.write_text('{"values": []}')
+    assert load_snapshot(corrupt) is None
+
+
+def test_rendered_feeds_are_mapped(tmp_path):
+    path = tmp_path / "snapshot.json"
+    built = FeedCache(shard_size=1)
+    built.load(DATA)
+    save_snapshot(path, DATA, REFRESHED_AT, {"etag": '"abc"'}, built.build(DATA))
+
+    restored = load_snapshot(path, shard_size=1)
+    assert restored.data is None
+    assert restored.refreshed_at == REFRESHED_AT
+    assert restored.source == {"etag": '"abc"'}
+    cache = FeedCache(shard_size=1)
+    cache.install(restored.build(cache))
+    feed, expected = cache.get_feed("AzureCloud", True), built.get_feed("AzureCloud", True)
+    assert isinstance(feed.body, memoryview)
+    assert feed.body == expected.body
+    assert feed.etag == expected.etag
+    assert bytes(feed.shard(2)) == b"2001:db8::/32\n"
+    assert cache.get_metadata("AzureCloud") == built.get_metadata("AzureCloud")
+    assert cache.lookup("2001:db8::1") == ["AzureCloud"]
+    assert cache.get_tag("AzureCloud", include_ipv6=True) == ["10.0.0.0/8", "2001:db8::/32"]
+    assert cache.tags_detail_json.body == built.tags_detail_json.body
+
+    # Feeds cut into other shards are not used; the JSON is read instead
+    assert load_snapshot(path, shard_size=0).data["changeNumber"] == 42
+    # Saving without a snapshot drops rendered feeds that would be stale
+    save_snapshot(path, {**DATA, "changeNumber": 43}, REFRESHED_AT)
+    assert load_snapshot(path, shard_size=1).data["changeNumber"] == 43
+
+
+def test_restore_from_json_keeps_rendered_feeds(tmp_path):
+    path = tmp_path / "snapshot.json"
+    save_snapshot(path, DATA, REFRESHED_AT, {"etag": '"abc"'})
+    assert not rendered_path(path).exists()
+    restored = load_snapshot(path, shard_size=0)
+    cache = FeedCache()
+    keep_rendered(path, restored, restored.build(cache))
+
+    mapped = load_snapshot(path, shard_size=0)
+    assert mapped.rendered is not None
+    assert (mapped.generation, mapped.source) == (restored.generation, restored.source)
@@ -0,0 +1,205 @@
+import asyncio
+import json
+import os
+import random
+
+import httpx
+import pytest
+
+from app.cache import FeedCache
+from app.fetcher import Validators
+from app.scheduler import RefreshScheduler
+from app.sources import (
+    FileSource,
+    HttpSource,
+    SourceRefresher,
+    build_source,
+    parse_aws_ip_ranges,
+    parse_service_tags,
+)
+
+AWS_IP_RANGES = {
+    "syncToken": "1717000000",
+    "createDate": "2024-05-29-16-13-07",
+    "prefixes": [
+        {"ip_prefix": "3.5.140.0/22", "region": "ap-northeast-2",
+         "service": "AMAZON", "network_border_group": "ap-northeast-2"},
+        {"ip_prefix": "3.5.140.0/22", "region": "ap-northeast-2",
+         "service": "AMAZON", "network_border_group": "ap-northeast-2-wl1"},
+        {"ip_prefix": "52.94.76.0/22", "region": "us-west-2",
+         "service": "EC2", "network_border_group": "us-west-2"},
+    ],
+    "ipv6_prefixes": [
+        {"ipv6_prefix": "2600:1f14::/35", "region": "us-west-2",
+         "service": "EC2", "network_border_group": "us-west-2"},
+    ],
+}
+
+SERVICE_TAGS = {
+    "changeNumber": 7,
+    "cloud": "AzureGovernment",
+    "values": [
+        {"name": "AzureCloud", "properties": {"addressPrefixes": ["20.140.0.0/15"]}},
+    ],
+}
+
+
+def _scheduler() -> RefreshScheduler:
+    return RefreshScheduler(60, 86400, 1, rng=random.Random(0))
+
+
+def _refresher(name, source, tmp_path=None) -> SourceRefresher:
+    path = None if tmp_path is None else tmp_path / f"snapshot-{name}.json"
+    return SourceRefresher(name, source, FeedCache(), _scheduler(), path)
+
+
+def test_parse_aws_ip_ranges():
+    data = parse_aws_ip_ranges(json.dumps(AWS_IP_RANGES).encode())
+    assert data["changeNumber"] == 1717000000
+    tags = {entry["name"]: entry["properties"] for entry in data["values"]}
+    assert set(tags) == {"AMAZON", "AMAZON.ap-northeast-2", "EC2", "EC2.us-west-2"}
+    assert tags["AMAZON"]["addressPrefixes"] == ["3.5.140.0/22"]
+    assert tags["EC2.us-west-2"]["addressPrefixes"] == ["52.94.76.0/22", "2600:1f14::/35"]
+    assert tags["EC2.us-west-2"]["region"] == "us-west-2"
+    assert tags["EC2"]["platform"] == "AWS"
+
+    cache = FeedCache()
+    cache.load(data)
+    assert cache.get_body("EC2") == b"52.94.76.0/22\n"
+    assert cache.select_tags(region="us-west-2") == ["EC2.us-west-2"]
+
+
+@pytest.mark.asyncio
+async def test_file_source_rereads_only_on_change(tmp_path):
+    path = tmp_path / "ServiceTags_AzureGovernment.json"
+    path.write_text(json.dumps(SERVICE_TAGS))
+    source = FileSource(path, parse_service_tags)
+    data, source.validators = await source.fetch()
+    assert data["changeNumber"] == 7
+    assert (await source.fetch())[0] is None
+    assert (await source.fetch(force=True))[0]["changeNumber"] == 7
+
+    path.write_text(json.dumps({**SERVICE_TAGS, "changeNumber": 8}))
+    os.utime(path, ns=(0, 10**18))
+    assert (await source.fetch())[0]["changeNumber"] == 8
+    assert source.stats_dict()["full"] == 3
+
+
+@pytest.mark.asyncio
+async def test_file_source_accepts_a_relative_path(tmp_path, monkeypatch):
+    (tmp_path / "gov.json").write_text(json.dumps(SERVICE_TAGS))
+    monkeypatch.chdir(tmp_path)
+    source = build_source({"type": "file", "path": "gov.json"})
+    data, validators = await source.fetch()
+    assert data["changeNumber"] == 7
+    assert validators.url == (tmp_path / "gov.json").as_uri()
+
+
+@pytest.mark.asyncio
+async def test_http_source_revalidates_with_etag():
+    body = json.dumps(AWS_IP_RANGES).encode()
+    seen = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        seen.append(request.headers.get("if-none-match"))
+        if request.headers.get("if-none-match") == '"v1"':
+            return httpx.Response(304)
+        return httpx.Response(200, content=body, headers={"ETag": '"v1"'})
+
+    source = HttpSource("https://ip-ranges.example/ip-ranges.json", parse_aws_ip_ranges)
+    source._client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    data, source.validators = await source.fetch()
+    assert data["changeNumber"] == 1717000000
+    assert (await source.fetch())[0] is None
+    assert seen == [None, '"v1"']
+    await source.aclose()
+
+
+def test_build_source_rejects_unknown_specs(tmp_path):
+    assert isinstance(build_source({"type": "file", "path": str(tmp_path), "format": "aws"}),
+                      FileSource)
+    for spec in ({"type": "gcp"}, {"type": "file", "path": "x", "format": "csv"},
+                 {"type": "azure", "cloud": "Germany"}):
+        with pytest.raises(ValueError):
+            build_source(spec)
+    with pytest.raises(ValueError):
+        _refresher("azure", FileSource(tmp_path, parse_service_tags))
+
+
+@pytest.mark.asyncio
+async def test_refresher_persists_and_restores(tmp_path):
+    path = tmp_path / "ip-ranges.json"
+    path.write_text(json.dumps(AWS_IP_RANGES))
+    refresher = _refresher("aws", FileSource(path, parse_aws_ip_ranges), tmp_path)
+    await refresher.refresh()
+    assert refresher.cache.change_number == 1717000000
+    assert (tmp_path / "snapshot-aws.json").exists()
+
+    restarted = _refresher("aws", FileSource(path, parse_aws_ip_ranges), tmp_path)
+    assert await restarted.restore()
+    body = restarted.cache.get_body("EC2")
+    # Mapped from the rendered feeds file rather than copied
+    assert isinstance(body, memoryview)
+    assert body == b"52.94.76.0/22\n"
+    # The restored validators make the next check a no-op
+    assert isinstance(restarted.source.validators, Validators)
+    assert (await restarted.source.fetch())[0] is None
+
+
+@pytest.mark.asyncio
+async def test_restore_ignores_unknown_validator_fields(tmp_path):
+    path = tmp_path / "ip-ranges.json"
+    path.write_text(json.dumps(AWS_IP_RANGES))
+    await _refresher("aws", FileSource(path, parse_aws_ip_ranges), tmp_path).refresh()
+    # As written by a newer version that persists another validator
+    snapshot = tmp_path / "snapshot-aws.json"
+    payload = json.loads(snapshot.read_text())
+    payload["source"]["content_digest"] = "abc"
+    snapshot.write_text(json.dumps(payload))
+    (tmp_path / "snapshot-aws.bin").unlink()
+
+    restarted = _refresher("aws", FileSource(path, parse_aws_ip_ranges), tmp_path)
+    assert await restarted.restore()
+    assert restarted.cache.get_body("EC2") == b"52.94.76.0/22\n"
+    assert (await restarted.source.fetch())[0] is None
+
+
+@pytest.mark.asyncio
+async def test_refresher_refetches_a_document_that_failed_to_build(tmp_path):
+    path = tmp_path / "gov.json"
+    path.write_text(json.dumps({"cloud": "AzureGovernment", "values": []}))
+    refresher = _refresher("gov", FileSource(path, parse_service_tags))
+    with pytest.raises(KeyError):
+        await refresher.refresh()
+    # Not recorded as seen, so the next check reads the file again instead of skipping it
+    with pytest.raises(KeyError):
+        await refresher.refresh()
+    assert refresher.source.stats_dict()["full"] == 2
+    assert refresher.cache.change_number is None
+
+
+@pytest.mark.asyncio
+async def test_slow_source_does_not_delay_others(tmp_path):
+    path = tmp_path / "gov.json"
+    path.write_text(json.dumps(SERVICE_TAGS))
+    stalled = asyncio.Event()
+
+    class Hanging(FileSource):
+        async def fetch(self, force=False):
+            stalled.set()
+            await asyncio.Event().wait()
+
+    fast = _refresher("gov", FileSource(path, parse_service_tags))
+    slow = _refresher("slow", Hanging(path, parse_service_tags))
+    tasks = [asyncio.create_task(r.run()) for r in (slow, fast)]
+    try:
+        for _ in range(100):
+            if fast.cache.change_number is not None:
+                break
+            await asyncio.sleep(0.01)
+        assert stalled.is_set()
+        assert fast.cache.change_number == 7
+        assert slow.cache.change_number is None
+    finally:
+        for task in tasks:
+            task.cancel()
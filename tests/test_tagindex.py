@@ -0,0 +1,45 @@
+from app.tagindex import AttributeIndex, TagIndex
+
+NAMES = ["Storage.EastUS", "AzureCloud", "AzureCloud.EastUS", "Sql", "azurecloud.westus"]
+
+
+def test_names_sorted():
+    index = TagIndex(NAMES)
+    assert index.names == tuple(sorted(NAMES))
+    assert len(index) == 5
+
+
+def test_prefix_search_is_case_insensitive():
+    index = TagIndex(NAMES)
+    assert index.prefix("AzureCloud.") == ["AzureCloud.EastUS", "azurecloud.westus"]
+    assert index.prefix("s") == ["Sql", "Storage.EastUS"]
+    assert index.prefix("") == list(index.names)
+    assert index.prefix("Zzz") == []
+
+
+def test_substring_search_does_not_span_names():
+    index = TagIndex(NAMES)
+    assert index.contains("east") == ["AzureCloud.EastUS", "Storage.EastUS"]
+    assert index.contains("US") == ["AzureCloud.EastUS", "Storage.EastUS", "azurecloud.westus"]
+    assert index.contains("d.e") == ["AzureCloud.EastUS"]
+    # "Sql" followed by "Storage" must not match across the boundary
+    assert index.contains("sqlst") == []
+    assert TagIndex([]).contains("a") == []
+
+
+def test_attribute_index_intersects_postings():
+    index = AttributeIndex([
+        ("Storage.WestEurope", "region", "westeurope"),
+        ("Storage.WestEurope", "system_service", "AzureStorage"),
+        ("Storage.EastUS", "region", "eastus"),
+        ("Storage.EastUS", "system_service", "AzureStorage"),
+        ("AzureCloud.westeurope", "region", "westeurope"),
+    ])
+    assert index.select({"region": "WestEurope"}) == ["AzureCloud.westeurope", "Storage.WestEurope"]
+    assert index.select({"system_service": "azurestorage"}) == ["Storage.EastUS", "Storage.WestEurope"]
+    assert index.select({"region": "westeurope", "system_service": "AzureStorage"}) == [
+        "Storage.WestEurope"
+    ]
+    assert index.select({"region": "nowhere"}) == []
+    assert index.select({}) == []
+    assert index.values("region") == ["eastus", "westeurope"]
@@ -0,0 +1,48 @@
+import asyncio
+
+import pytest
+
+from app.watch import ChangeWatcher
+
+
+@pytest.mark.asyncio
+async def test_waiters_wake_on_newer_change_number():
+    watcher = ChangeWatcher()
+    watcher.notify(1)
+    waiters = [asyncio.create_task(watcher.wait(30)) for _ in range(2000)]
+    await asyncio.sleep(0)
+    assert watcher.waiting == 2000
+    # One shared deadline bucket, not a timer per waiter
+    assert len(watcher._deadlines) <= 2
+
+    watcher.notify(1)  # not newer: nobody wakes
+    await asyncio.sleep(0)
+    assert not any(w.done() for w in waiters)
+
+    watcher.notify(2)
+    assert all(await asyncio.gather(*waiters))
+    assert watcher.waiting == 0
+    assert watcher.change_number == 2
+
+
+@pytest.mark.asyncio
+async def test_wait_times_out():
+    watcher = ChangeWatcher()
+    loop = asyncio.get_running_loop()
+    started = loop.time()
+    assert await watcher.wait(0.01) is False
+    # Deadlines round up to the next whole second of loop time
+    assert loop.time() - started <= 1.1
+    assert watcher._deadlines == {}
+
+
+@pytest.mark.asyncio
+async def test_cancelled_waiter_leaves_shared_futures_intact():
+    watcher = ChangeWatcher()
+    cancelled = asyncio.create_task(watcher.wait(30))
+    survivor = asyncio.create_task(watcher.wait(30))
+    await asyncio.sleep(0)
+    cancelled.cancel()
+    await asyncio.sleep(0)
+    watcher.notify(5)
+    assert await survivor is True